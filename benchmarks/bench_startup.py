@@ -0,0 +1,79 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from benchmarks.fake_api import FakeApiServer, make_notion_pages  # noqa: E402
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+
+
+def _command(image: str, environ: Dict[str, str], tmp_dir: str) -> List[str]:
+    if not image:
+        return [sys.executable, os.path.join(ROOT, "script.py")]
+    # The container shares the host network to reach the stand-in API and writes its outputs to the mounted directory
+    command = ["docker", "run", "--rm", "--network", "host", "-v", f"{tmp_dir}:{tmp_dir}", "-w", tmp_dir]
+    for key in environ:
+        command += ["-e", key]
+    return command + [image]
+
+
+def run_startup(image: str = "", rows: int = 10) -> Dict:
+    """Starts one sync and measures the time from process or container start to the first API call."""
+    server = FakeApiServer(make_notion_pages(rows)).start()
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            environ = {
+                "INPUT_NOTIONTOKEN": "fake_notion_token",
+                "INPUT_GITHUBTOKEN": "fake_github_token",
+                "INPUT_NOTIONDATABASE": "fake_database_id",
+                "INPUT_WRITEDELAY": "0",
+                "GITHUB_REPOSITORY": f"{server.owner}/{server.repo}",
+                "GITHUB_OUTPUT": os.path.join(tmp_dir, "github_output.txt"),
+                "GITHUB_STEP_SUMMARY": os.path.join(tmp_dir, "github_step_summary.md"),
+                "GITHUB_API_URL": server.github_url,
+                "GITHUB_GRAPHQL_URL": server.graphql_url,
+                "NOTION_API_URL": server.notion_url
+            }
+            start = time.time()
+            subprocess.run(_command(image, environ, tmp_dir), env={**os.environ, **environ}, cwd=tmp_dir,
+                           stdout=subprocess.DEVNULL, check=True)
+            wall_time = time.time() - start
+    finally:
+        server.stop()
+
+    if server.first_request_at is None:
+        raise RuntimeError("The sync made no API call.")
+    return {"startup_s": server.first_request_at - start, "wall_time_s": wall_time, "issues": len(server.issues)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measures the time from start to the first API call of a sync.")
+    parser.add_argument("--image", default="", help="Docker image to start, the local script is run without it")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--rows", type=int, default=10)
+    parser.add_argument("--json", help="Write the results to this file")
+    args = parser.parse_args()
+
+    results = [run_startup(args.image, args.rows) for _ in range(args.runs)]
+    summary = {
+        "target": args.image or "script.py",
+        "runs": args.runs,
+        "startup_median_s": round(statistics.median(r["startup_s"] for r in results), 3),
+        "startup_max_s": round(max(r["startup_s"] for r in results), 3),
+        "wall_time_median_s": round(statistics.median(r["wall_time_s"] for r in results), 3)
+    }
+    print("| Target | Runs | Start to first call, median (s) | max (s) | Wall time, median (s) |")
+    print("|--------|------|---------------------------------|---------|-----------------------|")
+    print(f"| {summary['target']} | {summary['runs']} | {summary['startup_median_s']} | {summary['startup_max_s']} | {summary['wall_time_median_s']} |")
+
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump(summary, json_file, indent=2)
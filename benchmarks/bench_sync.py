@@ -0,0 +1,144 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Dict, List
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from script import sync_notion_to_github  # noqa: E402
+from utils.HttpSession import configure_session  # noqa: E402
+from utils.RateLimiter import configure_rate_limiter  # noqa: E402
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for_server(url: str, timeout: float = 10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f"{url}/_stats", timeout=1)
+            return
+        except requests.ConnectionError:
+            time.sleep(0.05)
+    raise RuntimeError(f"Stand-in API at {url} did not start.")
+
+
+def run_benchmark(rows: int, latency: float = 0.0, page_size: int = 100, throttle_every: int = 0,
+                  workers: int = 4, trace_memory: bool = True) -> Dict:
+    """Runs sync_notion_to_github against a stand-in API with `rows` Notion entries and returns its measurements."""
+    port = _free_port()
+    url = f"http://127.0.0.1:{port}"
+    server = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.fake_api", "--port", str(port), "--rows", str(rows),
+         "--latency", str(latency), "--page-size", str(page_size), "--throttle-every", str(throttle_every)],
+        cwd=os.path.join(os.path.dirname(__file__), ".."),
+        stdout=subprocess.DEVNULL
+    )
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        environ = {
+            "INPUT_NOTIONTOKEN": "fake_notion_token",
+            "INPUT_GITHUBTOKEN": "fake_github_token",
+            "INPUT_NOTIONDATABASE": "fake_database_id",
+            "INPUT_WORKERS": str(workers),
+            "INPUT_WRITEDELAY": "0",
+            "GITHUB_REPOSITORY": "fake-owner/fake-repo",
+            "GITHUB_OUTPUT": os.path.join(tmp_dir, "github_output.txt"),
+            "GITHUB_STEP_SUMMARY": os.path.join(tmp_dir, "github_step_summary.md"),
+            "GITHUB_API_URL": f"{url}/github",
+            "GITHUB_GRAPHQL_URL": f"{url}/github/graphql",
+            "NOTION_API_URL": f"{url}/notion/v1"
+        }
+        previous = {key: os.environ.get(key) for key in environ}
+        os.environ.update(environ)
+
+        try:
+            _wait_for_server(url)
+            configure_session()
+            # Retries of injected 429s are part of the measurement, pacing is not
+            configure_rate_limiter(rates={})
+
+            if trace_memory:
+                tracemalloc.start()
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                sync_notion_to_github()
+            wall_time = time.perf_counter() - start
+            peak_memory = tracemalloc.get_traced_memory()[1] if trace_memory else None
+            if trace_memory:
+                tracemalloc.stop()
+
+            stats = requests.get(f"{url}/_stats").json()
+        finally:
+            for key, value in previous.items():
+                if value is None:
+                    os.environ.pop(key, None)
+                else:
+                    os.environ[key] = value
+            server.terminate()
+            server.wait()
+
+    created = max(stats["issues"], 1)
+    return {
+        "rows": rows,
+        "wall_time_s": round(wall_time, 3),
+        "issues_created": stats["issues"],
+        "project_items": stats["project_items"],
+        "http_calls": stats["requests"],
+        "http_calls_per_issue": round(stats["requests"] / created, 3),
+        "calls": stats["calls"],
+        "peak_memory_mb": round(peak_memory / 1024 / 1024, 2) if peak_memory is not None else None
+    }
+
+
+def print_results(results: List[Dict]):
+    print("| Rows | Wall time (s) | Issues | HTTP calls | Calls/issue | Peak memory (MB) |")
+    print("|------|---------------|--------|------------|-------------|------------------|")
+    for r in results:
+        print(f"| {r['rows']} | {r['wall_time_s']} | {r['issues_created']} | {r['http_calls']} | {r['http_calls_per_issue']} | {r['peak_memory_mb']} |")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks sync_notion_to_github against a stand-in API.")
+    parser.add_argument("--rows", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response")
+    parser.add_argument("--page-size", type=int, default=100, help="Maximum Notion page size")
+    parser.add_argument("--throttle-every", type=int, default=0, help="Answer every n-th request with a 429")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--no-memory", action="store_true", help="Skip tracemalloc, which slows the run down")
+    parser.add_argument("--json", help="Write the results to this file")
+    parser.add_argument("--max-calls-per-issue", type=float,
+                        help="Exit with an error if a run needs more HTTP calls per issue, e.g. in CI")
+    args = parser.parse_args()
+
+    results = [
+        run_benchmark(rows, args.latency, args.page_size, args.throttle_every, args.workers, not args.no_memory)
+        for rows in args.rows
+    ]
+    print_results(results)
+
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump(results, json_file, indent=2)
+
+    if args.max_calls_per_issue is not None:
+        regressions = [r for r in results if r["http_calls_per_issue"] > args.max_calls_per_issue]
+        for r in regressions:
+            print(f"{r['rows']} rows needed {r['http_calls_per_issue']} HTTP calls per issue, "
+                  f"the budget is {args.max_calls_per_issue}.")
+        if regressions:
+            sys.exit(1)
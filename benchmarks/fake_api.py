@@ -0,0 +1,435 @@
+import argparse
+import copy
+import json
+import os
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+RESULTS_FIXTURE = os.path.join(os.path.dirname(__file__), "..", "resources", "results.json")
+
+ADD_ITEM_PATTERN = re.compile(r'(\w+): addProjectV2ItemById\(input: \{projectId: "([^"]+)", contentId: "([^"]+)"\}\)')
+ALIASED_PROJECT_PATTERN = re.compile(r'(\w+): projectV2\(number: (\d+)\)')
+PROJECT_PATTERN = re.compile(r'projectV2\(number: (\d+)\)')
+SCOPE_PATTERN = re.compile(r'(organization|user)\(login: "([^"]+)"\)')
+
+
+def make_notion_pages(rows: int, project_every: int = 2) -> List[dict]:
+    """Builds `rows` Notion pages from the results.json fixture, every `project_every`-th row references project 1."""
+    with open(RESULTS_FIXTURE) as json_file:
+        template = json.load(json_file)[1]
+
+    pages = []
+    for i in range(rows):
+        page = copy.deepcopy(template)
+        page["id"] = f"page-{i:06d}"
+        page["parent"] = {"type": "database_id", "database_id": "fake_database_id"}
+        page["created_time"] = f"2022-04-30T20:00:{i % 60:02d}.000Z"
+        page["last_edited_time"] = f"2022-05-10T17:10:{i % 60:02d}.000Z"
+        properties = page["properties"]
+        properties["Title"]["title"][0]["plain_text"] = f"Benchmark Issue {i}"
+        properties["Discription"]["rich_text"][0]["plain_text"] = f"Benchmark body {i}"
+        properties["Assignees"]["multi_select"] = []
+        properties["ProjectNumber"]["number"] = 1 if project_every and i % project_every == 0 else None
+        properties["Status"] = {"id": "status", "type": "status", "status": {"name": "Not started"}}
+        properties["GitHub Issue"] = {"id": "url", "type": "url", "url": None}
+        pages.append(page)
+    return pages
+
+
+def utc_now() -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+
+
+def edited_since(query_filter: Optional[dict]) -> Optional[str]:
+    """`on_or_after` of a last_edited_time condition in a database query filter, alone or in an `and`."""
+    if not query_filter:
+        return None
+    if query_filter.get("timestamp") == "last_edited_time":
+        return query_filter["last_edited_time"].get("on_or_after")
+    return next((since for condition in query_filter.get("and", []) if (since := edited_since(condition))), None)
+
+
+class FakeApiServer:
+    """Stand-in for the Notion and GitHub endpoints the action calls.
+
+    Notion is served below /notion/v1, GitHub REST below /github and GitHub GraphQL at /github/graphql.
+    Request counts per endpoint are available from `calls` and from GET /_stats.
+    """
+
+    def __init__(self, notion_pages: Optional[List[dict]] = None, latency: float = 0.0, page_size: int = 100,
+                 throttle_every: int = 0, owner: str = "fake-owner", repo: str = "fake-repo",
+                 projects: Optional[Dict[int, str]] = None, port: int = 0, assignees: Optional[List[str]] = None):
+        self.notion_pages = notion_pages if notion_pages is not None else make_notion_pages(10)
+        self.latency = latency
+        self.page_size = page_size
+        self.throttle_every = throttle_every
+        self.owner = owner
+        self.repo = repo
+        self.projects = projects if projects is not None else {1: "Benchmark Project"}
+        self.assignees = assignees if assignees is not None else [owner]
+        # Issues with these titles are rejected with a 422
+        self.rejected_titles: set = set()
+        # Off like on GHES with rate limiting disabled
+        self.rate_limit_headers = True
+        self.rate_limit_remaining = 4999
+        self.issues: List[dict] = []
+        self.project_items: List[tuple] = []
+        # `since` of every listing of the issues through GraphQL, None for a full listing
+        self.issue_listings: List[Optional[str]] = []
+        self.calls: Counter = Counter()
+        self.requests = 0
+        self.first_request_at: Optional[float] = None
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), self._make_handler())
+        self.server.daemon_threads = True
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def notion_url(self) -> str:
+        return f"{self.url}/notion/v1"
+
+    @property
+    def github_url(self) -> str:
+        return f"{self.url}/github"
+
+    @property
+    def graphql_url(self) -> str:
+        return f"{self.url}/github/graphql"
+
+    def start(self) -> "FakeApiServer":
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self) -> "FakeApiServer":
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"requests": self.requests, "calls": dict(self.calls), "issues": len(self.issues), "project_items": len(self.project_items)}
+
+    def _count(self, endpoint: str) -> bool:
+        """Counts a request and returns whether it should be answered with an injected 429."""
+        with self.lock:
+            if self.first_request_at is None:
+                self.first_request_at = time.time()
+            self.requests += 1
+            self.calls[endpoint] += 1
+            return bool(self.throttle_every) and self.requests % self.throttle_every == 0
+
+    def _issue_json(self, issue: dict) -> dict:
+        base = f"{self.github_url}/repos/{self.owner}/{self.repo}"
+        return {
+            "id": issue["number"],
+            "node_id": issue["node_id"],
+            "number": issue["number"],
+            "title": issue["title"],
+            "body": issue["body"],
+            "state": issue["state"],
+            "labels": [{"name": label} for label in issue["labels"]],
+            "assignees": [{"login": login} for login in issue["assignees"]],
+            "url": f"{base}/issues/{issue['number']}",
+            "html_url": f"https://github.com/{self.owner}/{self.repo}/issues/{issue['number']}"
+        }
+
+    def _repo_json(self) -> dict:
+        return {
+            "id": 1,
+            "name": self.repo,
+            "full_name": f"{self.owner}/{self.repo}",
+            "owner": {"login": self.owner},
+            "has_projects": True,
+            "url": f"{self.github_url}/repos/{self.owner}/{self.repo}",
+            "html_url": f"https://github.com/{self.owner}/{self.repo}"
+        }
+
+    def database_json(self) -> dict:
+        properties = self.notion_pages[0]["properties"] if self.notion_pages else {}
+        return {
+            "object": "database",
+            "id": "fake_database_id",
+            "properties": {name: {"id": prop["id"], "name": name, "type": prop["type"]} for name, prop in properties.items()}
+        }
+
+    def query_notion(self, body: dict) -> dict:
+        since = edited_since(body.get("filter"))
+        pages = [p for p in self.notion_pages if not since or p["last_edited_time"] >= since]
+        start = int(body.get("start_cursor") or 0)
+        end = start + min(int(body.get("page_size", 100)), self.page_size)
+        has_more = end < len(pages)
+        return {
+            "object": "list",
+            "results": pages[start:end],
+            "has_more": has_more,
+            "next_cursor": str(end) if has_more else None
+        }
+
+    def create_issue(self, body: dict) -> dict:
+        with self.lock:
+            number = len(self.issues) + 1
+            issue = {
+                "number": number,
+                "node_id": f"I_{number}",
+                "title": body["title"],
+                "body": body.get("body") or "",
+                "state": "open",
+                "labels": body.get("labels", []),
+                "assignees": body.get("assignees", []),
+                "updated_at": utc_now()
+            }
+            self.issues.append(issue)
+        return self._issue_json(issue)
+
+    def page_blocks(self, block_id: str) -> List[dict]:
+        """Content of every page: a heading, a paragraph with bold text and a list item with a nested item."""
+        if block_id.endswith("-list"):
+            return [self._block(f"{block_id}-child", "bulleted_list_item", "Nested item")]
+        return [
+            self._block(f"{block_id}-heading", "heading_2", "Details"),
+            self._block(f"{block_id}-paragraph", "paragraph", "Important", bold=True),
+            self._block(f"{block_id}-list", "bulleted_list_item", "List item", has_children=True)
+        ]
+
+    def _block(self, block_id: str, block_type: str, text: str, bold: bool = False, has_children: bool = False) -> dict:
+        annotations = {"bold": bold, "italic": False, "strikethrough": False, "underline": False, "code": False, "color": "default"}
+        return {
+            "object": "block",
+            "id": block_id,
+            "type": block_type,
+            "has_children": has_children,
+            block_type: {"rich_text": [{"type": "text", "text": {"content": text, "link": None}, "annotations": annotations, "plain_text": text}]}
+        }
+
+    def block_children(self, block_id: str, query: dict) -> dict:
+        blocks = self.page_blocks(block_id)
+        start = int(query.get("start_cursor", ["0"])[0])
+        end = start + min(int(query.get("page_size", ["100"])[0]), self.page_size)
+        has_more = end < len(blocks)
+        return {"object": "list", "results": blocks[start:end], "has_more": has_more, "next_cursor": str(end) if has_more else None}
+
+    def get_page(self, page_id: str) -> Optional[dict]:
+        with self.lock:
+            return next((p for p in self.notion_pages if p["id"] == page_id), None)
+
+    def update_page(self, page_id: str, body: dict) -> Optional[dict]:
+        with self.lock:
+            page = next((p for p in self.notion_pages if p["id"] == page_id), None)
+            if page is None:
+                return None
+            for name, value in body.get("properties", {}).items():
+                prop_type = next(iter(value))
+                page["properties"][name] = {"id": name, "type": prop_type, **value}
+            return page
+
+    def update_issue(self, number: int, body: dict) -> Optional[dict]:
+        with self.lock:
+            if not 0 < number <= len(self.issues):
+                return None
+            issue = self.issues[number - 1]
+            for field in ["title", "body", "state", "labels", "assignees"]:
+                if field in body:
+                    issue[field] = body[field]
+            issue["updated_at"] = utc_now()
+        return self._issue_json(issue)
+
+    def graphql(self, body: dict) -> dict:
+        query = body.get("query", "")
+        variables = body.get("variables") or {}
+
+        if "addProjectV2ItemById" in query:
+            data, errors = {}, []
+            project_ids = {f"PVT_{number}" for number in self.projects}
+            for alias, project_id, content_id in ADD_ITEM_PATTERN.findall(query):
+                if project_id in project_ids:
+                    with self.lock:
+                        # Like GitHub, adding an issue that is already in the project returns its item
+                        if (project_id, content_id) not in self.project_items:
+                            self.project_items.append((project_id, content_id))
+                        data[alias] = {"item": {"id": f"PVTI_{self.project_items.index((project_id, content_id)) + 1}"}}
+                else:
+                    data[alias] = None
+                    errors.append({"path": [alias], "message": f"Could not resolve to a node with the global id of '{project_id}'"})
+            return {"data": data, "errors": errors} if errors else {"data": data}
+
+        if "projectV2" in query:
+            data = {}
+            for scope, _ in SCOPE_PATTERN.findall(query):
+                if scope != "organization":
+                    data[scope] = None
+                    continue
+                aliased = ALIASED_PROJECT_PATTERN.findall(query)
+                if aliased:
+                    data[scope] = {alias: self._project_json(int(number)) for alias, number in aliased}
+                else:
+                    data[scope] = {"projectV2": self._project_json(int(PROJECT_PATTERN.search(query).group(1)))}
+            return {"data": data}
+
+        if "repository(" in query:
+            first = int(variables.get("first", 100))
+            start = int(variables.get("after") or 0)
+            since = variables.get("since")
+            with self.lock:
+                if start == 0:
+                    self.issue_listings.append(since)
+                matching = [i for i in self.issues if not since or i["updated_at"] >= since]
+                issues = matching[start:start + first]
+                has_next = start + first < len(matching)
+            nodes = [{"number": i["number"], "title": i["title"], "id": i["node_id"], "state": i["state"].upper(), "body": i["body"]} for i in issues]
+            return {"data": {"repository": {"issues": {
+                "pageInfo": {"hasNextPage": has_next, "endCursor": str(start + first) if has_next else None},
+                "nodes": nodes
+            }}}}
+
+        return {"errors": [{"message": "Unsupported query"}]}
+
+    def _project_json(self, number: int) -> Optional[dict]:
+        if number not in self.projects:
+            return None
+        return {"id": f"PVT_{number}", "title": self.projects[number]}
+
+    def _make_handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _read_json(self) -> dict:
+                length = int(self.headers.get("Content-Length") or 0)
+                return json.loads(self.rfile.read(length) or b"{}") if length else {}
+
+            def _send(self, status: int, payload, headers: Optional[Dict[str, str]] = None):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                if api.rate_limit_headers:
+                    self.send_header("X-RateLimit-Limit", "5000")
+                    self.send_header("X-RateLimit-Remaining", str(api.rate_limit_remaining))
+                    self.send_header("X-RateLimit-Reset", str(int(time.time()) + 3600))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _handle(self, endpoint: str, handler):
+                if api._count(endpoint):
+                    self._send(429, {"message": "rate limited"}, {"Retry-After": "0"})
+                    return
+                if api.latency:
+                    time.sleep(api.latency)
+                handler()
+
+            def do_GET(self):
+                path = urlparse(self.path).path
+                repo_path = f"/github/repos/{api.owner}/{api.repo}"
+
+                blocks_match = re.fullmatch(r"/notion/v1/blocks/([\w-]+)/children", path)
+                page_match = re.fullmatch(r"/notion/v1/pages/([\w-]+)", path)
+
+                if path == "/_stats":
+                    self._send(200, api.stats())
+                elif re.fullmatch(r"/notion/v1/databases/[\w-]+", path):
+                    self._handle("GET /databases/{id}", lambda: self._send(200, api.database_json()))
+                elif page_match:
+                    def page_handler():
+                        page = api.get_page(page_match.group(1))
+                        if page:
+                            self._send(200, page)
+                        else:
+                            self._send(404, {"object": "error", "status": 404})
+                    self._handle("GET /pages/{id}", page_handler)
+                elif blocks_match:
+                    query = parse_qs(urlparse(self.path).query)
+                    self._handle("GET /blocks/{id}/children", lambda: self._send(200, api.block_children(blocks_match.group(1), query)))
+                elif path == repo_path:
+                    self._handle("GET /repos/{owner}/{repo}", lambda: self._send(200, api._repo_json()))
+                elif path == f"{repo_path}/issues":
+                    query = parse_qs(urlparse(self.path).query)
+                    per_page = int(query.get("per_page", ["30"])[0])
+                    page = int(query.get("page", ["1"])[0])
+                    issues = api.issues[(page - 1) * per_page:page * per_page]
+                    self._handle("GET /repos/{owner}/{repo}/issues", lambda: self._send(200, [api._issue_json(i) for i in issues]))
+                elif path == f"{repo_path}/assignees":
+                    users = [{"login": login, "id": i} for i, login in enumerate(api.assignees, 1)]
+                    self._handle("GET /repos/{owner}/{repo}/assignees", lambda: self._send(200, users))
+                else:
+                    self._send(404, {"message": "Not Found"})
+
+            def do_POST(self):
+                path = urlparse(self.path).path
+                body = self._read_json()
+
+                if re.fullmatch(r"/notion/v1/databases/[\w-]+/query", path):
+                    self._handle("POST /databases/{id}/query", lambda: self._send(200, api.query_notion(body)))
+                elif path == f"/github/repos/{api.owner}/{api.repo}/issues":
+                    def create_handler():
+                        if body.get("title") in api.rejected_titles:
+                            self._send(422, {"message": "Validation Failed"})
+                        else:
+                            self._send(201, api.create_issue(body))
+                    self._handle("POST /repos/{owner}/{repo}/issues", create_handler)
+                elif path == "/github/graphql":
+                    self._handle("POST /graphql", lambda: self._send(200, api.graphql(body)))
+                else:
+                    self._send(404, {"message": "Not Found"})
+
+            def do_PATCH(self):
+                path = urlparse(self.path).path
+                body = self._read_json()
+
+                match = re.fullmatch(rf"/github/repos/{api.owner}/{api.repo}/issues/(\d+)", path)
+                page_match = re.fullmatch(r"/notion/v1/pages/([\w-]+)", path)
+                if page_match:
+                    def page_handler():
+                        page = api.update_page(page_match.group(1), body)
+                        if page:
+                            self._send(200, page)
+                        else:
+                            self._send(404, {"object": "error", "status": 404})
+                    self._handle("PATCH /pages/{id}", page_handler)
+                elif match:
+                    def handler():
+                        issue = api.update_issue(int(match.group(1)), body)
+                        if issue:
+                            self._send(200, issue)
+                        else:
+                            self._send(404, {"message": "Not Found"})
+                    self._handle("PATCH /repos/{owner}/{repo}/issues/{number}", handler)
+                else:
+                    self._send(404, {"message": "Not Found"})
+
+        return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runs a stand-in Notion and GitHub API.")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--rows", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response")
+    parser.add_argument("--page-size", type=int, default=100, help="Maximum Notion page size")
+    parser.add_argument("--throttle-every", type=int, default=0, help="Answer every n-th request with a 429")
+    args = parser.parse_args()
+
+    server = FakeApiServer(make_notion_pages(args.rows), args.latency, args.page_size, args.throttle_every, port=args.port)
+    print(f"Serving Notion at {server.notion_url} and GitHub at {server.github_url}")
+    server.server.serve_forever()
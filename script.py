@@ -1,68 +1,855 @@
+import json
 import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import (Any, Callable, Dict, Iterable, List, NamedTuple,
+                    Optional, Tuple)
+from urllib.parse import urlparse
 
-from utils.GitHubHelper import GitHubHelper, GraphQLHelper
+from utils.GitHubHelper import (GitHubClient, GitHubHelper, GraphQLHelper,
+                                IssueIndex, IssueRecord, ProjectRef,
+                                ProjectResolver, SyncResult, WriteThrottle,
+                                github, snapshot_time)
+from utils.HttpSession import DEFAULT_POOL_SIZE, configure_session
+from utils.MappingStore import MappingStore
 from utils.NotionHelper import NotionHelper
+from utils.PageQueue import PageQueue
+from utils.Pipeline import BatchStage, prefetch
+from utils.PropertyMapping import NotionIssue, PropertyMapping
+from utils.RateLimiter import get_rate_limiter
+from utils.Routing import Route, parse_routes, partition, resolve_repository
+from utils.StatusSync import StatusSync
+from utils.SyncPlan import PROJECT_LINK_BATCH_SIZE, SyncPlan, plan_issue
+from utils.SyncState import SyncState
+from utils.Tracer import Tracer, reset_tracer
+from utils.UserMapping import UserMapping
+from utils.WebhookServer import WebhookServer
+
+# Notion entries read ahead of issue creation, one page of the database query
+READ_AHEAD = 100
+DEFAULT_QUEUE_FILE = "notion-2-issue-queue.jsonl"
+# Seconds the webhook worker waits for pages before checking whether it should stop
+POLL_TIMEOUT = 1.0
+# Seconds before a failed batch of webhook pages is synced again
+RETRY_DELAY = 30.0
+DEFAULT_POLL_INTERVAL = 60.0
+# A snapshot checkpointed in the state file is refreshed instead of listed again within the 6 hours a job may run,
+# issues deleted meanwhile stay in it until then
+SNAPSHOT_TTL = 6 * 60 * 60
+# Issue records the daemon keeps per repository, a record holds the title, the ids, the state and the page marker
+DEFAULT_MAX_INDEXED_ISSUES = 100000
+
+
+def get_bool_input(name: str, default: bool = False) -> bool:
+    value = os.getenv(f"INPUT_{name}", "")
+    if not value:
+        return default
+    return value.strip().lower() in ["true", "1", "yes"]
+
+
+def get_int_input(name: str, default: int) -> int:
+    value = os.getenv(f"INPUT_{name}", "")
+    return int(value) if value.strip() else default
+
+
+def get_float_input(name: str, default: float) -> float:
+    value = os.getenv(f"INPUT_{name}", "")
+    return float(value) if value.strip() else default
+
+
+def get_list_input(name: str) -> List[str]:
+    value = os.getenv(f"INPUT_{name}", "")
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def get_notion_filters() -> List[dict]:
+    raw_filter = os.getenv("INPUT_NOTIONFILTER", "")
+    if not raw_filter.strip():
+        return []
+
+    filters = json.loads(raw_filter)
+    return filters if isinstance(filters, list) else [filters]
+
+
+def link_to_projects(graphql_helper: GraphQLHelper, gh_helper: GitHubHelper, pending: List[Tuple[str, ProjectRef, str, Optional[str]]],
+                     mapping_store: Optional[MappingStore] = None):
+    results = graphql_helper.add_items_to_prj([(prj.id, node_id) for _, prj, node_id, _ in pending], PROJECT_LINK_BATCH_SIZE)
+    for (title, prj, _, page_id), (prj_item, error) in zip(pending, results):
+        if prj_item:
+            gh_helper.update_project_link_status(page_id, True)
+            if mapping_store is not None:
+                mapping_store.put(page_id, project_item_id=prj_item)
+            print(f"Issue '{title}' added to project '{prj.title}' successfully.")
+        else:
+            print(f"Failed to add issue '{title}' to project '{prj.title}'. Error: {error}")
+    pending.clear()
+
+
+def execute_actions(actions: Iterable[Dict[str, Any]], gh_helper: GitHubHelper, graphql_helper: GraphQLHelper,
+                    issue_index: Optional[IssueIndex], tracer: Tracer, workers: int,
+                    mapping_store: Optional[MappingStore] = None, failed_page_ids: Optional[List[str]] = None) -> Tuple[List[int], List[int]]:
+    """Creates, updates and links the planned issues and returns the created and updated issue numbers in Notion order.
+
+    Pages whose issue couldn't be created or updated are appended to `failed_page_ids`.
+    """
+    created_issue_numbers = []
+    updated_issue_numbers = []
+
+    def link(batch: List[Tuple[str, ProjectRef, str, Optional[str]]]):
+        with tracer.phase("Project linking"):
+            link_to_projects(graphql_helper, gh_helper, batch, mapping_store)
+
+    def finish(action: Dict[str, Any], future: Optional[Future]):
+        if action["action"] == "link":
+            # Issue of an earlier run that was created but not linked, only the link is retried
+            gh_helper.add_result(SyncResult(action['title'], gh_helper.get_issue_url(action["number"]), page_id=action["page_id"]))
+            if mapping_store is not None:
+                mapping_store.put(action["page_id"], number=action["number"], node_id=action["node_id"], hash=action["existing_hash"],
+                                  repository=gh_helper.repo_name)
+            linker.put((action["title"], action["project"], action["node_id"], action["page_id"]))
+            return
+
+        if future is None:
+            print(f"Issue with the same title '{action['title']}' already exists on GitHub.")
+            gh_helper.add_result(SyncResult(action['title'], page_id=action["page_id"]))
+            linked = action["page_id"] is not None and action.get("existing_page_id") == action["page_id"]
+            if mapping_store is not None and action["reason"] == "exists" and linked:
+                # Remember issues found by their marker, so the next run doesn't need the snapshot for them.
+                # Issues only matched by title may belong to another page and are never recorded, an update run would overwrite them.
+                # The hash is the one of the issue's content, so an update run can still tell whether it is stale.
+                mapping_store.put(action["page_id"], number=action["existing_number"], node_id=action["existing_node_id"],
+                                  hash=action.get("existing_hash"), repository=gh_helper.repo_name)
+            return
+
+        if action["action"] == "update":
+            with tracer.phase("Issue update"):
+                updated = future.result()
+            if not updated:
+                gh_helper.add_result(SyncResult(action['title'], page_id=action["page_id"]))
+                if failed_page_ids is not None:
+                    failed_page_ids.append(action["page_id"])
+                return
+            gh_helper.add_result(SyncResult(action['title'], gh_helper.get_issue_url(action["number"]), updated=True,
+                                            page_id=action["page_id"]))
+            updated_issue_numbers.append(action["number"])
+            if mapping_store is not None:
+                mapping_store.put(action["page_id"], number=action["number"], node_id=action["node_id"], hash=action["hash"],
+                                  repository=gh_helper.repo_name)
+            return
+
+        with tracer.phase("Issue creation"):
+            issue = future.result()
+
+        reserved = issue_index.find(action["title"], action["page_id"]) if issue_index is not None else None
+        if not issue:
+            if reserved and not reserved.number:
+                issue_index.discard(reserved)
+            gh_helper.add_result(SyncResult(action['title'], page_id=action["page_id"]))
+            if failed_page_ids is not None:
+                failed_page_ids.append(action["page_id"])
+            return
+
+        gh_helper.add_result(SyncResult(action['title'], issue.html_url, created=True, page_id=action["page_id"]))
+        if reserved and not reserved.number:
+            issue_index.replace(reserved, IssueRecord(issue.number, action["title"], issue.raw_data.get("node_id", ""), "OPEN", action["page_id"]))
+        created_issue_numbers.append(issue.number)
+        if mapping_store is not None:
+            # A page routed to another repository may have a record of its old issue, its project item and state are dropped
+            mapping_store.put(action["page_id"], number=issue.number, node_id=issue.raw_data.get("node_id"), hash=action["hash"],
+                              repository=gh_helper.repo_name, project_item_id=None, state=None)
+
+        if not action["project"]:
+            return
+
+        # Project links are sent in batches of aliased mutations by the linker stage, creation goes on meanwhile
+        linker.put((action["title"], action["project"], issue.raw_data['node_id'], action["page_id"]))
+
+    # Issues are created concurrently, results are handled in Notion order
+    window = deque()
+    with BatchStage(link, PROJECT_LINK_BATCH_SIZE) as linker, ThreadPoolExecutor(max_workers=workers) as executor:
+        for action in actions:
+            if action["action"] in ["skip", "link"]:
+                window.append((action, None))
+            elif action["action"] == "update":
+                future = executor.submit(
+                    gh_helper.update_issue,
+                    action["number"],
+                    action["title"],
+                    action["body"],
+                    action["assignees"],
+                    action["labels"],
+                    milestone=action.get("milestone")
+                )
+                window.append((action, future))
+            else:
+                future = executor.submit(
+                    gh_helper.create_issue,
+                    action["title"], 
+                    action["body"], 
+                    action["assignees"], 
+                    action["labels"],
+                    summary=False,
+                    milestone=action.get("milestone")
+                )
+                window.append((action, future))
+
+            if len(window) >= workers * 2:
+                finish(*window.popleft())
+
+        for pending in window:
+            finish(*pending)
+
+    return created_issue_numbers, updated_issue_numbers
+
+
+class SyncContext(NamedTuple):
+    """Settings and clients shared by the pipelines of all repositories in a run."""
+    notion_token: str
+    gh_token: str
+    api_url: str
+    graphql_url: str
+    notion_api_url: str
+    workers: int
+    write_delay: float
+    tracer: Tracer
+    state: Optional[SyncState]
+    mapping_store: Optional[MappingStore]
+    update: bool
+    full_sync: bool
+    page_body: bool
+    url_property: Optional[str]
+    status_property: Optional[str]
+    closed_statuses: List[str]
+    open_status: Optional[str]
+    git: GitHubClient
+    throttle: WriteThrottle
+    project_cache: Dict
+    # Time up to which issue states were checked per repository, when there is no state file
+    state_watermarks: Dict[str, str]
+
+
+class RepositoryClients(NamedTuple):
+    """Clients and the issue snapshot of a repository, long-running modes reuse them for every sync."""
+    gh_helper: GitHubHelper
+    graphql_helper: GraphQLHelper
+    issue_index: IssueIndex
+
+
+class RepositoryResult(NamedTuple):
+    gh_helper: GitHubHelper
+    created_issue_numbers: List[int]
+    updated_issue_numbers: List[int]
+    changed_issue_numbers: List[int]
+    # Pages whose issue couldn't be created or updated, they are read again by the next sync
+    failed_page_ids: List[str]
+
+
+def create_sync_context(tracer: Tracer) -> SyncContext:
+    """Reads the settings shared by all pipelines of a run from the environment."""
+    state_file = os.getenv("INPUT_STATEFILE", "")
+    mapping_file = os.getenv("INPUT_MAPPINGFILE", "")
+    workers = max(get_int_input("WORKERS", 4), 1)
+    # One keep-alive pool is shared by the Notion and GraphQL clients
+    configure_session(max(get_int_input("POOLSIZE", DEFAULT_POOL_SIZE), workers))
+
+    # GitHub sets these for Enterprise Server, they also point the action at a stand-in API
+    gh_token = os.environ["INPUT_GITHUBTOKEN"]
+    api_url = os.getenv("GITHUB_API_URL", "https://api.github.com")
+    write_delay = get_float_input("WRITEDELAY", 1.0)
+
+    return SyncContext(
+        notion_token=os.environ["INPUT_NOTIONTOKEN"],
+        gh_token=gh_token,
+        api_url=api_url,
+        graphql_url=os.getenv("GITHUB_GRAPHQL_URL", "https://api.github.com/graphql"),
+        notion_api_url=os.getenv("NOTION_API_URL", "https://api.notion.com/v1"),
+        workers=workers,
+        write_delay=write_delay,
+        tracer=tracer,
+        state=SyncState(state_file) if state_file else None,
+        mapping_store=MappingStore(mapping_file) if mapping_file else None,
+        # Issues linked to a page are patched when the page's content hash changed
+        update=get_bool_input("UPDATEEXISTING"),
+        full_sync=get_bool_input("FULLSYNC"),
+        # With pageBody, the page content is appended to the description, unchanged pages are read from the state file
+        page_body=get_bool_input("PAGEBODY"),
+        # Optional write-back of the issue URL and state to Notion
+        url_property=os.getenv("INPUT_NOTIONURLPROPERTY", "").strip() or None,
+        status_property=os.getenv("INPUT_NOTIONSTATUSPROPERTY", "").strip() or None,
+        closed_statuses=get_list_input("NOTIONCLOSEDSTATUS"),
+        open_status=os.getenv("INPUT_NOTIONOPENSTATUS", "").strip() or None,
+        git=GitHubClient(gh_token, workers, api_url, write_delay),
+        throttle=WriteThrottle(),
+        project_cache={},
+        state_watermarks={}
+    )
+
+
+def create_notion_helper(database_id: str, context: SyncContext, repository_property: Optional[str] = None) -> NotionHelper:
+    property_mapping = PropertyMapping.parse(os.getenv("INPUT_PROPERTYMAPPING", ""))
+    if repository_property:
+        property_mapping.set("repository", repository_property)
+
+    notion_helper = NotionHelper(context.notion_token, database_id, api_url=context.notion_api_url,
+                                 status_property=context.status_property, url_property=context.url_property,
+                                 page_body=context.page_body, workers=context.workers, cache=context.state,
+                                 property_mapping=property_mapping,
+                                 user_mapping=UserMapping.parse(os.getenv("INPUT_USERMAPPING", "")))
+    # The mapping is checked against the database once, a wrong property name fails before anything is written
+    with context.tracer.phase("Notion schema"):
+        notion_helper.load_schema()
+    return notion_helper
+
+
+def create_issue_index(graphql_helper: GraphQLHelper, tracer: Tracer, state: Optional[SyncState] = None,
+                       full_sync: bool = False) -> IssueIndex:
+    def load_issues() -> List[IssueRecord]:
+        synced_at = snapshot_time()
+        cached = state.get_snapshot(graphql_helper.repo) if state and not full_sync else None
+        if cached and cached["expires"] >= time.time():
+            # A run restarted after a timeout or crash only reads the issues changed since the checkpoint
+            with tracer.phase("GitHub issue refresh"):
+                issues = {row[0]: IssueRecord(*row) for row in cached["issues"]}
+                issues.update((issue.number, issue) for issue in graphql_helper.iter_issues(since=cached["synced_at"]))
+            records, expires = list(issues.values()), cached["expires"]
+        else:
+            with tracer.phase("GitHub issue snapshot"):
+                records = list(graphql_helper.iter_issues())
+            expires = time.time() + SNAPSHOT_TTL
+        if state:
+            state.set_snapshot(graphql_helper.repo, synced_at, [list(issue) for issue in records], expires)
+            state.save()
+        return records
+
+    # Closed issues are indexed as well, so they are not recreated.
+    # The snapshot is only taken once a page isn't found in the mapping store.
+    return IssueIndex(loader=load_issues)
+
+
+def create_repository_clients(repository: str, context: SyncContext) -> RepositoryClients:
+    gh_helper = GitHubHelper(context.gh_token, repository, context.workers, context.api_url, context.write_delay,
+                             git=context.git, throttle=context.throttle)
+    graphql_helper = GraphQLHelper(context.gh_token, repository, context.graphql_url)
+    return RepositoryClients(gh_helper, graphql_helper, create_issue_index(graphql_helper, context.tracer, context.state, context.full_sync))
+
+
+def sync_repository(repository: str, sources: List[Tuple[NotionHelper, Iterable[NotionIssue]]], context: SyncContext,
+                    clients: Optional[RepositoryClients] = None) -> RepositoryResult:
+    """Creates, updates and links the issues of all Notion sources routed to `repository`.
+
+    `clients` passed in are kept up to date, so they can serve later calls.
+    """
+    tracer = context.tracer
+    gh_helper, graphql_helper, issue_index = clients or create_repository_clients(repository, context)
+
+    if context.mapping_store is None:
+        # Every entry is looked up in the snapshot, so it loads while the first Notion page is read
+        issue_index.prefetch()
+    project_resolver = ProjectResolver(graphql_helper, context.state, cache=context.project_cache)
+
+    syncs_status = bool(context.status_property and context.closed_statuses)
+    if syncs_status:
+        states_checked_at, state_changes = list_state_changes(repository, graphql_helper, context)
+
+    created_issue_numbers, updated_issue_numbers, changed_issue_numbers, failed_page_ids = [], [], [], []
+    for notion_helper, issues in sources:
+        synced_issues = []
+        if context.url_property or syncs_status:
+            issues = remember(issues, synced_issues)
+        edited_times: Dict[str, str] = {}
+        issues = remember_edited(issues, edited_times)
+        source_failures = []
+
+        # Projects are only checked once an issue with a project is created, runs that create nothing don't load the repository
+        actions = (plan_issue(i, issue_index, project_resolver, lambda: gh_helper.repo.has_projects, context.mapping_store, context.update,
+                              repository) for i in issues)
+        created, updated = execute_actions(actions, gh_helper, graphql_helper, issue_index, tracer, context.workers, context.mapping_store,
+                                           source_failures)
+        created_issue_numbers += created
+        updated_issue_numbers += updated
+        failed_page_ids += source_failures
+        for page_id in source_failures:
+            notion_helper.hold_watermark(edited_times.get(page_id))
+
+        # Issues closed or reopened on GitHub reach pages that weren't edited, and so weren't read, as well
+        unread = pages_to_reconcile(state_changes, synced_issues, repository, context.mapping_store) if syncs_status else {}
+        if synced_issues or unread:
+            # Only issues carrying the page marker are linked, issues matched by title are left alone
+            status_sync = StatusSync(notion_helper, gh_helper, context.closed_statuses, context.open_status, context.mapping_store)
+            with tracer.phase("Status sync"):
+                for issue in synced_issues:
+                    record = issue_index.find_by_page_id(issue.id)
+                    if record and record.number:
+                        status_sync.reconcile(issue, record)
+                for issue in notion_helper.iter_notion_issues_by_id(list(unread)):
+                    status_sync.reconcile(issue, unread[issue.id])
+                changed_issue_numbers += status_sync.apply(context.workers)[0]
+
+    if syncs_status:
+        context.state_watermarks[repository] = states_checked_at
+        if context.state:
+            context.state.set_state_watermark(repository, states_checked_at)
+    return RepositoryResult(gh_helper, created_issue_numbers, updated_issue_numbers, changed_issue_numbers, failed_page_ids)
+
+
+def list_state_changes(repository: str, graphql_helper: GraphQLHelper, context: SyncContext) -> Tuple[str, List[IssueRecord]]:
+    """Linked issues updated on GitHub since the states were last checked, and the time the states are now checked up to.
+
+    The first check only sets the time, the pages read by that run are reconciled anyway.
+    """
+    checked_at = snapshot_time()
+    since = context.state_watermarks.get(repository) or (context.state.get_state_watermark(repository) if context.state else None)
+    if not since:
+        return checked_at, []
+    with context.tracer.phase("GitHub issue refresh"):
+        return checked_at, [issue for issue in graphql_helper.iter_issues(since=since) if issue.notion_page_id]
+
+
+def pages_to_reconcile(state_changes: List[IssueRecord], synced_issues: List[NotionIssue], repository: str,
+                       mapping_store: Optional[MappingStore]) -> Dict[str, IssueRecord]:
+    """Issues by page id whose state may differ from their page, for pages this run didn't read."""
+    read = {issue.id for issue in synced_issues}
+    pages = {}
+    for record in state_changes:
+        if record.notion_page_id in read:
+            continue
+        mapped = mapping_store.get(record.notion_page_id) if mapping_store is not None else None
+        if mapped and (mapped.get("state") == record.state.lower() or mapped.get("repository", repository) != repository):
+            continue  # Only edited on GitHub, or the page moved to another repository
+        pages[record.notion_page_id] = record
+    return pages
 
 
 def sync_notion_to_github():
     # Extract input from environment
     notion_token = os.environ["INPUT_NOTIONTOKEN"]
     gh_token = os.environ["INPUT_GITHUBTOKEN"]
-    database_id = os.environ["INPUT_NOTIONDATABASE"]
+    database_id = os.getenv("INPUT_NOTIONDATABASE", "")
     repository = os.getenv("GITHUB_REPOSITORY")
+    routes_config = os.getenv("INPUT_ROUTES", "")
+    routes = parse_routes(routes_config, database_id, repository)
 
-    if not all([notion_token, gh_token, database_id, repository]):
+    if not all([notion_token, gh_token, routes, repository]):
         raise EnvironmentError("Missing required environment variables. Please check your .env file.")
 
-    notion_helper = NotionHelper(notion_token, database_id)
-    issues = notion_helper.get_notion_issues()
+    # sync: read and write, plan: only write the plan file, apply: execute a plan file, webhook: sync pages as they change,
+    # daemon: sync on an interval with warm clients
+    mode = os.getenv("INPUT_MODE", "").strip().lower() or "sync"
+    if mode not in ["sync", "plan", "apply", "webhook", "daemon"]:
+        raise ValueError(f"Unknown mode '{mode}'. Use 'sync', 'plan', 'apply', 'webhook' or 'daemon'.")
+    if mode not in ["sync", "daemon"] and routes_config.strip():
+        raise ValueError("Routes are only supported in modes 'sync' and 'daemon'.")
+    plan_file = os.getenv("INPUT_PLANFILE", "").strip() or "notion-2-issue-plan.json"
 
-    gh_helper = GitHubHelper(gh_token, repository)
-    gh_issues = gh_helper.get_issues()
+    if mode == "webhook":
+        serve_notion_webhooks()
+        return
+    if mode == "daemon":
+        run_daemon()
+        return
 
-    created_issue_numbers = []
-    for new_issue in issues:
-        if list(filter(lambda i: i.title == new_issue["title"], gh_issues)):
-            print(f"Issue with the same title '{new_issue['title']}' already exists on GitHub.")
-            gh_helper.summary_data.append((new_issue['title'], "", False, False))
-            continue
-        
-        issue = gh_helper.create_issue(
-            new_issue["title"], 
-            new_issue["description"], 
-            new_issue["assignees"], 
-            new_issue["labels"]
-        )
-        if not issue:
-            continue
+    tracer = reset_tracer()
+    context = create_sync_context(tracer)
+    state, mapping_store = context.state, context.mapping_store
 
-        created_issue_numbers.append(issue.number)
+    def read_route(route: Route) -> Tuple[NotionHelper, Iterable[NotionIssue]]:
+        notion_helper = create_notion_helper(route.database_id, context, route.repository_property)
+
+        since = None if context.full_sync or not state else state.get_watermark(route.database_id)
+        if since:
+            print(f"Incremental sync of Notion entries edited since {since}.")
+
+        # Issues are streamed page by page on a reader thread, so the next page downloads while issues of the last one are created
+        filters = get_notion_filters() + list(route.filters)
+        issues = tracer.timed_iter("Notion read", notion_helper.iter_notion_issues(since=since, filters=filters))
+        return notion_helper, prefetch(issues, READ_AHEAD)
+
+    if mode in ["plan", "apply"]:
+        write_plan_or_apply(mode, plan_file, routes[0], read_route, context)
+        return
+
+    results, failures, route_targets = sync_routes(routes, read_route, context, repository.split("/")[0])
+    if len(results) + len(failures) == 1 and failures:
+        raise next(iter(failures.values()))
+
+    created_issue_numbers = [n for result in results.values() for n in result.created_issue_numbers]
+    updated_issue_numbers = [n for result in results.values() for n in result.updated_issue_numbers]
+    changed_issue_numbers = [n for result in results.values() for n in result.changed_issue_numbers]
+    write_outputs(created_issue_numbers, updated_issue_numbers, changed_issue_numbers, tracer)
+    if routes_config.strip():
+        by_repository = {target: result.created_issue_numbers for target, result in results.items()}
+        with open(os.environ['GITHUB_OUTPUT'], 'a') as gh_out_file:
+            gh_out_file.write(f"issueNumbersByRepository={json.dumps(by_repository)}\n")
+
+    with open(os.environ.get('GITHUB_STEP_SUMMARY', 'github_step_summary.md'), 'w') as summary_file:
+        if len(results) == 1 and not failures:
+            next(iter(results.values())).gh_helper.write_job_summary(summary_file, tracer)
+        else:
+            for target, result in results.items():
+                result.gh_helper.write_job_summary(summary_file, heading=f"# Notion to GitHub Sync Summary: {target}")
+                summary_file.write("\n")
+            summary_file.write(tracer.create_summary())
+
+    if state:
+        for database_id, watermark in synced_watermarks(route_targets, failures).items():
+            state.set_watermark(database_id, watermark)
+        state.save()
+    if mapping_store is not None:
+        mapping_store.compact()
+
+    if failures:
+        raise RuntimeError(f"Sync failed for {', '.join(sorted(failures))}.")
+
+
+def sync_routes(routes: List[Route], read_route: Callable[[Route], Tuple[NotionHelper, Iterable[NotionIssue]]], context: SyncContext,
+                default_owner: str, clients: Optional[Dict[str, RepositoryClients]] = None
+                ) -> Tuple[Dict[str, RepositoryResult], Dict[str, Exception], List[Tuple[Route, NotionHelper, List[str]]]]:
+    """Syncs all routes and returns the results and the failures by repository and the repositories each route fed.
+
+    Repositories missing in `clients` are added to it, so their clients serve later calls.
+    """
+    # Every repository gets one pipeline, fed by all databases routed to it
+    sources: Dict[str, List[Tuple[NotionHelper, Iterable[NotionIssue]]]] = {}
+    route_targets: List[Tuple[Route, NotionHelper, List[str]]] = []
+    for route in routes:
+        notion_helper, issues = read_route(route)
+        if route.repository_property:
+            targets = partition(issues, route, default_owner)
+        else:
+            targets = {resolve_repository(route.repository, default_owner): issues}
+        for target, target_issues in targets.items():
+            sources.setdefault(target, []).append((notion_helper, target_issues))
+        route_targets.append((route, notion_helper, list(targets)))
+
+    # Pipelines share the connection pool, the rate limiters, the write throttle and the project cache
+    results: Dict[str, RepositoryResult] = {}
+    failures: Dict[str, Exception] = {}
+    parallel = max(get_int_input("PARALLELREPOSITORIES", 4), 1)
+    with ThreadPoolExecutor(max_workers=min(parallel, max(len(sources), 1))) as executor:
+        futures = {}
+        for target, target_sources in sources.items():
+            if clients is not None and target not in clients:
+                clients[target] = create_repository_clients(target, context)
+            futures[target] = executor.submit(sync_repository, target, target_sources, context,
+                                              clients[target] if clients is not None else None)
+        for target, future in futures.items():
+            try:
+                results[target] = future.result()
+            except Exception as e:
+                print(f"Failed to sync repository {target}. Error: {str(e)}")
+                failures[target] = e
+    return results, failures, route_targets
 
-        if not new_issue["project_number"]:
-            continue
 
-        if not gh_helper.repo.has_projects:
-            print(f"Current repository isn't linked to a project.")
+def synced_watermarks(route_targets: List[Tuple[Route, NotionHelper, List[str]]], failures: Dict[str, Exception]
+                      ) -> Dict[str, Optional[str]]:
+    """Next watermark of every database whose routes were all synced.
+
+    The watermark is stored per database, so a database read by several routes only moves once every repository its
+    routes feed was synced, and then only to the oldest watermark among them.
+    """
+    watermarks: Dict[str, Optional[str]] = {}
+    failed = set()
+    for route, notion_helper, targets in route_targets:
+        if any(target in failures for target in targets):
+            failed.add(route.database_id)
             continue
+        watermark = notion_helper.watermark
+        current = watermarks.get(route.database_id)
+        watermarks[route.database_id] = min(current, watermark) if current and watermark else current or watermark
+    return {database_id: watermark for database_id, watermark in watermarks.items() if database_id not in failed}
+
+
+def write_plan_or_apply(mode: str, plan_file: str, route: Route,
+                        read_route: Callable[[Route], Tuple[NotionHelper, Iterable[NotionIssue]]], context: SyncContext):
+    repository, database_id = route.repository, route.database_id
+    tracer, state, mapping_store, update = context.tracer, context.state, context.mapping_store, context.update
+    gh_helper = GitHubHelper(context.gh_token, repository, context.workers, context.api_url, context.write_delay,
+                             git=context.git, throttle=context.throttle)
+    graphql_helper = GraphQLHelper(context.gh_token, repository, context.graphql_url)
+
+    if mode == "plan":
+        issue_index = create_issue_index(graphql_helper, tracer, state, context.full_sync)
+        project_resolver = ProjectResolver(graphql_helper, state)
+        has_projects = gh_helper.repo.has_projects
+
+        notion_helper, issues = read_route(route)
+        issues = list(issues)
+        if has_projects:
+            # All project numbers of the run are resolved with one query
+            with tracer.phase("Planning"):
+                project_resolver.prefetch(i.project_number for i in issues if i.project_number)
+        with tracer.phase("Planning"):
+            plan = SyncPlan(repository, database_id,
+                            [plan_issue(i, issue_index, project_resolver, has_projects, mapping_store, update, repository) for i in issues],
+                            notion_helper.last_edited_time)
+        write_plan(plan, plan_file, gh_helper, context.graphql_url)
+        return
+
+    plan = SyncPlan.load(plan_file)
+    if plan.repository != repository or plan.database_id != database_id:
+        raise ValueError(f"Plan '{plan_file}' was made for {plan.repository} and database {plan.database_id}.")
+    print(f"Applying plan '{plan_file}' created at {plan.created_at}.")
+    if plan.creates:
+        # Issues created after the plan was made carry its page markers, so a rerun of the apply job doesn't create them again
+        created_after = snapshot_time(datetime.fromisoformat(plan.created_at).timestamp())
+        with tracer.phase("GitHub issue listing"):
+            applied = plan.skip_applied(IssueIndex(graphql_helper.iter_issues(since=created_after)))
+        if applied:
+            print(f"Skipping {applied} planned issues that were already created.")
+    if plan.creates or plan.updates or plan.links:
+        check_budget(plan, gh_helper, context.graphql_url)
+
+    failed_page_ids = []
+    created_issue_numbers, updated_issue_numbers = execute_actions(plan.actions, gh_helper, graphql_helper, None, tracer, context.workers,
+                                                                   mapping_store, failed_page_ids)
+    write_outputs(created_issue_numbers, updated_issue_numbers, [], tracer)
+    with open(os.environ.get('GITHUB_STEP_SUMMARY', 'github_step_summary.md'), 'w') as summary_file:
+        gh_helper.write_job_summary(summary_file, tracer)
+
+    if state:
+        if failed_page_ids:
+            # The plan doesn't know when the failed pages were edited, so the next sync reads from the old watermark
+            print(f"Keeping the watermark, {len(failed_page_ids)} issues failed.")
+        else:
+            state.set_watermark(database_id, plan.last_edited_time)
+        state.save()
+    if mapping_store is not None:
+        mapping_store.compact()
+
+
+def serve_notion_webhooks(stop: Optional[threading.Event] = None):
+    """Receives Notion webhooks and syncs the changed pages as they come in, until `stop` is set or the process ends.
+
+    Pages are kept in a durable queue, so pages received before a crash or restart are still synced.
+    """
+    database_id = os.getenv("INPUT_NOTIONDATABASE", "")
+    repository = os.getenv("GITHUB_REPOSITORY")
+    if not all([os.getenv("INPUT_NOTIONTOKEN"), os.getenv("INPUT_GITHUBTOKEN"), database_id, repository]):
+        raise EnvironmentError("Missing required environment variables. Please check your .env file.")
+
+    stop = stop or threading.Event()
+    tracer = reset_tracer()
+    context = create_sync_context(tracer)
+    page_queue = PageQueue(os.getenv("INPUT_QUEUEFILE", "").strip() or DEFAULT_QUEUE_FILE)
+    # Edits of a page within `settle` seconds are synced once
+    settle = get_float_input("WEBHOOKSETTLE", 2.0)
+    batch_size = max(get_int_input("WEBHOOKBATCHSIZE", 50), 1)
+
+    notion_helper = create_notion_helper(database_id, context)
+    # One snapshot of the existing issues serves all batches, issues created meanwhile are added to it
+    clients = create_repository_clients(repository, context)
+
+    server = WebhookServer(page_queue, os.getenv("INPUT_WEBHOOKHOST", "0.0.0.0"), get_int_input("WEBHOOKPORT", 8080),
+                           os.getenv("INPUT_WEBHOOKSECRET", "").strip() or None).start()
+    print(f"Receiving Notion webhooks at {server.url}, {len(page_queue)} pages queued.")
+    try:
+        while not stop.is_set():
+            pages = page_queue.take(batch_size, settle, timeout=POLL_TIMEOUT)
+            if not pages:
+                continue
 
-        graphql_helper = GraphQLHelper(gh_token)
-        prj = graphql_helper.query_prj(new_issue["project_number"]) or graphql_helper.query_prj(new_issue["project_number"], 'user')
+            # Only the queued pages are read, each with one request
+            page_ids = [page_id for page_id, _ in pages]
+            clients.gh_helper.reset()
+            # Related pages may have been renamed since the last batch
+            notion_helper.page_titles.clear()
+            try:
+                result = sync_repository(repository, [(notion_helper, notion_helper.iter_notion_issues_by_id(page_ids))], context, clients)
+            except Exception as e:
+                print(f"Failed to sync {len(pages)} Notion pages, retrying in {RETRY_DELAY} seconds. Error: {str(e)}. {tracer.roll_up()}.")
+                stop.wait(RETRY_DELAY)
+                continue
 
-        if not prj:
-            print(f"Cannot find a linked project with number {new_issue['project_number']}. Please link the correct project manually.")
+            page_queue.done(pages)
+            print(f"Synced {len(pages)} Notion pages. Created issues {result.created_issue_numbers}, "
+                  f"updated issues {result.updated_issue_numbers}. {tracer.roll_up()}.")
+            if context.state:
+                context.state.save()
+            if result.failed_page_ids:
+                # Pages whose issue failed go to the end of the queue, so they are retried without holding up newer pages
+                page_queue.put(result.failed_page_ids)
+                print(f"Retrying {len(result.failed_page_ids)} failed Notion pages in {RETRY_DELAY} seconds.")
+                stop.wait(RETRY_DELAY)
+    finally:
+        server.stop()
+        page_queue.compact()
+        if context.mapping_store is not None:
+            context.mapping_store.compact()
+
+
+def run_daemon(stop: Optional[threading.Event] = None):
+    """Syncs all routes every `pollInterval` seconds, until `stop` is set or the process ends.
+
+    The GitHub client, the repositories, the issue snapshots and the resolved projects stay in memory between cycles.
+    A cycle only reads the Notion entries edited since the last one and the issues updated since the last snapshot.
+    """
+    database_id = os.getenv("INPUT_NOTIONDATABASE", "")
+    repository = os.getenv("GITHUB_REPOSITORY")
+    routes = parse_routes(os.getenv("INPUT_ROUTES", ""), database_id, repository)
+    if not all([os.getenv("INPUT_NOTIONTOKEN"), os.getenv("INPUT_GITHUBTOKEN"), routes, repository]):
+        raise EnvironmentError("Missing required environment variables. Please check your .env file.")
+
+    stop = stop or threading.Event()
+    tracer = reset_tracer()
+    context = create_sync_context(tracer)
+    state, mapping_store = context.state, context.mapping_store
+    interval = max(get_float_input("POLLINTERVAL", DEFAULT_POLL_INTERVAL), 0.0)
+    max_issues = max(get_int_input("MAXINDEXEDISSUES", DEFAULT_MAX_INDEXED_ISSUES), 1)
+
+    # Schemas are checked once, every route keeps its helper and its watermark for all cycles
+    notion_helpers = [create_notion_helper(route.database_id, context, route.repository_property) for route in routes]
+    watermarks = [None if context.full_sync or not state else state.get_watermark(route.database_id) for route in routes]
+    clients: Dict[str, RepositoryClients] = {}
+
+    def read_route(route: Route) -> Tuple[NotionHelper, Iterable[NotionIssue]]:
+        position = routes.index(route)
+        notion_helper = notion_helpers[position]
+        filters = get_notion_filters() + list(route.filters)
+        issues = tracer.timed_iter("Notion read", notion_helper.iter_notion_issues(since=watermarks[position], filters=filters))
+        return notion_helper, prefetch(issues, READ_AHEAD)
+
+    print(f"Syncing {len(routes)} Notion databases every {interval} seconds.")
+    try:
+        while not stop.is_set():
+            started = time.monotonic()
+            try:
+                for repository_clients in clients.values():
+                    repository_clients.gh_helper.reset()
+                    refresh_issue_index(repository_clients, tracer)
+                for notion_helper in notion_helpers:
+                    # Bodies of unchanged pages are kept by the state file, the in-memory caches only serve one cycle
+                    notion_helper.page_cache.clear()
+                    notion_helper.page_titles.clear()
+                    notion_helper.failed_edited_time = None
+
+                results, failures, route_targets = sync_routes(routes, read_route, context, repository.split("/")[0], clients)
+                for database_id, watermark in synced_watermarks(route_targets, failures).items():
+                    for position, route in enumerate(routes):
+                        if route.database_id == database_id:
+                            watermarks[position] = watermark or watermarks[position]
+                    if state:
+                        state.set_watermark(database_id, watermark)
+                print(f"Synced {len(results)} repositories. "
+                      f"Created issues {[n for result in results.values() for n in result.created_issue_numbers]}, "
+                      f"updated issues {[n for result in results.values() for n in result.updated_issue_numbers]}.")
+                if state:
+                    state.save()
+                evict_issues(clients, context, max_issues)
+            except Exception as e:
+                print(f"Sync cycle failed, retrying in {interval} seconds. Error: {str(e)}")
+            # The trace of a cycle is summed up and dropped, so it doesn't grow with every cycle
+            print(f"Cycle trace: {tracer.roll_up()}.")
+
+            stop.wait(max(interval - (time.monotonic() - started), 0.0))
+    finally:
+        if mapping_store is not None:
+            mapping_store.compact()
+
+
+def refresh_issue_index(clients: RepositoryClients, tracer: Tracer):
+    """Reads the issues updated since the last snapshot into a loaded index, an index not loaded yet is read in full on first use."""
+    issue_index = clients.issue_index
+    if not issue_index.loaded:
+        return
+    synced_at = snapshot_time()
+    with tracer.phase("GitHub issue refresh"):
+        issue_index.refresh(clients.graphql_helper.iter_issues(since=issue_index.synced_at), synced_at)
+
+
+def evict_issues(clients: Dict[str, RepositoryClients], context: SyncContext, max_issues: int):
+    """Keeps at most `max_issues` issue records per repository.
+
+    Records of pages in the mapping store are evicted first, these pages are decided by the store.
+    If that isn't enough, the snapshot is dropped and taken again once it is needed.
+    """
+    mapping_store = context.mapping_store
+    for repository, repository_clients in list(clients.items()):
+        issue_index = repository_clients.issue_index
+        if not issue_index.loaded or len(issue_index.by_number) <= max_issues:
             continue
+        if mapping_store is not None:
+            issue_index.evict(len(issue_index.by_number) - max_issues, lambda issue: mapping_store.get(issue.notion_page_id) is not None)
+        if len(issue_index.by_number) > max_issues:
+            print(f"Dropping the snapshot of {len(issue_index.by_number)} issues of {repository}, it is taken again when needed.")
+            issue_index = create_issue_index(repository_clients.graphql_helper, context.tracer, context.state, context.full_sync)
+            clients[repository] = repository_clients._replace(issue_index=issue_index)
 
-        prj_item = graphql_helper.add_item_to_prj(prj['id'], issue.raw_data['node_id'])
-        if prj_item:
-            gh_helper.update_project_link_status(new_issue["title"], True)
-            print(f"Issue '{issue.title}' added to project '{prj['title']}' successfully.")
-    
+
+def write_outputs(created_issue_numbers: List[int], updated_issue_numbers: List[int], changed_issue_numbers: List[int], tracer: Tracer):
     if created_issue_numbers:
         with open(os.environ['GITHUB_OUTPUT'], 'a') as gh_out_file:
-            gh_out_file.write(f"issueNumbers={created_issue_numbers}")
+            gh_out_file.write(f"issueNumbers={created_issue_numbers}\n")
+    if updated_issue_numbers:
+        with open(os.environ['GITHUB_OUTPUT'], 'a') as gh_out_file:
+            gh_out_file.write(f"updatedIssueNumbers={updated_issue_numbers}\n")
+    if changed_issue_numbers:
+        with open(os.environ['GITHUB_OUTPUT'], 'a') as gh_out_file:
+            gh_out_file.write(f"stateChangedIssueNumbers={changed_issue_numbers}\n")
+
+    trace_file = os.getenv("INPUT_TRACEFILE", "")
+    if trace_file:
+        tracer.export(trace_file)
+        with open(os.environ['GITHUB_OUTPUT'], 'a') as gh_out_file:
+            gh_out_file.write(f"trace={trace_file}\n")
+
+
+def remember(issues: Iterable[NotionIssue], seen: List[NotionIssue]) -> Iterable[NotionIssue]:
+    for issue in issues:
+        seen.append(issue)
+        yield issue
+
+
+def remember_edited(issues: Iterable[NotionIssue], edited_times: Dict[str, str]) -> Iterable[NotionIssue]:
+    for issue in issues:
+        if issue.id and issue.last_edited_time:
+            edited_times[issue.id] = issue.last_edited_time
+        yield issue
 
+
+def get_rest_remaining(gh_helper: GitHubHelper) -> Optional[int]:
+    """Remaining REST quota, read from the last response, or with GET /rate_limit when there was none."""
+    try:
+        rest_remaining, _ = gh_helper.git.rate_limiting
+    except github.GithubException as e:
+        # GHES without rate limiting sends no quota and has no /rate_limit endpoint
+        print(f"Cannot read the remaining GitHub rate limit. Error: {str(e)}")
+        return None
+    return rest_remaining if isinstance(rest_remaining, int) and rest_remaining >= 0 else None
+
+
+def check_budget(plan: SyncPlan, gh_helper: GitHubHelper, graphql_url: str):
+    """Warns when applying `plan` needs more calls than remain. The run doesn't fail, its writes wait for the limit to reset."""
+    estimate = plan.estimate()
+    if estimate["rest_calls"]:
+        # The writes need the repository anyway, its response carries the quota
+        gh_helper.repo
+        estimate = plan.estimate(get_rest_remaining(gh_helper))
+    if estimate["rest_remaining"] is not None and estimate["rest_calls"] > estimate["rest_remaining"]:
+        print(f"Applying the plan needs {estimate['rest_calls']} GitHub REST calls, only {estimate['rest_remaining']} remain. "
+              "Issue writes will back off until the limit resets.")
+    if not get_rate_limiter().fits_budget(urlparse(graphql_url).hostname, estimate["graphql_calls"]):
+        # The rate limiter waits for the reset once the quota is used up
+        print(f"Linking the planned issues needs {estimate['graphql_calls']} GitHub GraphQL calls, more than the remaining rate limit. "
+              "Project links will wait for the limit to reset.")
+
+
+def write_plan(plan: SyncPlan, plan_file: str, gh_helper: GitHubHelper, graphql_url: str):
+    estimate = plan.estimate(get_rest_remaining(gh_helper), get_rate_limiter().get_remaining(urlparse(graphql_url).hostname))
+
+    plan.save(plan_file)
+    summary = plan.create_summary(estimate)
+    print(summary)
+    print(f"Plan written to '{plan_file}'. Apply it with mode 'apply'.")
+
+    with open(os.environ['GITHUB_OUTPUT'], 'a') as gh_out_file:
+        gh_out_file.write(f"plan={plan_file}\n")
     with open(os.environ.get('GITHUB_STEP_SUMMARY', 'github_step_summary.md'), 'w') as summary_file:
-        summary_file.write(gh_helper.create_job_summary())
+        summary_file.write(summary)
+
 
 if __name__ == '__main__':
     sync_notion_to_github()
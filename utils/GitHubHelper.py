@@ -1,72 +1,589 @@
+import importlib
+import io
 import os
-from typing import Dict, List, Optional, Tuple
+import random
+import re
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from typing import (TYPE_CHECKING, Any, Callable, Dict, Iterable, Iterator,
+                    List, NamedTuple, Optional, TextIO, Tuple)
+
+from urllib.parse import urlparse
 
-import github
 import requests
-from github.Issue import Issue
-from github.PaginatedList import PaginatedList
+
+from utils.HttpSession import REQUEST_TIMEOUT, get_pool_size, get_session
+from utils.RateLimiter import RateLimiter, get_rate_limiter
+from utils.Tracer import Tracer, get_tracer
+
+if TYPE_CHECKING:
+    from github.Issue import Issue
+    from github.Milestone import Milestone
+    from github.PaginatedList import PaginatedList
+
+
+class _LazyModule:
+    """Imports a module on first attribute access."""
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(importlib.import_module(self.name), attr)
+
+
+# PyGithub is only needed for REST writes, runs that only read through GraphQL skip its import
+github = _LazyModule("github")
+
+NOTION_MARKER = "<!-- notion-page-id: {} -->"
+NOTION_HASH_MARKER = "<!-- notion-page-id: {} hash: {} -->"
+NOTION_MARKER_PATTERN = re.compile(r"<!-- notion-page-id: ([\w-]+)(?: hash: (\w+))? -->")
+# Snapshots overlap by this many seconds, so issues changed while a snapshot is taken or behind a skewed clock are read again
+SNAPSHOT_OVERLAP = 60
+# Limits of the issues API, assignees and labels beyond them fail the whole request
+MAX_ASSIGNEES = 10
+MAX_LABEL_LENGTH = 50
+
+
+def add_notion_marker(body: str, page_id: Optional[str], content_hash: Optional[str] = None) -> str:
+    if not page_id:
+        return body
+    marker = NOTION_HASH_MARKER.format(page_id, content_hash) if content_hash else NOTION_MARKER.format(page_id)
+    return f"{body}\n\n{marker}" if body else marker
+
+
+def get_notion_page_id(body: Optional[str]) -> Optional[str]:
+    if not isinstance(body, str):
+        return None
+    match = NOTION_MARKER_PATTERN.search(body)
+    return match.group(1) if match else None
+
+
+def get_notion_hash(body: Optional[str]) -> Optional[str]:
+    if not isinstance(body, str):
+        return None
+    match = NOTION_MARKER_PATTERN.search(body)
+    return match.group(2) if match else None
+
+
+def normalize_title(title: str) -> str:
+    return " ".join(title.split()).casefold()
+
+
+def snapshot_time(at: Optional[float] = None) -> str:
+    """Time from which issues updated later are missing in a snapshot taken at `at` (now by default), for GraphQL's `since` filter."""
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime((time.time() if at is None else at) - SNAPSHOT_OVERLAP))
+
+
+class IssueRecord(NamedTuple):
+    """Compact snapshot of an existing issue, only holding what deduplication needs."""
+    number: int
+    title: str
+    id: str
+    state: str
+    notion_page_id: Optional[str] = None
+    content_hash: Optional[str] = None
+
+
+@dataclass(slots=True)
+class SyncResult:
+    """Summary row of one synced Notion entry, the project link is set once the linker is done."""
+    title: str
+    url: str = ""
+    created: bool = False
+    updated: bool = False
+    linked: bool = False
+    page_id: Optional[str] = None
+
+
+@dataclass(slots=True)
+class ProjectRef:
+    """Project an issue is added to, as resolved from its number."""
+    id: str
+    title: str
+
+
+class IssueIndex:
+    """Lookup of existing issues by normalized title and by Notion page id marker.
+
+    With a `loader`, the issues are only fetched on first use, so runs that never need the snapshot skip it.
+    `synced_at` is the time the loaded snapshot is complete from, later changes are read with `refresh`.
+    """
+
+    def __init__(self, issues: Iterable[IssueRecord] = (), loader: Optional[Callable[[], Iterable[IssueRecord]]] = None):
+        self.by_title: Dict[str, IssueRecord] = {}
+        self.by_page_id: Dict[str, IssueRecord] = {}
+        self.by_number: Dict[int, IssueRecord] = {}
+        self.loader = loader
+        self.synced_at: Optional[str] = None
+        for issue in issues:
+            self.add(issue)
+
+    @property
+    def loaded(self) -> bool:
+        return self.loader is None
+
+    def _load(self):
+        if self.loader is not None:
+            loader, self.loader = self.loader, None
+            if self.synced_at is None:
+                self.synced_at = snapshot_time()
+            for issue in loader():
+                self.add(issue)
+
+    def prefetch(self):
+        """Starts loading the issues on a background thread, the first lookup waits for them."""
+        if self.loader is None:
+            return
+        loader = self.loader
+        self.synced_at = snapshot_time()
+        future: Future = Future()
+
+        def load():
+            try:
+                future.set_result(list(loader()))
+            except BaseException as e:
+                future.set_exception(e)
+
+        threading.Thread(target=load, daemon=True).start()
+        self.loader = future.result
+
+    def __len__(self) -> int:
+        self._load()
+        return len(self.by_title)
+
+    def add(self, issue: IssueRecord):
+        self._load()
+        self.by_title.setdefault(normalize_title(issue.title), issue)
+        if issue.notion_page_id:
+            self.by_page_id.setdefault(issue.notion_page_id, issue)
+        if issue.number:
+            self.by_number[issue.number] = issue
+
+    def discard(self, issue: IssueRecord):
+        self._load()
+        title = normalize_title(issue.title)
+        if self.by_title.get(title) is issue:
+            del self.by_title[title]
+        if issue.notion_page_id and self.by_page_id.get(issue.notion_page_id) is issue:
+            del self.by_page_id[issue.notion_page_id]
+        if issue.number and self.by_number.get(issue.number) is issue:
+            del self.by_number[issue.number]
+
+    def replace(self, old: IssueRecord, new: IssueRecord):
+        self.discard(old)
+        self.add(new)
+
+    def refresh(self, issues: Iterable[IssueRecord], synced_at: str):
+        """Replaces the records of changed issues and adds new ones, the snapshot is then complete from `synced_at`."""
+        self._load()
+        for issue in issues:
+            old = self.by_number.get(issue.number)
+            if old is not None:
+                self.discard(old)
+            self.add(issue)
+        self.synced_at = synced_at
+
+    def evict(self, count: int, evictable: Callable[[IssueRecord], bool]) -> int:
+        """Drops up to `count` records that are `evictable`, lowest issue numbers first. Returns the number of dropped records."""
+        self._load()
+        dropped = 0
+        for number in sorted(self.by_number):
+            if dropped >= count:
+                break
+            issue = self.by_number[number]
+            if evictable(issue):
+                self.discard(issue)
+                dropped += 1
+        return dropped
+
+    def find_by_page_id(self, page_id: Optional[str]) -> Optional[IssueRecord]:
+        self._load()
+        return self.by_page_id.get(page_id) if page_id else None
+
+    def find(self, title: str, page_id: Optional[str] = None) -> Optional[IssueRecord]:
+        self._load()
+        if page_id and page_id in self.by_page_id:
+            return self.by_page_id[page_id]
+        return self.by_title.get(normalize_title(title))
+
+
+class WriteThrottle:
+    """Pause shared by all workers once GitHub signals a (secondary) rate limit."""
+
+    def __init__(self, base_delay: float = 1.0, max_delay: float = 60.0):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.delay = base_delay
+        self.pause_until = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            remaining = self.pause_until - time.monotonic()
+        if remaining > 0:
+            time.sleep(remaining)
+
+    def backoff(self, retry_after: Optional[float] = None):
+        with self.lock:
+            delay = retry_after if retry_after is not None else self.delay * (1 + random.random())
+            self.delay = min(self.delay * 2, self.max_delay)
+            self.pause_until = max(self.pause_until, time.monotonic() + delay)
+
+    def success(self):
+        with self.lock:
+            self.delay = max(self.base_delay, self.delay / 2)
+
+
+def _get_retry_after(e: "github.GithubException") -> Optional[float]:
+    headers = e.headers or {}
+    retry_after = headers.get("Retry-After") or headers.get("retry-after")
+    try:
+        return float(retry_after) if retry_after is not None else None
+    except ValueError:
+        return None
+
+
+def _get_rate_limit(headers: Optional[Dict[str, Any]]) -> Dict[str, str]:
+    """Remaining quota from response headers, empty when GitHub doesn't send it, e.g. GHES without rate limiting."""
+    headers = {str(key).lower(): value for key, value in (headers or {}).items()}
+    remaining = headers.get("x-ratelimit-remaining")
+    return {"X-RateLimit-Remaining": str(remaining)} if remaining is not None else {}
+
+
+def _is_rate_limited(e: "github.GithubException") -> bool:
+    if e.status == 429:
+        return True
+    return e.status == 403 and (_get_retry_after(e) is not None or "rate limit" in str(e.data).lower())
+
+
+class GitHubClient:
+    """PyGithub client that is created, and PyGithub imported, on first use."""
+
+    def __init__(self, auth_token: str, workers: int = 1, base_url: str = "https://api.github.com", write_delay: float = 1.0):
+        self.auth_token = auth_token
+        self.workers = workers
+        self.base_url = base_url
+        self.write_delay = write_delay
+        self.client: Optional["github.Github"] = None
+        self.lock = threading.Lock()
+
+    def get(self) -> "github.Github":
+        with self.lock:
+            if self.client is None:
+                # PyGithub spaces requests itself, write_delay is the gap it keeps between content-creating requests
+                self.client = github.Github(
+                    self.auth_token,
+                    base_url=self.base_url,
+                    pool_size=max(self.workers, get_pool_size()),
+                    seconds_between_requests=min(0.25, self.write_delay),
+                    seconds_between_writes=self.write_delay
+                )
+            return self.client
 
 
 class GitHubHelper:
-    def __init__(self, auth_token: str, repo_name: str = os.environ.get("GITHUB_REPOSITORY")):
-        self.git = github.Github(auth_token)
-        self.repo = self.git.get_repo(repo_name)
-        self.org, self.project = self.repo.full_name.split('/')
-        self.summary_data: List[Tuple[str, str, bool, bool]] = []
-
-    def get_issues(self) -> PaginatedList[Issue]:
-        return self.repo.get_issues()
-    
+    def __init__(self, auth_token: str, repo_name: str = os.environ.get("GITHUB_REPOSITORY"), workers: int = 1,
+                 base_url: str = "https://api.github.com", write_delay: float = 1.0, git: Optional[GitHubClient] = None,
+                 throttle: Optional[WriteThrottle] = None):
+        # Helpers of several repositories share the client and the throttle, so writes of one token are spaced together
+        self.client = git or GitHubClient(auth_token, workers, base_url, write_delay)
+        self.repo_name = repo_name
+        self.org, self.project = repo_name.split('/')
+        # REST calls are traced per host like the paced requests, e.g. a GHES host instead of api.github.com
+        self.rest_host = f"{urlparse(self.client.base_url).hostname} (REST)"
+        self._repo = None
+        self.repo_lock = threading.Lock()
+        self.summary_data: List[SyncResult] = []
+        self.summary_by_page_id: Dict[str, SyncResult] = {}
+        self.throttle = throttle or WriteThrottle()
+        self.milestones: Optional[Dict[str, "Milestone"]] = None
+        self.milestones_lock = threading.Lock()
+        # Assignable logins by their lower-case form, None when they couldn't be listed
+        self.assignees: Optional[Dict[str, str]] = None
+        self.assignees_listed = False
+        self.assignees_lock = threading.Lock()
+
+    @property
+    def git(self) -> "github.Github":
+        return self.client.get()
+
+    @property
+    def repo(self) -> "github.Repository.Repository":
+        # The repository is loaded with the first REST call that needs it
+        with self.repo_lock:
+            if self._repo is None:
+                with self._trace("GET /repos/{owner}/{repo}") as results:
+                    self._repo = self.git.get_repo(self.repo_name)
+                    results.append(self._repo)
+            return self._repo
+
+    @contextmanager
+    def _trace(self, endpoint: str, retries: int = 0, status: int = 200):
+        # PyGithub doesn't expose its responses, so REST calls are traced around the PyGithub call.
+        # Callers append the returned object to the yielded list, the quota is read from its headers without another request.
+        start = time.perf_counter()
+        results = []
+        headers = None
+        try:
+            yield results
+        except github.GithubException as e:
+            status = e.status
+            headers = e.headers
+            raise
+        finally:
+            if headers is None and results:
+                # The private attribute, as `raw_headers` would fetch a lazy object
+                headers = getattr(results[-1], "_headers", None)
+            rate_limit = _get_rate_limit(headers if isinstance(headers, dict) else None)
+            get_tracer().record(self.rest_host, endpoint, time.perf_counter() - start, status, retries, rate_limit)
+
+    def get_issues(self, state: str = "open") -> "PaginatedList[Issue]":
+        return self.repo.get_issues(state=state)
+
     def get_organization(self) -> str:
         return self.org
     
     def get_project(self) -> str:
         return self.project
     
-    def create_issue(self, title: str, body: str, assignees: List[str] = [], labels: List[str] = []) -> Optional[Issue]:
+    def reset(self):
+        """Starts a new summary and lists the milestones and assignees again on next use, the repository stays loaded."""
+        self.summary_data = []
+        self.summary_by_page_id = {}
+        with self.milestones_lock:
+            self.milestones = None
+        with self.assignees_lock:
+            self.assignees = None
+            self.assignees_listed = False
+
+    def get_milestone(self, title: str) -> Optional["Milestone"]:
+        # All milestones are listed once per run
+        with self.milestones_lock:
+            if self.milestones is None:
+                with self._trace("GET /repos/{owner}/{repo}/milestones"):
+                    self.milestones = {m.title: m for m in self.repo.get_milestones(state="all")}
+        milestone = self.milestones.get(title)
+        if not milestone:
+            print(f"Cannot find milestone '{title}'. Please create it on GitHub.")
+        return milestone
+
+    def get_assignees(self) -> Optional[Dict[str, str]]:
+        # All assignable users are listed once per run
+        with self.assignees_lock:
+            if not self.assignees_listed:
+                self.assignees_listed = True
+                try:
+                    with self._trace("GET /repos/{owner}/{repo}/assignees"):
+                        self.assignees = {user.login.lower(): user.login for user in self.repo.get_assignees()}
+                except github.GithubException as e:
+                    print(f"Cannot list the assignees of {self.repo_name}, assignees are not checked. Error: {str(e)}")
+            return self.assignees
+
+    def filter_assignees(self, title: str, assignees: List[str]) -> List[str]:
+        """Drops users that can't be assigned in the repository, instead of failing the whole request."""
+        if not assignees:
+            return []
+        known = self.get_assignees()
+        logins = [login.strip().lstrip("@") for login in assignees]
+        if known is None:
+            valid = [login for login in logins if login]
+        else:
+            valid = [known[login.lower()] for login in logins if login.lower() in known]
+            dropped = [login for login in logins if login.lower() not in known]
+            if dropped:
+                print(f"Cannot assign {', '.join(dropped)} to issue '{title}', they aren't assignable in {self.repo_name}.")
+        valid = list(dict.fromkeys(valid))
+        if len(valid) > MAX_ASSIGNEES:
+            print(f"Issue '{title}' has {len(valid)} assignees, only the first {MAX_ASSIGNEES} are assigned.")
+        return valid[:MAX_ASSIGNEES]
+
+    def filter_labels(self, title: str, labels: List[str]) -> List[str]:
+        """Drops empty, too long and duplicate labels. Labels that don't exist yet are created by GitHub."""
+        valid = {}
+        for label in labels:
+            label = label.strip()
+            if len(label) > MAX_LABEL_LENGTH:
+                print(f"Label '{label}' of issue '{title}' is longer than {MAX_LABEL_LENGTH} characters and left out.")
+            elif label:
+                valid.setdefault(label.lower(), label)
+        return list(valid.values())
+
+    def _get_milestone_args(self, title: Optional[str]) -> Dict[str, "Milestone"]:
+        milestone = self.get_milestone(title) if title else None
+        return {"milestone": milestone} if milestone else {}
+
+    def _write(self, endpoint: str, status: int, call: Callable[[], Any], retries: int) -> Any:
+        """Runs a content-creating call, retrying it when GitHub signals a (secondary) rate limit."""
+        for attempt in range(retries + 1):
+            self.throttle.wait()
+            try:
+                with self._trace(endpoint, attempt, status) as results:
+                    result = call()
+                    results.append(result)
+                self.throttle.success()
+                return result
+            except github.GithubException as e:
+                if attempt < retries and _is_rate_limited(e):
+                    print(f"Rate limited by GitHub on {endpoint}. Retrying.")
+                    self.throttle.backoff(_get_retry_after(e))
+                    continue
+                raise
+
+    def create_issue(self, title: str, body: str, assignees: List[str] = [], labels: List[str] = [],
+                     summary: bool = True, retries: int = 3, milestone: Optional[str] = None) -> Optional["Issue"]:
+        milestone_args = self._get_milestone_args(milestone)
+        assignees = self.filter_assignees(title, assignees)
+        labels = self.filter_labels(title, labels)
         try:
-            issue = self.repo.create_issue(
-                title=title,
-                body=body,
-                assignees=assignees,
-                labels=labels
+            issue = self._write(
+                "POST /repos/{owner}/{repo}/issues",
+                201,
+                lambda: self.repo.create_issue(
+                    title=title,
+                    body=body,
+                    assignees=assignees,
+                    labels=labels,
+                    **milestone_args
+                ),
+                retries
             )
             print(f"Created issue '{title}'.")
-            self.summary_data.append((title, issue.html_url, True, False))
+            if summary:
+                self.add_result(SyncResult(title, issue.html_url, created=True))
             return issue
         except github.GithubException as e:
             print(f"Failed to create issue '{title}'. Error: {str(e)}")
-            self.summary_data.append((title, "", False, False))
+            if summary:
+                self.add_result(SyncResult(title))
             return None
 
-    def update_project_link_status(self, title: str, linked: bool):
-        for i, (t, url, created, _) in enumerate(self.summary_data):
-            if t == title:
-                self.summary_data[i] = (t, url, created, linked)
-                break
+    def _get_lazy_issue(self, number: int) -> "Issue":
+        # A lazy issue object sends a PATCH without fetching the issue first
+        return github.Issue.Issue(self.repo._requester, {}, {"number": number, "url": f"{self.repo.url}/issues/{number}"}, completed=False)
 
-    def create_job_summary(self) -> str:
-        summary = "# Notion to GitHub Sync Summary\n\n"
-        summary += "| Notion Issue Title | Created | Project Linked |\n"
-        summary += "|--------------------|---------|----------------|\n"
+    def update_issue(self, number: int, title: str, body: str, assignees: List[str] = [], labels: List[str] = [],
+                     retries: int = 3, milestone: Optional[str] = None) -> bool:
+        issue = self._get_lazy_issue(number)
+        milestone_args = self._get_milestone_args(milestone)
+        assignees = self.filter_assignees(title, assignees)
+        labels = self.filter_labels(title, labels)
+        try:
+            self._write(
+                "PATCH /repos/{owner}/{repo}/issues/{number}",
+                200,
+                lambda: issue.edit(title=title, body=body, assignees=assignees, labels=labels, **milestone_args),
+                retries
+            )
+            print(f"Updated issue #{number} '{title}'.")
+            return True
+        except github.GithubException as e:
+            print(f"Failed to update issue #{number} '{title}'. Error: {str(e)}")
+            return False
 
-        for title, url, created, linked in self.summary_data:
-            created_emoji = "✅" if created else "❌"
-            linked_emoji = "✅" if linked else "❌"
-            issue_link = f"[{title}]({url})" if url else f"{title}"
-            summary += f"| {issue_link} | {created_emoji} | {linked_emoji} |\n"
-        
-        return summary
+    def set_issue_state(self, number: int, state: str, retries: int = 3) -> bool:
+        issue = self._get_lazy_issue(number)
+        try:
+            self._write(
+                "PATCH /repos/{owner}/{repo}/issues/{number}",
+                200,
+                lambda: issue.edit(state=state),
+                retries
+            )
+            print(f"{'Closed' if state == 'closed' else 'Reopened'} issue #{number}.")
+            return True
+        except github.GithubException as e:
+            print(f"Failed to set the state of issue #{number} to {state}. Error: {str(e)}")
+            return False
+
+    def get_issue_url(self, number: int) -> str:
+        return f"{self.repo.html_url}/issues/{number}"
+
+    def add_result(self, result: SyncResult):
+        self.summary_data.append(result)
+        if result.page_id:
+            self.summary_by_page_id[result.page_id] = result
+
+    def update_project_link_status(self, page_id: str, linked: bool):
+        result = self.summary_by_page_id.get(page_id)
+        if result is not None:
+            result.linked = linked
+
+    def write_job_summary(self, summary_file: TextIO, tracer: Optional[Tracer] = None, heading: str = "# Notion to GitHub Sync Summary"):
+        """Writes the summary row by row, so large runs don't build it in memory first."""
+        summary_file.write(f"{heading}\n\n")
+        summary_file.write("| Notion Issue Title | Created | Project Linked |\n")
+        summary_file.write("|--------------------|---------|----------------|\n")
+
+        for result in self.summary_data:
+            # Issues updated in place are marked apart from created ones
+            created_emoji = "🔄" if result.updated else "✅" if result.created else "❌"
+            linked_emoji = "✅" if result.linked else "❌"
+            issue_link = f"[{result.title}]({result.url})" if result.url else result.title
+            summary_file.write(f"| {issue_link} | {created_emoji} | {linked_emoji} |\n")
+
+        if tracer:
+            summary_file.write("\n" + tracer.create_summary())
+
+    def create_job_summary(self, tracer: Optional[Tracer] = None, heading: str = "# Notion to GitHub Sync Summary") -> str:
+        summary = io.StringIO()
+        self.write_job_summary(summary, tracer, heading)
+        return summary.getvalue()
 
 
 class GraphQLHelper:
-    def __init__(self, auth: str, repo: str = os.environ.get("GITHUB_REPOSITORY"), graphql_url: str = "https://api.github.com/graphql"):
+    def __init__(self, auth: str, repo: str = os.environ.get("GITHUB_REPOSITORY"), graphql_url: str = "https://api.github.com/graphql",
+                 session: Optional[requests.Session] = None, rate_limiter: Optional[RateLimiter] = None):
         self.auth = auth
         self.repo = repo
         self.url = graphql_url
         self.headers = {"Authorization": f"Bearer {self.auth}"}
+        self.session = session or get_session()
+        self.rate_limiter = rate_limiter or get_rate_limiter()
+
+    def iter_issues(self, page_size: int = 100, since: Optional[str] = None) -> Iterator[IssueRecord]:
+        """Lists all issues, or with `since` only the issues updated at or after that time."""
+        owner, name = self.repo.split('/')
+        query = '''
+        query($owner: String!, $name: String!, $first: Int!, $after: String, $since: DateTime) {
+            repository(owner: $owner, name: $name) {
+                issues(first: $first, after: $after, states: [OPEN, CLOSED], filterBy: {since: $since}) {
+                    pageInfo {
+                        hasNextPage
+                        endCursor
+                    }
+                    nodes {
+                        number
+                        title
+                        id
+                        state
+                        body
+                    }
+                }
+            }
+        }
+        '''
+
+        variables = {"owner": owner, "name": name, "first": page_size, "after": None, "since": since}
+        while True:
+            response = self._make_request(query, variables)
+            try:
+                issues = response['data']['repository']['issues']
+            except (KeyError, TypeError):
+                raise RuntimeError(f"Failed to load issues of '{self.repo}': {response.get('errors')}")
+
+            for node in issues['nodes']:
+                yield IssueRecord(node['number'], node['title'], node['id'], node['state'],
+                                  get_notion_page_id(node['body']), get_notion_hash(node['body']))
 
-    def query_prj(self, number: int, scope: str = 'organization') -> Optional[Dict[str, str]]:
+            if not issues['pageInfo']['hasNextPage']:
+                break
+            variables = {**variables, "after": issues['pageInfo']['endCursor']}
+
+    def query_prj(self, number: int, scope: str = 'organization') -> Optional[ProjectRef]:
         org = self.repo.split('/')[0]
         
         query = f'''
@@ -84,13 +601,45 @@ class GraphQLHelper:
         
         try:
             project_data = response['data'][scope]['projectV2']
-            return {
-                "id": project_data['id'],
-                "title": project_data['title']
-            }
+            return ProjectRef(project_data['id'], project_data['title'])
         except (KeyError, TypeError):
             return None
     
+    def query_prjs(self, numbers: Iterable[int], scopes: Iterable[str] = ('organization', 'user')) -> Dict[Tuple[str, int], Optional[ProjectRef]]:
+        """Projects by scope and number, None for those that don't exist. Projects that couldn't be resolved are left out."""
+        org = self.repo.split('/')[0]
+        numbers = sorted(set(numbers))
+        scopes = list(scopes)
+        if not numbers or not scopes:
+            return {}
+
+        # One aliased document resolves every project number for every scope at once
+        fields = "\n".join(f"p{number}: projectV2(number: {number}) {{ id title }}" for number in numbers)
+        selections = "\n".join(f'{scope}(login: "{org}") {{ {fields} }}' for scope in scopes)
+        response = self._make_request(f"query {{ {selections} }}")
+
+        # Only NOT_FOUND errors of a scope or an alias are misses. Other errors, e.g. RATE_LIMITED or INSUFFICIENT_SCOPES,
+        # leave the projects unresolved, so they aren't remembered as missing.
+        errors = response.get('errors') or []
+        not_found = {tuple(error.get('path') or ()) for error in errors if error.get('type') == 'NOT_FOUND'}
+        other_errors = [error for error in errors if error.get('type') != 'NOT_FOUND']
+        if other_errors:
+            print(f"Failed to resolve the projects {numbers} of '{org}'. Errors: {[error.get('message') for error in other_errors]}")
+        if any(not error.get('path') for error in other_errors):
+            return {}
+
+        data = response.get('data') or {}
+        projects = {}
+        for scope in scopes:
+            scope_data = data.get(scope) or {}
+            for number in numbers:
+                project_data = scope_data.get(f"p{number}")
+                if project_data:
+                    projects[(scope, number)] = ProjectRef(project_data['id'], project_data['title'])
+                elif (scope,) in not_found or (scope, f"p{number}") in not_found:
+                    projects[(scope, number)] = None
+        return projects
+
     def add_item_to_prj(self, prj_id: str, item_id: str) -> Optional[str]:
         mutation = f'''
         mutation {{
@@ -109,8 +658,103 @@ class GraphQLHelper:
         except (KeyError, TypeError):
             return None
         
-    def _make_request(self, query: str) -> Dict:
+    def add_items_to_prj(self, items: List[Tuple[str, str]], chunk_size: int = 25) -> List[Tuple[Optional[str], Optional[str]]]:
+        """Adds (project id, content id) pairs with aliased mutations and returns (item id, error) per pair."""
+        results: List[Tuple[Optional[str], Optional[str]]] = []
+        for start in range(0, len(items), chunk_size):
+            chunk = items[start:start + chunk_size]
+            mutations = "\n".join(
+                f'i{i}: addProjectV2ItemById(input: {{projectId: "{prj_id}", contentId: "{item_id}"}}) {{ item {{ id }} }}'
+                for i, (prj_id, item_id) in enumerate(chunk)
+            )
+            response = self._make_request(f"mutation {{ {mutations} }}")
+
+            errors = {}
+            for error in response.get('errors') or []:
+                path = error.get('path') or []
+                if path:
+                    errors[path[0]] = error.get('message')
+
+            data = response.get('data') or {}
+            for i in range(len(chunk)):
+                alias = f"i{i}"
+                try:
+                    results.append((data[alias]['item']['id'], None))
+                except (KeyError, TypeError):
+                    results.append((None, errors.get(alias, "No project item returned")))
+        return results
+
+    def _make_request(self, query: str, variables: Optional[Dict] = None) -> Dict:
         payload = {"query": query}
-        response = requests.post(self.url, json=payload, headers=self.headers)
+        if variables:
+            payload["variables"] = variables
+        response = self.rate_limiter.call(
+            self.url,
+            lambda: self.session.post(self.url, json=payload, headers=self.headers, timeout=REQUEST_TIMEOUT),
+            "POST /graphql"
+        )
         response.raise_for_status()
         return response.json()
+
+
+class ProjectResolver:
+    """Resolves project numbers to projects once per run, remembering misses and the matching scope."""
+
+    SCOPES = ('organization', 'user')
+
+    def __init__(self, graphql_helper: GraphQLHelper, state: Optional[Any] = None, ttl: int = 24 * 60 * 60,
+                 cache: Optional[Dict[Tuple[str, int, str], Tuple[Optional[ProjectRef], float]]] = None):
+        self.graphql_helper = graphql_helper
+        self.owner = graphql_helper.repo.split('/')[0]
+        self.state = state
+        self.ttl = ttl
+        # Keyed by owner, so resolvers of repositories with the same owner can share one cache. Entries keep their expiry,
+        # a cache shared by the cycles of a long-running process sees renamed, created or deleted projects after `ttl`.
+        self.cache: Dict[Tuple[str, int, str], Tuple[Optional[ProjectRef], float]] = cache if cache is not None else {}
+
+    def _load(self, number: int, scope: str) -> bool:
+        key = (self.owner, number, scope)
+        now = time.time()
+        if key in self.cache and self.cache[key][1] >= now:
+            return True
+        if self.state is None:
+            return False
+
+        cached = self.state.get_project(self.owner, number, scope)
+        if cached is None or cached["expires"] < now:
+            return False
+        self.cache[key] = (ProjectRef(**cached["project"]) if cached["project"] else None, cached["expires"])
+        return True
+
+    def prefetch(self, numbers: Iterable[Any]):
+        numbers = {n for n in map(_to_project_number, numbers) if n is not None}
+        missing = sorted(n for n in numbers if not all(self._load(n, scope) for scope in self.SCOPES))
+        if not missing:
+            return
+
+        expires = time.time() + self.ttl
+        # Projects left out after an error are queried again on the next lookup
+        for (scope, number), project in self.graphql_helper.query_prjs(missing, self.SCOPES).items():
+            self.cache[(self.owner, number, scope)] = (project, expires)
+            if self.state is not None:
+                self.state.set_project(self.owner, number, scope, asdict(project) if project else None, expires)
+
+    def resolve(self, number: Any) -> Optional[ProjectRef]:
+        number = _to_project_number(number)
+        if number is None:
+            return None
+
+        self.prefetch([number])
+        for scope in self.SCOPES:
+            project, _ = self.cache.get((self.owner, number, scope), (None, 0))
+            if project:
+                return project
+        return None
+
+
+def _to_project_number(number: Any) -> Optional[int]:
+    try:
+        return int(number)
+    except (TypeError, ValueError):
+        return None
+
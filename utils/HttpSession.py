@@ -0,0 +1,49 @@
+import threading
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_POOL_SIZE = 10
+# Seconds to connect and to wait for a response, a stalled connection fails and is retried instead of hanging the sync
+REQUEST_TIMEOUT = (10, 60)
+
+_session: Optional[requests.Session] = None
+_pool_size = DEFAULT_POOL_SIZE
+_lock = threading.Lock()
+
+
+def create_session(pool_size: int = DEFAULT_POOL_SIZE) -> requests.Session:
+    """Creates a keep-alive session with a connection pool of `pool_size` connections per host."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({
+        "Accept-Encoding": "gzip, deflate",
+        "Connection": "keep-alive"
+    })
+    return session
+
+
+def configure_session(pool_size: int = DEFAULT_POOL_SIZE):
+    """Sets the pool size of the shared session. Takes effect for the next get_session() call."""
+    global _session, _pool_size
+    with _lock:
+        if _session is not None and pool_size != _pool_size:
+            _session.close()
+            _session = None
+        _pool_size = pool_size
+
+
+def get_pool_size() -> int:
+    return _pool_size
+
+
+def get_session() -> requests.Session:
+    """Returns the session shared by all helpers of a run, so connections are reused across calls."""
+    global _session
+    with _lock:
+        if _session is None:
+            _session = create_session(_pool_size)
+        return _session
@@ -0,0 +1,90 @@
+import hashlib
+import json
+import os
+import threading
+from dataclasses import asdict
+from typing import Any, Dict, Iterator, Optional
+
+from utils.PropertyMapping import NotionIssue
+
+HASHED_FIELDS = ["title", "description", "assignees", "labels", "project_number"]
+OPTIONAL_HASHED_FIELDS = ["milestone"]
+
+
+def content_hash(issue: NotionIssue) -> str:
+    """Stable hash of the issue fields read from Notion."""
+    fields = asdict(issue)
+    content = {field: fields[field] for field in HASHED_FIELDS}
+    # Optional fields only count once set, so mapping them doesn't change the hash of every issue
+    content.update({field: fields[field] for field in OPTIONAL_HASHED_FIELDS if fields[field]})
+    data = json.dumps(content, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(data.encode()).hexdigest()[:16]
+
+
+class MappingStore:
+    """Maps Notion page ids to their GitHub issues, stored as JSON lines that survive between workflow runs.
+
+    Every change is appended as one line and flushed right away; later lines win when the file is read.
+    """
+
+    FIELDS = ["number", "node_id", "project_item_id", "hash", "state", "repository"]
+
+    def __init__(self, path: str):
+        self.path = path
+        self.records: Dict[str, Dict[str, Any]] = {}
+        self.lock = threading.Lock()
+        self.appended = 0
+
+        if os.path.exists(self.path):
+            with open(self.path) as mapping_file:
+                for line in mapping_file:
+                    if not line.strip():
+                        continue
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # A line cut off by a crash
+                    self.records.setdefault(entry.pop("page_id"), {}).update(entry)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self.records))
+
+    def get(self, page_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        if not page_id:
+            return None
+        with self.lock:
+            record = self.records.get(page_id)
+            return dict(record) if record else None
+
+    def put(self, page_id: Optional[str], **fields: Any):
+        if not page_id:
+            return
+        unknown = set(fields) - set(self.FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown mapping fields {sorted(unknown)}.")
+
+        with self.lock:
+            self.records.setdefault(page_id, {}).update(fields)
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a") as mapping_file:
+                mapping_file.write(json.dumps({"page_id": page_id, **fields}) + "\n")
+                mapping_file.flush()
+                os.fsync(mapping_file.fileno())
+            self.appended += 1
+
+    def compact(self):
+        """Rewrites the file with one line per page."""
+        with self.lock:
+            if not self.appended:
+                return
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as mapping_file:
+                for page_id, record in self.records.items():
+                    mapping_file.write(json.dumps({"page_id": page_id, **record}) + "\n")
+            os.replace(tmp_path, self.path)
+            self.appended = 0
@@ -1,10 +1,40 @@
-from typing import Any, List, Optional, Union
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
 import requests
 
+from utils.HttpSession import REQUEST_TIMEOUT, get_session
+from utils.NotionMarkdown import (blocks_to_markdown, rich_text_to_markdown,
+                                  rich_text_to_plain_text)
+from utils.PropertyMapping import NotionIssue, PropertyMapping
+from utils.RateLimiter import RateLimiter, get_rate_limiter
+from utils.SyncState import SyncState
+from utils.UserMapping import UserMapping
+
+# Pages whose related pages are read together, one page of a database query
+RELATION_BATCH_SIZE = 100
+# Seconds the watermark stays before the start of a query, for the clock skew between Notion and the runner
+WATERMARK_SKEW = 60
+
+
+def page_title(page: dict) -> str:
+    """Plain text of the title property of a page."""
+    for prop in page.get("properties", {}).values():
+        if prop.get("type") == "title":
+            return rich_text_to_plain_text(prop["title"])
+    return ""
+
 
 class NotionHelper:
-    def __init__(self, notion_token: str, database_id: str):
+    def __init__(self, notion_token: str, database_id: str, session: Optional[requests.Session] = None,
+                 rate_limiter: Optional[RateLimiter] = None, api_url: str = "https://api.notion.com/v1",
+                 status_property: Optional[str] = None, url_property: Optional[str] = None,
+                 page_body: bool = False, workers: int = 4, cache: Optional[SyncState] = None,
+                 property_mapping: Optional[PropertyMapping] = None, user_mapping: Optional[UserMapping] = None):
         self.notion_token = notion_token
         self.database_id = database_id
         self.headers = {
@@ -13,14 +43,41 @@ class NotionHelper:
             "Content-Type": "application/json",
             "Authorization": f"Bearer {self.notion_token}"
         }
-        self.url = f"https://api.notion.com/v1/databases/{self.database_id}/query"
-
+        self.api_url = api_url.rstrip("/")
+        self.url = f"{self.api_url}/databases/{self.database_id}/query"
+        self.last_edited_time: Optional[str] = None
+        # Oldest edit of a page that failed to sync, the watermark stays at it so the page is read again
+        self.failed_edited_time: Optional[str] = None
+        self.watermark_lock = threading.Lock()
+        self.session = session or get_session()
+        self.rate_limiter = rate_limiter or get_rate_limiter()
+        self.status_property = status_property
+        self.url_property = url_property
+        self.property_types: Dict[str, str] = {}
+        self.pending_updates: Dict[str, Dict[str, Any]] = {}
+        self.updates_lock = threading.Lock()
+        self.page_body = page_body
+        self.workers = max(workers, 1)
+        self.cache = cache
+        self.page_cache: Dict[Tuple[str, Optional[str]], str] = {}
+        # Titles of related pages by page id, shared by all rows
+        self.page_titles: Dict[str, Optional[str]] = {}
+        self.user_mapping = user_mapping
+        self.property_mapping = property_mapping or PropertyMapping()
+        if status_property:
+            self.property_mapping.set("status", status_property)
+        if url_property:
+            self.property_mapping.set("issue_url", url_property)
+        # Until the schema is loaded, property types are looked up per row
+        self.extractors = self.property_mapping.compile(users=self.user_mapping, page_title=self.get_page_title)
 
     def _get_property(self, props: dict, name: str, prop_type: str) -> Optional[Any]:
         try:
             prop = props[name][prop_type]
-            if prop_type in ["title", "rich_text"]:
-                return prop[0]["plain_text"]
+            if prop_type == "title":
+                return rich_text_to_plain_text(prop)
+            if prop_type == "rich_text":
+                return rich_text_to_markdown(prop)
             return prop
         except (KeyError, IndexError):
             return None
@@ -40,30 +97,276 @@ class NotionHelper:
         except KeyError:
             return []
 
-    def get_notion_issues(self) -> List[dict]:
-        payload = {"page_size": 100}
-        
-        response = requests.post(self.url, json=payload, headers=self.headers)
-        response_dict = response.json()
-        notion_issues = response_dict["results"]
-
-        issues = []
-        for i in reversed(notion_issues):
-            properties = i.get("properties")
-            if properties is None:
-                continue  # Skip this issue if properties are not found
-            
-            title = self.get_title(properties, "Title")
-            if not title:
-                continue  # Skip this issue if title is empty
-
-            issue = {
-                "title": title,
-                "description": self.get_rich_text(properties, "Discription"),
-                "assignees": self.get_multi_select(properties, "Assignees"),
-                "labels": self.get_multi_select(properties, "Labels"),
-                "project_number": self.get_number(properties, "ProjectNumber")
-            }
-            issues.append(issue)
-
-        return issues
+    def get_database(self) -> dict:
+        url = f"{self.api_url}/databases/{self.database_id}"
+        response = self.rate_limiter.call(
+            url,
+            lambda: self.session.get(url, headers=self.headers, timeout=REQUEST_TIMEOUT),
+            "GET /databases/{id}"
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def load_schema(self):
+        """Validates the property mapping against the database schema and compiles it for the run."""
+        schema = self.get_database()["properties"]
+        self.extractors = self.property_mapping.compile(schema, self.user_mapping, self.get_page_title)
+        for name, prop in schema.items():
+            self.property_types[name] = prop["type"]
+
+    def parse_issue(self, page: dict) -> Optional[NotionIssue]:
+        properties = page.get("properties")
+        if properties is None:
+            return None  # Skip this issue if properties are not found
+
+        fields = {field: extract(properties) for field, extract in self.extractors.items()}
+        if not fields["title"]:
+            return None  # Skip this issue if title is empty
+
+        return NotionIssue(**fields, id=page.get("id"), last_edited_time=page.get("last_edited_time"))
+
+    def hold_watermark(self, edited: Optional[str]):
+        """Keeps the watermark at or before a page that failed to sync, the filter `on_or_after` reads it again."""
+        if not edited:
+            return
+        with self.watermark_lock:
+            if self.failed_edited_time is None or edited < self.failed_edited_time:
+                self.failed_edited_time = edited
+
+    @property
+    def watermark(self) -> Optional[str]:
+        """Watermark for the next incremental read: the newest edit seen, unless a page edited before it failed."""
+        if self.failed_edited_time and (self.last_edited_time is None or self.failed_edited_time < self.last_edited_time):
+            return self.failed_edited_time
+        return self.last_edited_time
+
+    def build_filter(self, since: Optional[str] = None, filters: Optional[List[dict]] = None) -> Optional[Dict]:
+        conditions = list(filters or [])
+        if since:
+            conditions.append({"timestamp": "last_edited_time", "last_edited_time": {"on_or_after": since}})
+
+        if not conditions:
+            return None
+        if len(conditions) == 1:
+            return conditions[0]
+        return {"and": conditions}
+
+    def iter_pages(self, page_size: int = 100, query_filter: Optional[Dict] = None) -> Iterator[dict]:
+        # Oldest entries first, so issues are created in the order they were added to Notion
+        payload = {
+            "page_size": page_size,
+            "sorts": [{"timestamp": "created_time", "direction": "ascending"}]
+        }
+        if query_filter:
+            payload["filter"] = query_filter
+
+        # A page edited while the query runs may already have been passed, so the watermark never moves past the query start.
+        # Pages edited since then are read again by the next query.
+        started = time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime(time.time() - WATERMARK_SKEW))
+        cursor = None
+        while True:
+            if cursor:
+                payload = {**payload, "start_cursor": cursor}
+            response = self.rate_limiter.call(
+                self.url,
+                lambda: self.session.post(self.url, json=payload, headers=self.headers, timeout=REQUEST_TIMEOUT),
+                "POST /databases/{id}/query"
+            )
+            response.raise_for_status()
+            response_dict = response.json()
+            for page in response_dict["results"]:
+                edited = min(page["last_edited_time"], started) if page.get("last_edited_time") else None
+                if edited and (self.last_edited_time is None or edited > self.last_edited_time):
+                    self.last_edited_time = edited
+                yield page
+
+            cursor = response_dict.get("next_cursor")
+            if not response_dict.get("has_more") or not cursor:
+                break
+
+    def iter_block_children(self, block_id: str, page_size: int = 100) -> Iterator[dict]:
+        url = f"{self.api_url}/blocks/{block_id}/children"
+        cursor = None
+        while True:
+            params = {"page_size": page_size}
+            if cursor:
+                params["start_cursor"] = cursor
+            response = self.rate_limiter.call(
+                url,
+                lambda: self.session.get(url, params=params, headers=self.headers, timeout=REQUEST_TIMEOUT),
+                "GET /blocks/{id}/children"
+            )
+            response.raise_for_status()
+            response_dict = response.json()
+            yield from response_dict["results"]
+
+            cursor = response_dict.get("next_cursor")
+            if not response_dict.get("has_more") or not cursor:
+                break
+
+    def get_page_markdown(self, page_id: str, last_edited_time: Optional[str] = None) -> str:
+        """Markdown of the page content. Pages that weren't edited since they were last read come from the cache."""
+        key = (page_id, last_edited_time)
+        if key in self.page_cache:
+            return self.page_cache[key]
+        if self.cache is not None and last_edited_time:
+            cached = self.cache.get_page_body(page_id, last_edited_time)
+            if cached is not None:
+                self.page_cache[key] = cached
+                return cached
+
+        markdown = blocks_to_markdown(list(self.iter_block_children(page_id)), lambda block_id: list(self.iter_block_children(block_id)))
+        self.page_cache[key] = markdown
+        if self.cache is not None and last_edited_time:
+            self.cache.set_page_body(page_id, last_edited_time, markdown)
+        return markdown
+
+    def _add_page_body(self, issue: NotionIssue, future: Future) -> NotionIssue:
+        body = future.result()
+        if body:
+            issue.description = f"{issue.description}\n\n{body}" if issue.description else body
+        return issue
+
+    def _read_page(self, page_id: str) -> Optional[dict]:
+        url = f"{self.api_url}/pages/{page_id}"
+        response = self.rate_limiter.call(
+            url,
+            lambda: self.session.get(url, headers=self.headers, timeout=REQUEST_TIMEOUT),
+            "GET /pages/{id}"
+        )
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response.json()
+
+    def get_page(self, page_id: str) -> Optional[dict]:
+        """Reads a single page. Returns None when the page doesn't exist or isn't shared with the integration."""
+        page = self._read_page(page_id)
+        if page is None:
+            return None
+        edited = page.get("last_edited_time")
+        if edited and (self.last_edited_time is None or edited > self.last_edited_time):
+            self.last_edited_time = edited
+        return page
+
+    def get_page_title(self, page_id: str) -> Optional[str]:
+        """Title of a related page, read once per run. None when the page isn't shared with the integration."""
+        if page_id not in self.page_titles:
+            page = self._read_page(page_id)
+            self.page_titles[page_id] = page_title(page) if page else None
+        return self.page_titles[page_id]
+
+    def relation_properties(self) -> List[str]:
+        """Mapped properties that are relations, known once the schema is loaded."""
+        return [name for name in dict.fromkeys(self.property_mapping.fields.values())
+                if self.property_types.get(name) == "relation"]
+
+    def prefetch_page_titles(self, pages: List[dict]):
+        """Reads the titles of all pages related to `pages` concurrently, each unknown page once."""
+        names = self.relation_properties()
+        page_ids = dict.fromkeys(relation["id"] for page in pages for name in names
+                                 for relation in (page.get("properties", {}).get(name) or {}).get("relation", []))
+        missing = [page_id for page_id in page_ids if page_id not in self.page_titles]
+        if not missing:
+            return
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            list(executor.map(self.get_page_title, missing))
+
+    def _with_related_titles(self, pages: Iterable[dict]) -> Iterator[dict]:
+        if not self.relation_properties():
+            yield from pages
+            return
+        pages = iter(pages)
+        while True:
+            batch = list(islice(pages, RELATION_BATCH_SIZE))
+            if not batch:
+                return
+            self.prefetch_page_titles(batch)
+            yield from batch
+
+    def in_database(self, page: dict) -> bool:
+        parent = page.get("parent") or {}
+        return parent.get("database_id", "").replace("-", "") == self.database_id.replace("-", "")
+
+    def iter_pages_by_id(self, page_ids: List[str]) -> Iterator[dict]:
+        """Reads the given pages concurrently and yields those that belong to the database, in the given order.
+
+        Archived and deleted pages are left out.
+        """
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for page in executor.map(self.get_page, page_ids):
+                if page and self.in_database(page) and page.get("archived") is not True and page.get("in_trash") is not True:
+                    yield page
+
+    def iter_notion_issues_by_id(self, page_ids: List[str]) -> Iterator[NotionIssue]:
+        return self._iter_issues(self.iter_pages_by_id(page_ids))
+
+    def iter_notion_issues(self, page_size: int = 100, since: Optional[str] = None,
+                           filters: Optional[List[dict]] = None) -> Iterator[NotionIssue]:
+        return self._iter_issues(self.iter_pages(page_size, self.build_filter(since, filters)))
+
+    def _iter_issues(self, pages: Iterable[dict]) -> Iterator[NotionIssue]:
+        pages = self._with_related_titles(pages)
+        if not self.page_body:
+            for page in pages:
+                issue = self.parse_issue(page)
+                if issue:
+                    yield issue
+            return
+
+        # Page contents are read concurrently, issues are still yielded in database order
+        window = deque()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for page in pages:
+                issue = self.parse_issue(page)
+                if not issue:
+                    continue
+                window.append((issue, executor.submit(self.get_page_markdown, page["id"], page.get("last_edited_time"))))
+                if len(window) >= self.workers * 2:
+                    yield self._add_page_body(*window.popleft())
+
+            while window:
+                yield self._add_page_body(*window.popleft())
+
+    def get_notion_issues(self, since: Optional[str] = None, filters: Optional[List[dict]] = None) -> List[NotionIssue]:
+        return list(self.iter_notion_issues(since=since, filters=filters))
+
+    def select_value(self, name: str, option: str) -> Dict[str, Any]:
+        return {self.property_types.get(name, "select"): {"name": option}}
+
+    def url_value(self, url: str) -> Dict[str, Any]:
+        return {"url": url}
+
+    def queue_page_update(self, page_id: str, properties: Dict[str, Any]):
+        """Queues property changes of a page. All changes of one page are sent with a single request."""
+        with self.updates_lock:
+            self.pending_updates.setdefault(page_id, {}).update(properties)
+
+    def update_page(self, page_id: str, properties: Dict[str, Any]):
+        url = f"{self.api_url}/pages/{page_id}"
+        response = self.rate_limiter.call(
+            url,
+            lambda: self.session.patch(url, json={"properties": properties}, headers=self.headers, timeout=REQUEST_TIMEOUT),
+            "PATCH /pages/{id}"
+        )
+        response.raise_for_status()
+
+    def flush_page_updates(self, workers: int = 3) -> List[str]:
+        """Sends the queued page updates and returns the ids of the pages that were updated.
+
+        Requests run concurrently, the rate limiter keeps them within Notion's limit and retries 429s.
+        """
+        with self.updates_lock:
+            updates, self.pending_updates = self.pending_updates, {}
+
+        def send(page_id: str) -> bool:
+            try:
+                self.update_page(page_id, updates[page_id])
+                return True
+            except requests.RequestException as e:
+                print(f"Failed to update Notion page {page_id}. Error: {str(e)}")
+                return False
+
+        with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+            results = list(executor.map(send, updates))
+        return [page_id for page_id, updated in zip(updates, results) if updated]
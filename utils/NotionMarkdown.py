@@ -0,0 +1,113 @@
+from typing import Any, Callable, Dict, List, Optional
+
+# Markdown around annotated text, innermost first
+ANNOTATION_MARKS = [("code", "`"), ("strikethrough", "~~"), ("italic", "*"), ("bold", "**")]
+LIST_BLOCKS = ["bulleted_list_item", "numbered_list_item", "to_do", "toggle"]
+
+
+def _is_set(annotations: Dict[str, Any], name: str) -> bool:
+    return annotations.get(name) is True
+
+
+def _wrap(text: str, mark: str) -> str:
+    # Markdown doesn't allow whitespace inside the marks
+    stripped = text.strip()
+    if not stripped:
+        return text
+    start = text.index(stripped)
+    return f"{text[:start]}{mark}{stripped}{mark}{text[start + len(stripped):]}"
+
+
+def rich_text_to_plain_text(segments: Optional[List[dict]]) -> str:
+    return "".join(segment.get("plain_text", "") for segment in segments or [])
+
+
+def rich_text_to_markdown(segments: Optional[List[dict]]) -> str:
+    """Concatenates all rich text segments, keeping links and annotations as Markdown."""
+    markdown = ""
+    for segment in segments or []:
+        text = segment.get("plain_text", "")
+        if segment.get("type") == "equation":
+            markdown += f"${text}$"
+            continue
+
+        annotations = segment.get("annotations") or {}
+        for name, mark in ANNOTATION_MARKS:
+            if _is_set(annotations, name):
+                text = _wrap(text, mark)
+
+        link = (segment.get("text") or {}).get("link")
+        if isinstance(link, dict) and link.get("url"):
+            text = f"[{text}]({link['url']})"
+        markdown += text
+    return markdown
+
+
+def _get_file_url(value: Dict[str, Any]) -> str:
+    file = value.get(value.get("type", "external")) or {}
+    return file.get("url", "")
+
+
+def block_to_markdown(block: dict, number: int = 1) -> str:
+    """Markdown of a single block without its children. `number` is the position within a numbered list."""
+    block_type = block.get("type", "")
+    value = block.get(block_type) or {}
+    text = rich_text_to_markdown(value.get("rich_text"))
+
+    if block_type == "paragraph":
+        return text
+    if block_type in ["heading_1", "heading_2", "heading_3"]:
+        return f"{'#' * int(block_type[-1])} {text}"
+    if block_type == "bulleted_list_item" or block_type == "toggle":
+        return f"- {text}"
+    if block_type == "numbered_list_item":
+        return f"{number}. {text}"
+    if block_type == "to_do":
+        return f"- [{'x' if value.get('checked') is True else ' '}] {text}"
+    if block_type == "quote":
+        return "\n".join(f"> {line}" for line in text.split("\n"))
+    if block_type == "callout":
+        icon = (value.get("icon") or {}).get("emoji", "")
+        return "\n".join(f"> {line}" for line in f"{icon} {text}".strip().split("\n"))
+    if block_type == "code":
+        return f"```{value.get('language', '')}\n{rich_text_to_plain_text(value.get('rich_text'))}\n```"
+    if block_type == "equation":
+        return f"$$\n{value.get('expression', '')}\n$$"
+    if block_type == "divider":
+        return "---"
+    if block_type in ["image", "file", "pdf", "video"]:
+        caption = rich_text_to_markdown(value.get("caption")) or block_type
+        url = _get_file_url(value)
+        return f"![{caption}]({url})" if block_type == "image" else f"[{caption}]({url})"
+    if block_type in ["bookmark", "embed", "link_preview"]:
+        url = value.get("url", "")
+        return f"[{rich_text_to_markdown(value.get('caption')) or url}]({url})"
+    if block_type == "child_page":
+        return f"**{value.get('title', '')}**"
+    return text
+
+
+def blocks_to_markdown(blocks: List[dict], get_children: Callable[[str], List[dict]]) -> str:
+    """Markdown of a list of blocks. Children are read with `get_children` and indented below list items."""
+    lines = []
+    number = 0
+    for block in blocks:
+        number = number + 1 if block.get("type") == "numbered_list_item" else 0
+        markdown = block_to_markdown(block, number)
+
+        if block.get("has_children") is True and block.get("type") not in ["child_page", "child_database"]:
+            children = blocks_to_markdown(get_children(block["id"]), get_children)
+            if block.get("type") in LIST_BLOCKS:
+                markdown += "\n" + "\n".join(f"  {line}" if line else line for line in children.split("\n"))
+            elif children:
+                markdown += "\n\n" + children
+        lines.append(markdown)
+
+    # List items are kept together, other blocks are separated by an empty line
+    markdown = ""
+    for i, (block, line) in enumerate(zip(blocks, lines)):
+        if i:
+            same_list = block.get("type") in LIST_BLOCKS and blocks[i - 1].get("type") == block.get("type")
+            markdown += "\n" if same_list else "\n\n"
+        markdown += line
+    return markdown
@@ -0,0 +1,121 @@
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+
+class PageQueue:
+    """Durable queue of Notion page ids waiting to be synced, stored as JSON lines.
+
+    Every enqueued and every finished page is appended as one line and flushed right away, so pages survive a restart.
+    A page enqueued again while it is synced stays queued, its newer edit is synced once more.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        # Page id to the sequence number and time of its latest enqueue, in queue order
+        self.pending: Dict[str, Tuple[int, float]] = {}
+        self.sequence = 0
+        self.appended = 0
+        self.condition = threading.Condition()
+
+        if os.path.exists(self.path):
+            with open(self.path) as queue_file:
+                for line in queue_file:
+                    if not line.strip():
+                        continue
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # A line cut off by a crash
+                    self.sequence = max(self.sequence, entry["seq"])
+                    if entry.get("done"):
+                        self._remove(entry["page_id"], entry["seq"])
+                    else:
+                        self.pending.pop(entry["page_id"], None)
+                        self.pending[entry["page_id"]] = (entry["seq"], entry.get("queued_at", time.time()))
+
+    def __len__(self) -> int:
+        with self.condition:
+            return len(self.pending)
+
+    def _remove(self, page_id: str, sequence: int):
+        queued = self.pending.get(page_id)
+        if queued and queued[0] <= sequence:
+            del self.pending[page_id]
+
+    def _append(self, entries: List[dict]):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, "a") as queue_file:
+            for entry in entries:
+                queue_file.write(json.dumps(entry) + "\n")
+            queue_file.flush()
+            os.fsync(queue_file.fileno())
+        self.appended += len(entries)
+
+    def put(self, page_ids: List[str]) -> int:
+        """Enqueues pages, a page that is already queued moves to the end. Returns the number of pages written."""
+        page_ids = list(dict.fromkeys(page_id for page_id in page_ids if page_id))
+        if not page_ids:
+            return 0
+        with self.condition:
+            now = time.time()
+            entries = []
+            for page_id in page_ids:
+                self.sequence += 1
+                self.pending.pop(page_id, None)
+                self.pending[page_id] = (self.sequence, now)
+                entries.append({"page_id": page_id, "seq": self.sequence, "queued_at": now})
+            self._append(entries)
+            self.condition.notify_all()
+        return len(page_ids)
+
+    def take(self, max_items: int, settle: float = 0.0, timeout: Optional[float] = None) -> List[Tuple[str, int]]:
+        """Waits for queued pages and returns up to `max_items` of them with their sequence numbers, oldest first.
+
+        Pages are only returned once they were queued at least `settle` seconds ago, so a burst of edits is synced once.
+        Taken pages stay queued until they are acknowledged with `done`.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.condition:
+            while True:
+                now = time.time()
+                ready = [(page_id, sequence) for page_id, (sequence, queued_at) in self.pending.items() if now - queued_at >= settle]
+                if ready:
+                    return ready[:max_items]
+
+                waits = []
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return []
+                    waits.append(remaining)
+                if self.pending:
+                    # Wake up when the oldest page has settled
+                    oldest = min(queued_at for _, queued_at in self.pending.values())
+                    waits.append(max(settle - (now - oldest), 0.01))
+                self.condition.wait(min(waits) if waits else None)
+
+    def done(self, pages: List[Tuple[str, int]]):
+        """Removes synced pages, unless they were enqueued again after they were taken."""
+        if not pages:
+            return
+        with self.condition:
+            for page_id, sequence in pages:
+                self._remove(page_id, sequence)
+            self._append([{"page_id": page_id, "seq": sequence, "done": True} for page_id, sequence in pages])
+
+    def compact(self):
+        """Rewrites the file with one line per queued page."""
+        with self.condition:
+            if not self.appended:
+                return
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as queue_file:
+                for page_id, (sequence, queued_at) in self.pending.items():
+                    queue_file.write(json.dumps({"page_id": page_id, "seq": sequence, "queued_at": queued_at}) + "\n")
+            os.replace(tmp_path, self.path)
+            self.appended = 0
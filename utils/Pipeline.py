@@ -0,0 +1,101 @@
+import queue
+import threading
+from typing import Callable, Generic, Iterable, Iterator, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+# Seconds a blocked stage waits before checking whether its consumer is gone
+POLL_INTERVAL = 0.1
+_END = object()
+
+
+def _put(buffer: queue.Queue, item, stopped: threading.Event) -> bool:
+    while not stopped.is_set():
+        try:
+            buffer.put(item, timeout=POLL_INTERVAL)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def prefetch(items: Iterable[T], maxsize: int) -> Iterator[T]:
+    """Reads `items` on a background thread and yields them in order.
+
+    At most `maxsize` items are read ahead, a slow consumer holds the reader back. Errors of the reader are raised to the consumer.
+    """
+    buffer: queue.Queue = queue.Queue(maxsize=max(maxsize, 1))
+    stopped = threading.Event()
+
+    def produce():
+        try:
+            for item in items:
+                if not _put(buffer, (True, item), stopped):
+                    return
+            _put(buffer, (False, None), stopped)
+        except BaseException as e:
+            _put(buffer, (False, e), stopped)
+
+    threading.Thread(target=produce, daemon=True).start()
+    try:
+        while True:
+            has_item, value = buffer.get()
+            if not has_item:
+                if value is not None:
+                    raise value
+                return
+            yield value
+    finally:
+        stopped.set()
+
+
+class BatchStage(Generic[T]):
+    """Stage that passes the items put into it to `handle` in batches of `batch_size`, on its own thread.
+
+    The queue holds at most `maxsize` items, `put` blocks while it is full. `close` sends the last batch and raises errors of `handle`.
+    """
+
+    def __init__(self, handle: Callable[[List[T]], None], batch_size: int, maxsize: int = 0):
+        self.handle = handle
+        self.batch_size = max(batch_size, 1)
+        self.buffer: queue.Queue = queue.Queue(maxsize=maxsize or self.batch_size * 2)
+        self.stopped = threading.Event()
+        self.error: Optional[BaseException] = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        batch = []
+        done = False
+        while not done:
+            item = self.buffer.get()
+            done = item is _END
+            if not done:
+                batch.append(item)
+            if batch and (done or len(batch) >= self.batch_size):
+                try:
+                    self.handle(batch)
+                except BaseException as e:
+                    self.error = e
+                    self.stopped.set()
+                    return
+                batch = []
+
+    def put(self, item: T):
+        if not _put(self.buffer, item, self.stopped):
+            raise self.error or RuntimeError("The stage is closed.")
+
+    def close(self):
+        _put(self.buffer, _END, self.stopped)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self) -> "BatchStage[T]":
+        return self
+
+    def __exit__(self, exc_type, *args):
+        if exc_type is None:
+            self.close()
+        else:
+            self.stopped.set()
@@ -0,0 +1,268 @@
+import dataclasses
+import json
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional
+
+from utils.NotionMarkdown import rich_text_to_markdown, rich_text_to_plain_text
+
+if TYPE_CHECKING:
+    from utils.UserMapping import UserMapping
+
+# Issue fields and the kind of value they hold
+FIELDS = {
+    "title": "text",
+    "description": "markdown",
+    "assignees": "list",
+    "labels": "list",
+    "milestone": "text",
+    "project_number": "number",
+    "status": "text",
+    "issue_url": "text",
+    "repository": "text"
+}
+FIELD_ALIASES = {"body": "description", "project": "project_number"}
+DEFAULT_MAPPING = {
+    "title": "Title",
+    "description": "Discription",
+    "assignees": "Assignees",
+    "labels": "Labels",
+    "project_number": "ProjectNumber"
+}
+# Called for every empty value, so rows never share a list
+DEFAULTS: Dict[str, Callable[[], Any]] = {"text": str, "markdown": str, "list": list, "number": lambda: None}
+
+
+@dataclasses.dataclass(slots=True)
+class NotionIssue:
+    """Issue fields read from one Notion page, one attribute per field of FIELDS plus the page id and edit time."""
+    title: str
+    description: str = ""
+    assignees: List[str] = dataclasses.field(default_factory=list)
+    labels: List[str] = dataclasses.field(default_factory=list)
+    milestone: str = ""
+    # The number as read from the property, e.g. 3 or 3.0, None when it isn't set
+    project_number: Any = None
+    status: str = ""
+    issue_url: str = ""
+    repository: str = ""
+    id: Optional[str] = None
+    last_edited_time: Optional[str] = None
+
+
+Extractor = Callable[[Dict[str, Any]], Any]
+# Title of a related page by its id, None when it can't be read
+PageTitle = Callable[[str], Optional[str]]
+
+
+def _option_name(option: Optional[dict]) -> Optional[str]:
+    return option["name"] if option else None
+
+
+def _person_name(person: dict) -> str:
+    return person.get("name") or person.get("person", {}).get("email") or person["id"]
+
+
+def _date_text(date: Optional[dict]) -> Optional[str]:
+    if not date:
+        return None
+    return f"{date['start']} - {date['end']}" if date.get("end") else date["start"]
+
+
+def _formula_text(formula: dict) -> Optional[str]:
+    value = formula.get(formula.get("type"))
+    if formula.get("type") == "date":
+        return _date_text(value)
+    return None if value is None else str(value)
+
+
+def _unique_id_text(unique_id: dict) -> str:
+    prefix = unique_id.get("prefix")
+    return f"{prefix}-{unique_id['number']}" if prefix else str(unique_id["number"])
+
+
+def _to_number(text: Optional[str]) -> Optional[int]:
+    text = (text or "").strip().lstrip("#")
+    return int(text) if text.isdigit() else None
+
+
+def _split(text: Optional[str]) -> List[str]:
+    return [item.strip() for item in (text or "").split(",") if item.strip()]
+
+
+TEXT_CONVERTERS: Dict[str, Callable[[dict], Optional[str]]] = {
+    "title": lambda prop: rich_text_to_plain_text(prop["title"]),
+    "rich_text": lambda prop: rich_text_to_plain_text(prop["rich_text"]),
+    "select": lambda prop: _option_name(prop["select"]),
+    "status": lambda prop: _option_name(prop["status"]),
+    "multi_select": lambda prop: ", ".join(option["name"] for option in prop["multi_select"]),
+    "people": lambda prop: ", ".join(_person_name(person) for person in prop["people"]),
+    "relation": lambda prop: ", ".join(relation["id"] for relation in prop["relation"]),
+    "date": lambda prop: _date_text(prop["date"]),
+    "checkbox": lambda prop: "true" if prop["checkbox"] is True else "false",
+    "number": lambda prop: None if prop["number"] is None else str(prop["number"]),
+    "url": lambda prop: prop["url"],
+    "email": lambda prop: prop["email"],
+    "phone_number": lambda prop: prop["phone_number"],
+    "formula": lambda prop: _formula_text(prop["formula"]),
+    "unique_id": lambda prop: _unique_id_text(prop["unique_id"]),
+    "created_time": lambda prop: prop["created_time"],
+    "last_edited_time": lambda prop: prop["last_edited_time"]
+}
+
+CONVERTERS: Dict[str, Dict[str, Callable[[dict], Any]]] = {
+    "text": TEXT_CONVERTERS,
+    "markdown": {
+        **TEXT_CONVERTERS,
+        "title": lambda prop: rich_text_to_markdown(prop["title"]),
+        "rich_text": lambda prop: rich_text_to_markdown(prop["rich_text"])
+    },
+    "list": {
+        "multi_select": lambda prop: [option["name"] for option in prop["multi_select"]],
+        "select": lambda prop: [prop["select"]["name"]] if prop["select"] else [],
+        "status": lambda prop: [prop["status"]["name"]] if prop["status"] else [],
+        "people": lambda prop: [_person_name(person) for person in prop["people"]],
+        "relation": lambda prop: [relation["id"] for relation in prop["relation"]],
+        "title": lambda prop: _split(rich_text_to_plain_text(prop["title"])),
+        "rich_text": lambda prop: _split(rich_text_to_plain_text(prop["rich_text"]))
+    },
+    "number": {
+        # Numbers are passed on as they are, other types are read as "12" or "#12"
+        "number": lambda prop: prop["number"],
+        "select": lambda prop: _to_number(_option_name(prop["select"])),
+        "status": lambda prop: _to_number(_option_name(prop["status"])),
+        "title": lambda prop: _to_number(rich_text_to_plain_text(prop["title"])),
+        "rich_text": lambda prop: _to_number(rich_text_to_plain_text(prop["rich_text"])),
+        "formula": lambda prop: _to_number(_formula_text(prop["formula"])),
+        "unique_id": lambda prop: prop["unique_id"]["number"]
+    }
+}
+
+
+def get_converter(kind: str, prop_type: str, name: str, page_title: Optional[PageTitle] = None) -> Optional[Callable[[dict], Any]]:
+    if kind == "list" and prop_type == "checkbox":
+        # A checked box adds the property name, e.g. a label "Urgent"
+        return lambda prop: [name] if prop["checkbox"] is True else []
+    if prop_type == "relation" and page_title is not None and kind in ("list", "text", "markdown"):
+        # Related pages are named by their titles, pages that can't be read are left out
+        def titles(prop: dict) -> List[str]:
+            return [title for title in (page_title(relation["id"]) for relation in prop["relation"]) if title]
+        return titles if kind == "list" else lambda prop: ", ".join(titles(prop))
+    return CONVERTERS[kind].get(prop_type)
+
+
+def get_field_converter(field: str, prop_type: str, name: str, users: Optional["UserMapping"] = None,
+                        page_title: Optional[PageTitle] = None) -> Optional[Callable[[dict], Any]]:
+    """Converter of a property to an issue field. Assignees are mapped to GitHub logins with `users`."""
+    convert = get_converter(FIELDS[field], prop_type, name, page_title)
+    if convert is None or field != "assignees" or users is None:
+        return convert
+    if prop_type == "people":
+        return lambda prop: [users.person(person) for person in prop["people"]]
+    return lambda prop: [users.resolve(user) for user in convert(prop)]
+
+
+def parse_mapping(raw: str, line_format: str = "field: Property Name") -> Dict[str, str]:
+    """Reads a mapping given as JSON object or as YAML-style `field: Property Name` lines."""
+    if not raw.strip():
+        return {}
+    try:
+        mapping = json.loads(raw)
+    except json.JSONDecodeError:
+        mapping = {}
+        for line in raw.splitlines():
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            field, separator, name = line.partition(":")
+            name = name.strip()
+            # Names may contain " #", only a quoted name can be followed by a comment
+            if name[:1] in ("'", '"') and name.find(name[0], 1) > 0:
+                name = name[1:name.index(name[0], 1)]
+            if not separator or not name.strip():
+                raise ValueError(f"Invalid mapping line '{line}'. Use '{line_format}'.")
+            mapping[field.strip()] = name.strip()
+
+    if not isinstance(mapping, dict) or not all(isinstance(name, str) for name in mapping.values()):
+        raise ValueError(f"The mapping must be a JSON object of strings or '{line_format}' lines.")
+    return mapping
+
+
+class PropertyMapping:
+    """Maps Notion properties to issue fields and compiles the mapping into one extractor per field.
+
+    Fields that are only mapped by default are left empty when the database lacks the property.
+    """
+
+    def __init__(self, mapping: Optional[Dict[str, str]] = None):
+        self.fields = dict(DEFAULT_MAPPING)
+        self.explicit = set()
+        for field, name in (mapping or {}).items():
+            self.set(field, name)
+
+    @classmethod
+    def parse(cls, raw: str) -> "PropertyMapping":
+        return cls(parse_mapping(raw))
+
+    def set(self, field: str, name: str):
+        field = FIELD_ALIASES.get(field, field)
+        if field not in FIELDS:
+            raise ValueError(f"Unknown issue field '{field}'. Use one of {', '.join(sorted(FIELDS))}.")
+        self.fields[field] = name
+        self.explicit.add(field)
+
+    def compile(self, schema: Optional[Dict[str, dict]] = None, users: Optional["UserMapping"] = None,
+                page_title: Optional[PageTitle] = None) -> Dict[str, Extractor]:
+        """Builds the extractors. With the database `schema`, every mapped property is validated once.
+
+        Without a schema, the property type is looked up in each row. `users` maps people to GitHub logins,
+        `page_title` names related pages; without it, relations are read as page ids.
+        """
+        extractors = {}
+        for field, kind in FIELDS.items():
+            default = DEFAULTS[kind]
+            name = self.fields.get(field)
+            if name is None:
+                extractors[field] = lambda props, default=default: default()
+                continue
+
+            if schema is None:
+                extractors[field] = self._make_dynamic_extractor(field, name, users, page_title)
+                continue
+
+            if name not in schema:
+                if field in self.explicit or field == "title":
+                    raise ValueError(f"Notion property '{name}' mapped to '{field}' doesn't exist. "
+                                     f"Available properties: {', '.join(sorted(schema))}.")
+                extractors[field] = lambda props, default=default: default()
+                continue
+
+            prop_type = schema[name]["type"]
+            convert = get_field_converter(field, prop_type, name, users, page_title)
+            if convert is None:
+                raise ValueError(f"Notion property '{name}' of type {prop_type} can't be mapped to '{field}'. "
+                                 f"Supported types: {', '.join(sorted(CONVERTERS[kind]))}.")
+            extractors[field] = self._make_extractor(name, convert, default)
+        return extractors
+
+    @staticmethod
+    def _make_extractor(name: str, convert: Callable[[dict], Any], default: Callable[[], Any]) -> Extractor:
+        def extract(props: Dict[str, Any]) -> Any:
+            prop = props.get(name)
+            if prop is None:
+                return default()
+            value = convert(prop)
+            return default() if value is None else value
+        return extract
+
+    @staticmethod
+    def _make_dynamic_extractor(field: str, name: str, users: Optional["UserMapping"] = None,
+                                page_title: Optional[PageTitle] = None) -> Extractor:
+        default = DEFAULTS[FIELDS[field]]
+
+        def extract(props: Dict[str, Any]) -> Any:
+            prop = props.get(name)
+            convert = get_field_converter(field, prop.get("type"), name, users, page_title) if isinstance(prop, dict) else None
+            if convert is None:
+                return default()
+            value = convert(prop)
+            return default() if value is None else value
+        return extract
@@ -0,0 +1,161 @@
+import random
+import threading
+import time
+from typing import Callable, Dict, Optional
+from urllib.parse import urlparse
+
+import requests
+
+from utils.Tracer import get_rate_limit_headers, get_tracer
+
+# Notion allows an average of three requests per second, GitHub is mostly limited by its hourly quota
+DEFAULT_RATES = {
+    "api.notion.com": 3.0,
+    "api.github.com": 10.0
+}
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # The token is taken right away, so waiting callers queue up behind each other
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+
+
+class RateLimiter:
+    """Paces requests per host, retries throttled or failed requests and tracks the remaining quota."""
+
+    def __init__(self, rates: Dict[str, float] = DEFAULT_RATES, retries: int = 5, base_delay: float = 1.0, max_delay: float = 60.0):
+        self.buckets = {host: TokenBucket(rate) for host, rate in rates.items()}
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.quota: Dict[str, Dict[str, float]] = {}
+        self.lock = threading.Lock()
+
+    def _update_quota(self, host: str, response: requests.Response):
+        try:
+            remaining = int(response.headers["X-RateLimit-Remaining"])
+            reset = float(response.headers["X-RateLimit-Reset"])
+        except (KeyError, TypeError, ValueError):
+            return
+        with self.lock:
+            self.quota[host] = {"remaining": remaining, "reset": reset}
+
+    def _wait_for_quota(self, host: str):
+        with self.lock:
+            quota = self.quota.get(host)
+        if quota and quota["remaining"] <= 0:
+            wait = quota["reset"] - time.time()
+            if wait > 0:
+                print(f"Rate limit of {host} exhausted. Waiting {int(wait)} seconds for the reset.")
+                time.sleep(wait)
+
+    def _get_backoff(self, attempt: int) -> float:
+        # Full jitter, so concurrent workers don't retry in lockstep
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _get_delay(self, response: requests.Response, attempt: int) -> float:
+        try:
+            return float(response.headers["Retry-After"])
+        except (KeyError, TypeError, ValueError):
+            pass
+
+        if self._is_rate_limited(response):
+            try:
+                reset = float(response.headers["X-RateLimit-Reset"])
+                return max(reset - time.time(), 0)
+            except (KeyError, TypeError, ValueError):
+                pass
+
+        return self._get_backoff(attempt)
+
+    def _is_rate_limited(self, response: requests.Response) -> bool:
+        if response.status_code != 403:
+            return False
+        try:
+            return response.headers.get("X-RateLimit-Remaining") == "0" or "rate limit" in response.text.lower()
+        except (AttributeError, TypeError):
+            return False
+
+    def get_remaining(self, host: str) -> Optional[int]:
+        with self.lock:
+            quota = self.quota.get(host)
+        return int(quota["remaining"]) if quota else None
+
+    def fits_budget(self, host: str, planned_calls: int) -> bool:
+        """Whether `planned_calls` requests fit into the quota reported by the last response of `host`."""
+        remaining = self.get_remaining(host)
+        return remaining is None or planned_calls <= remaining
+
+    def call(self, url: str, send: Callable[[], requests.Response], endpoint: Optional[str] = None) -> requests.Response:
+        host = urlparse(url).hostname
+        bucket = self.buckets.get(host)
+        start = time.perf_counter()
+
+        for attempt in range(self.retries + 1):
+            self._wait_for_quota(host)
+            if bucket:
+                bucket.acquire()
+
+            try:
+                response = send()
+            except (requests.ConnectionError, requests.Timeout) as e:
+                # Dropped connections and timeouts are retried like server errors
+                if attempt == self.retries:
+                    get_tracer().record(host, endpoint or urlparse(url).path, time.perf_counter() - start, None, attempt)
+                    raise
+                delay = self._get_backoff(attempt)
+                print(f"Request to {host} failed with {type(e).__name__}. Retrying in {delay:.1f} seconds.")
+                time.sleep(delay)
+                continue
+            self._update_quota(host, response)
+
+            if response.status_code not in RETRY_STATUSES and not self._is_rate_limited(response):
+                break
+            if attempt == self.retries:
+                break
+
+            delay = self._get_delay(response, attempt)
+            print(f"Request to {host} failed with status {response.status_code}. Retrying in {delay:.1f} seconds.")
+            time.sleep(delay)
+
+        status = response.status_code if isinstance(response.status_code, int) else None
+        get_tracer().record(host, endpoint or urlparse(url).path, time.perf_counter() - start, status, attempt,
+                            get_rate_limit_headers(response.headers))
+        return response
+
+
+_rate_limiter: Optional[RateLimiter] = None
+_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Returns the rate limiter shared by all helpers of a run, so every host has one budget."""
+    global _rate_limiter
+    with _lock:
+        if _rate_limiter is None:
+            _rate_limiter = RateLimiter()
+        return _rate_limiter
+
+
+def configure_rate_limiter(rates: Dict[str, float] = DEFAULT_RATES, retries: int = 5):
+    """Replaces the shared rate limiter, e.g. to pace requests to a self-hosted or stand-in API."""
+    global _rate_limiter
+    with _lock:
+        _rate_limiter = RateLimiter(rates, retries)
+
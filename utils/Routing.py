@@ -0,0 +1,60 @@
+import json
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from utils.PropertyMapping import NotionIssue
+
+
+class Route(NamedTuple):
+    """Notion database synced into a repository, or into the repository named by a property of each row."""
+    database_id: str
+    repository: Optional[str]
+    repository_property: Optional[str] = None
+    filters: Tuple[dict, ...] = ()
+
+
+def parse_routes(raw: str, database_id: Optional[str] = None, repository: Optional[str] = None) -> List[Route]:
+    """Reads the routing config, a JSON list of routes. Without a config, `database_id` is synced into `repository`."""
+    if not raw.strip():
+        return [Route(database_id, repository)] if database_id else []
+
+    config = json.loads(raw)
+    if not isinstance(config, list):
+        raise ValueError("Routes must be a JSON list of objects with 'database' and 'repository' or 'repositoryProperty'.")
+
+    routes = []
+    for entry in config:
+        if not isinstance(entry, dict) or not entry.get("database"):
+            raise ValueError(f"Route {entry} has no 'database'.")
+        if not entry.get("repository") and not entry.get("repositoryProperty"):
+            raise ValueError(f"Route for database {entry['database']} needs a 'repository' or a 'repositoryProperty'.")
+        filters = entry.get("filter") or []
+        routes.append(Route(
+            entry["database"],
+            entry.get("repository"),
+            entry.get("repositoryProperty"),
+            tuple(filters if isinstance(filters, list) else [filters])
+        ))
+    return routes
+
+
+def resolve_repository(value: Optional[str], default_owner: str) -> Optional[str]:
+    """Full name of a repository given as `owner/name` or as `name` of the default owner."""
+    value = (value or "").strip()
+    if not value:
+        return None
+    return value if "/" in value else f"{default_owner}/{value}"
+
+
+def partition(issues: Iterable[NotionIssue], route: Route, default_owner: str) -> Dict[str, List[NotionIssue]]:
+    """Groups the issues of a property-routed database by target repository.
+
+    Rows without a repository go to the route's repository, or are skipped when it has none.
+    """
+    targets: Dict[str, List[NotionIssue]] = {}
+    for issue in issues:
+        repository = resolve_repository(issue.repository, default_owner) or route.repository
+        if repository:
+            targets.setdefault(repository, []).append(issue)
+        else:
+            print(f"Notion entry '{issue.title}' has no repository. Skipping it.")
+    return targets
@@ -0,0 +1,93 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from utils.GitHubHelper import GitHubHelper, IssueRecord
+from utils.MappingStore import MappingStore
+from utils.NotionHelper import NotionHelper
+from utils.PropertyMapping import NotionIssue
+
+CLOSED = "closed"
+OPEN = "open"
+
+
+class StatusSync:
+    """Keeps the GitHub issue state and a Notion status property in step and writes issue URLs back to Notion.
+
+    The state agreed on in the last run is kept in the mapping store, so a change is taken from the side it was made on.
+    Without that history, closing wins on either side.
+    """
+
+    def __init__(self, notion_helper: NotionHelper, gh_helper: GitHubHelper, closed_statuses: List[str],
+                 open_status: Optional[str] = None, mapping_store: Optional[MappingStore] = None):
+        self.notion_helper = notion_helper
+        self.gh_helper = gh_helper
+        self.closed_statuses = closed_statuses
+        self.open_status = open_status
+        self.mapping_store = mapping_store
+        self.state_changes: List[Tuple[str, int, str]] = []
+        self.notion_states: Dict[str, str] = {}
+
+    @property
+    def syncs_status(self) -> bool:
+        return bool(self.notion_helper.status_property and self.closed_statuses)
+
+    def _get_synced_state(self, page_id: str) -> Optional[str]:
+        mapped = self.mapping_store.get(page_id) if self.mapping_store is not None else None
+        return mapped.get("state") if mapped else None
+
+    def _set_synced_state(self, page_id: str, state: str):
+        if self.mapping_store is not None and self._get_synced_state(page_id) != state:
+            self.mapping_store.put(page_id, state=state)
+
+    def reconcile(self, issue: NotionIssue, record: IssueRecord):
+        """Queues the Notion and GitHub changes needed for one Notion issue and its linked GitHub issue."""
+        page_id = issue.id
+        properties = {}
+
+        url_property = self.notion_helper.url_property
+        url = self.gh_helper.get_issue_url(record.number)
+        if url_property and issue.issue_url != url:
+            properties[url_property] = self.notion_helper.url_value(url)
+
+        if self.syncs_status:
+            github_state = record.state.lower()
+            notion_state = CLOSED if issue.status in self.closed_statuses else OPEN
+            synced_state = self._get_synced_state(page_id)
+
+            if notion_state == github_state:
+                self._set_synced_state(page_id, github_state)
+            elif (synced_state and notion_state != synced_state) or (not synced_state and notion_state == CLOSED):
+                self.state_changes.append((page_id, record.number, notion_state))
+            else:
+                status_property = self.notion_helper.status_property
+                option = self.closed_statuses[0] if github_state == CLOSED else self.open_status
+                if option:
+                    properties[status_property] = self.notion_helper.select_value(status_property, option)
+                    self.notion_states[page_id] = github_state
+
+        if properties:
+            self.notion_helper.queue_page_update(page_id, properties)
+
+    def apply(self, workers: int) -> Tuple[List[int], int]:
+        """Closes or reopens the queued issues and sends the queued Notion updates.
+
+        Returns the numbers of the issues whose state was changed and the number of updated Notion pages.
+        """
+        changed_issue_numbers = []
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(lambda change: self.gh_helper.set_issue_state(change[1], change[2]), self.state_changes))
+        for (page_id, number, state), changed in zip(self.state_changes, results):
+            if changed:
+                changed_issue_numbers.append(number)
+                self._set_synced_state(page_id, state)
+        self.state_changes = []
+
+        updated_pages = self.notion_helper.flush_page_updates(workers)
+        for page_id in updated_pages:
+            if page_id in self.notion_states:
+                self._set_synced_state(page_id, self.notion_states[page_id])
+        self.notion_states = {}
+
+        if updated_pages:
+            print(f"Updated {len(updated_pages)} Notion pages.")
+        return changed_issue_numbers, len(updated_pages)
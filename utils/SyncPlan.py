@@ -0,0 +1,262 @@
+import json
+import math
+from dataclasses import asdict
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from utils.GitHubHelper import (IssueIndex, IssueRecord, ProjectRef,
+                                ProjectResolver, add_notion_marker)
+from utils.MappingStore import MappingStore, content_hash
+from utils.PropertyMapping import NotionIssue
+
+PLAN_VERSION = 1
+PROJECT_LINK_BATCH_SIZE = 25
+
+
+def update_action(new_issue: NotionIssue, number: int, node_id: Optional[str], issue_hash: str) -> Dict[str, Any]:
+    return {
+        "action": "update",
+        "title": new_issue.title,
+        "page_id": new_issue.id,
+        "number": number,
+        "node_id": node_id,
+        "body": add_notion_marker(new_issue.description, new_issue.id, issue_hash),
+        "assignees": new_issue.assignees,
+        "labels": new_issue.labels,
+        "milestone": new_issue.milestone or None,
+        "hash": issue_hash
+    }
+
+
+def link_action(new_issue: NotionIssue, number: int, node_id: str, project: ProjectRef, existing_hash: Optional[str]) -> Dict[str, Any]:
+    return {
+        "action": "link",
+        "title": new_issue.title,
+        "page_id": new_issue.id,
+        "number": number,
+        "node_id": node_id,
+        "project": project,
+        "existing_hash": existing_hash
+    }
+
+
+def resolve_pending_project(new_issue: NotionIssue, project_resolver: Optional[ProjectResolver],
+                            has_projects: Union[bool, Callable[[], bool]]) -> Optional[ProjectRef]:
+    """Project of an existing issue whose link may be missing, e.g. after a run stopped between creating and linking."""
+    if not new_issue.project_number or project_resolver is None:
+        return None
+    if not (has_projects() if callable(has_projects) else has_projects):
+        return None
+    return project_resolver.resolve(new_issue.project_number)
+
+
+def plan_issue(new_issue: NotionIssue, issue_index: IssueIndex, project_resolver: Optional[ProjectResolver],
+               has_projects: Union[bool, Callable[[], bool]], mapping_store: Optional[MappingStore] = None,
+               update: bool = False, repository: Optional[str] = None) -> Dict[str, Any]:
+    """Decides what a sync does with one Notion issue. Planned creates are reserved in `issue_index`.
+
+    With `update`, issues linked to the page are updated when the content hash of the page changed.
+    `has_projects` may be a callable, so it is only looked up for issues with a project.
+    Project links that the mapping store doesn't record as done are planned again.
+    Pages the mapping store records for another `repository` are planned as if they weren't mapped.
+    """
+    issue_hash = content_hash(new_issue)
+
+    # Pages known from earlier runs are decided without looking at GitHub
+    mapped = mapping_store.get(new_issue.id) if mapping_store is not None else None
+    if mapped and repository and mapped.get("repository", repository) != repository:
+        # The page was routed to another repository, its issue there belongs to the old repository and is left alone
+        mapped = None
+    if mapped:
+        if update and mapped.get("hash") != issue_hash:
+            return update_action(new_issue, mapped["number"], mapped.get("node_id"), issue_hash)
+        if mapped.get("node_id") and not mapped.get("project_item_id"):
+            project = resolve_pending_project(new_issue, project_resolver, has_projects)
+            if project:
+                return link_action(new_issue, mapped["number"], mapped["node_id"], project, mapped.get("hash"))
+        return {
+            "action": "skip",
+            "title": new_issue.title,
+            "page_id": new_issue.id,
+            "reason": "mapped",
+            "existing_number": mapped["number"],
+            "existing_node_id": mapped.get("node_id"),
+            "hash": issue_hash
+        }
+
+    existing = issue_index.find(new_issue.title, new_issue.id)
+    if existing:
+        # Issues only matched by title may belong to another page and are never overwritten
+        linked = existing.notion_page_id is not None and existing.notion_page_id == new_issue.id
+        if update and linked and existing.content_hash != issue_hash:
+            return update_action(new_issue, existing.number, existing.id, issue_hash)
+        if linked and mapping_store is not None:
+            # Created by an earlier run that stopped before recording it, its project link may be missing as well
+            project = resolve_pending_project(new_issue, project_resolver, has_projects)
+            if project:
+                return link_action(new_issue, existing.number, existing.id, project, existing.content_hash)
+        return {
+            "action": "skip",
+            "title": new_issue.title,
+            "page_id": new_issue.id,
+            "reason": "exists",
+            "existing_number": existing.number,
+            "existing_node_id": existing.id,
+            "existing_hash": existing.content_hash,
+            "existing_page_id": existing.notion_page_id,
+            "hash": issue_hash
+        }
+
+    # Reserve the title, so a later row with the same title isn't created twice
+    issue_index.add(IssueRecord(0, new_issue.title, "", "OPEN", new_issue.id))
+
+    project = None
+    if new_issue.project_number and project_resolver is not None:
+        if not (has_projects() if callable(has_projects) else has_projects):
+            print(f"Current repository isn't linked to a project.")
+        else:
+            project = project_resolver.resolve(new_issue.project_number)
+            if not project:
+                print(f"Cannot find a linked project with number {new_issue.project_number}. Please link the correct project manually.")
+
+    return {
+        "action": "create",
+        "title": new_issue.title,
+        "page_id": new_issue.id,
+        "body": add_notion_marker(new_issue.description, new_issue.id, issue_hash),
+        "assignees": new_issue.assignees,
+        "labels": new_issue.labels,
+        "milestone": new_issue.milestone or None,
+        "project": project,
+        "hash": issue_hash
+    }
+
+
+class SyncPlan:
+    """Serializable list of planned actions, which can be reviewed and later applied without reading Notion or GitHub again."""
+
+    def __init__(self, repository: str, database_id: str, actions: Optional[List[Dict[str, Any]]] = None,
+                 last_edited_time: Optional[str] = None, created_at: Optional[str] = None):
+        self.repository = repository
+        self.database_id = database_id
+        self.actions = actions or []
+        self.last_edited_time = last_edited_time
+        self.created_at = created_at or datetime.now(timezone.utc).isoformat()
+
+    @property
+    def creates(self) -> List[Dict[str, Any]]:
+        return [a for a in self.actions if a["action"] == "create"]
+
+    @property
+    def updates(self) -> List[Dict[str, Any]]:
+        return [a for a in self.actions if a["action"] == "update"]
+
+    @property
+    def skips(self) -> List[Dict[str, Any]]:
+        return [a for a in self.actions if a["action"] == "skip"]
+
+    @property
+    def links(self) -> List[Dict[str, Any]]:
+        return [a for a in self.actions if a["action"] in ["create", "link"] and a["project"]]
+
+    def skip_applied(self, issue_index: IssueIndex) -> int:
+        """Replaces creates whose issue already carries the page marker, e.g. when the apply job is run again.
+
+        Creates with a project become link actions, as the earlier run may have stopped before linking. Returns the number replaced.
+        """
+        replaced = 0
+        for position, action in enumerate(self.actions):
+            existing = issue_index.find_by_page_id(action["page_id"]) if action["action"] == "create" else None
+            if existing is None:
+                continue
+            if action["project"]:
+                self.actions[position] = {
+                    "action": "link",
+                    "title": action["title"],
+                    "page_id": action["page_id"],
+                    "number": existing.number,
+                    "node_id": existing.id,
+                    "project": action["project"],
+                    "existing_hash": existing.content_hash
+                }
+            else:
+                self.actions[position] = {
+                    "action": "skip",
+                    "title": action["title"],
+                    "page_id": action["page_id"],
+                    "reason": "exists",
+                    "existing_number": existing.number,
+                    "existing_node_id": existing.id,
+                    "existing_hash": existing.content_hash,
+                    "existing_page_id": existing.notion_page_id,
+                    "hash": action["hash"]
+                }
+            replaced += 1
+        return replaced
+
+    def estimate(self, rest_remaining: Optional[int] = None, graphql_remaining: Optional[int] = None) -> Dict[str, Any]:
+        """Estimated write calls of applying the plan and whether they fit the remaining quota."""
+        rest_calls = len(self.creates) + len(self.updates)
+        graphql_calls = math.ceil(len(self.links) / PROJECT_LINK_BATCH_SIZE)
+        return {
+            "rest_calls": rest_calls,
+            "graphql_calls": graphql_calls,
+            "total_calls": rest_calls + graphql_calls,
+            "rest_remaining": rest_remaining,
+            "graphql_remaining": graphql_remaining,
+            "fits_rate_limit": (rest_remaining is None or rest_calls <= rest_remaining)
+                               and (graphql_remaining is None or graphql_calls <= graphql_remaining)
+        }
+
+    def create_summary(self, estimate: Optional[Dict[str, Any]] = None) -> str:
+        estimate = estimate or self.estimate()
+        summary = "# Notion to GitHub Sync Plan\n\n"
+        summary += f"{len(self.creates)} issues to create, {len(self.updates)} to update, {len(self.skips)} to skip, {len(self.links)} project links.\n\n"
+        summary += "| Notion Issue Title | Action | Project |\n"
+        summary += "|--------------------|--------|---------|\n"
+        for action in self.actions:
+            if action["action"] == "create":
+                project = action["project"].title if action["project"] else ""
+                summary += f"| {action['title']} | create | {project} |\n"
+            elif action["action"] == "update":
+                summary += f"| {action['title']} | update #{action['number']} | |\n"
+            elif action["action"] == "link":
+                summary += f"| {action['title']} | link #{action['number']} | {action['project'].title} |\n"
+            else:
+                summary += f"| {action['title']} | skip (#{action['existing_number']} exists) | |\n"
+
+        summary += "\n## Estimated API Usage\n\n"
+        summary += "| API | Calls | Remaining |\n"
+        summary += "|-----|-------|-----------|\n"
+        summary += f"| GitHub REST | {estimate['rest_calls']} | {estimate['rest_remaining'] if estimate['rest_remaining'] is not None else 'unknown'} |\n"
+        summary += f"| GitHub GraphQL | {estimate['graphql_calls']} | {estimate['graphql_remaining'] if estimate['graphql_remaining'] is not None else 'unknown'} |\n"
+        if not estimate["fits_rate_limit"]:
+            summary += "\n> **Warning**: The plan doesn't fit into the remaining rate limit. Applying it will wait for the limit to reset.\n"
+        return summary
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "version": PLAN_VERSION,
+            "repository": self.repository,
+            "database_id": self.database_id,
+            "created_at": self.created_at,
+            "last_edited_time": self.last_edited_time,
+            "estimate": self.estimate(),
+            "actions": [dict(a, project=asdict(a["project"])) if a.get("project") else a for a in self.actions]
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "SyncPlan":
+        if data.get("version") != PLAN_VERSION:
+            raise ValueError(f"Unsupported plan version {data.get('version')}.")
+        actions = [dict(a, project=ProjectRef(**a["project"])) if a.get("project") else a for a in data["actions"]]
+        return cls(data["repository"], data["database_id"], actions, data.get("last_edited_time"), data.get("created_at"))
+
+    def save(self, path: str):
+        with open(path, "w") as plan_file:
+            json.dump(self.to_dict(), plan_file, indent=2)
+
+    @classmethod
+    def load(cls, path: str) -> "SyncPlan":
+        with open(path) as plan_file:
+            return cls.from_dict(json.load(plan_file))
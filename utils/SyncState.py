@@ -0,0 +1,80 @@
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional
+
+
+class SyncState:
+    """Small JSON state file that is meant to be cached between workflow runs."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.data: Dict[str, Dict] = {"databases": {}, "projects": {}, "pages": {}, "snapshots": {}, "repositories": {}}
+        # Page bodies and snapshots are stored by other threads while the state may be saved
+        self.lock = threading.Lock()
+
+        if os.path.exists(self.path):
+            with open(self.path) as state_file:
+                self.data = json.load(state_file)
+            self.data.setdefault("databases", {})
+            self.data.setdefault("projects", {})
+            self.data.setdefault("pages", {})
+            self.data.setdefault("snapshots", {})
+            self.data.setdefault("repositories", {})
+
+    def _database(self, database_id: str) -> Dict:
+        return self.data["databases"].setdefault(database_id, {})
+
+    def get_watermark(self, database_id: str) -> Optional[str]:
+        return self.data["databases"].get(database_id, {}).get("last_edited_time")
+
+    def set_watermark(self, database_id: str, last_edited_time: Optional[str]):
+        if not last_edited_time:
+            return
+        with self.lock:
+            current = self.get_watermark(database_id)
+            if current is None or last_edited_time > current:
+                self._database(database_id)["last_edited_time"] = last_edited_time
+
+    def get_project(self, owner: str, number: int, scope: str) -> Optional[Dict[str, Any]]:
+        return self.data["projects"].get(f"{owner}/{scope}/{number}")
+
+    def set_project(self, owner: str, number: int, scope: str, project: Optional[Dict[str, str]], expires: float):
+        # Misses are stored too, so a scope that does not own the project is not queried again
+        with self.lock:
+            self.data["projects"][f"{owner}/{scope}/{number}"] = {"project": project, "expires": expires}
+
+    def get_page_body(self, page_id: str, last_edited_time: str) -> Optional[str]:
+        page = self.data["pages"].get(page_id)
+        return page["body"] if page and page["last_edited_time"] == last_edited_time else None
+
+    def set_page_body(self, page_id: str, last_edited_time: str, body: str):
+        # Only the latest version of a page is kept
+        with self.lock:
+            self.data["pages"][page_id] = {"last_edited_time": last_edited_time, "body": body}
+
+    def get_snapshot(self, repository: str) -> Optional[Dict[str, Any]]:
+        return self.data["snapshots"].get(repository)
+
+    def set_snapshot(self, repository: str, synced_at: str, issues: List[List[Any]], expires: float):
+        with self.lock:
+            self.data["snapshots"][repository] = {"synced_at": synced_at, "expires": expires, "issues": issues}
+
+    def get_state_watermark(self, repository: str) -> Optional[str]:
+        """Time up to which the issue states of `repository` were checked for changes made on GitHub."""
+        return self.data["repositories"].get(repository, {}).get("states_checked_at")
+
+    def set_state_watermark(self, repository: str, checked_at: str):
+        with self.lock:
+            self.data["repositories"].setdefault(repository, {})["states_checked_at"] = checked_at
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        tmp_path = f"{self.path}.tmp"
+        with self.lock:
+            with open(tmp_path, 'w') as state_file:
+                json.dump(self.data, state_file, indent=2)
+            os.replace(tmp_path, self.path)
@@ -0,0 +1,167 @@
+import json
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+RATE_LIMIT_HEADERS = ["X-RateLimit-Limit", "X-RateLimit-Remaining", "X-RateLimit-Reset", "X-RateLimit-Resource", "Retry-After"]
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Nearest-rank percentile of `values`."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(math.ceil(p / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def get_rate_limit_headers(headers) -> Dict[str, str]:
+    found = {}
+    for name in RATE_LIMIT_HEADERS:
+        try:
+            value = headers.get(name)
+        except AttributeError:
+            return found
+        if isinstance(value, (str, int, float)):
+            found[name] = str(value)
+    return found
+
+
+class Tracer:
+    """Records every outbound request and the time spent per sync phase."""
+
+    def __init__(self):
+        self.requests: List[Dict] = []
+        self.phases: Dict[str, float] = {}
+        self.quota: Dict[str, int] = {}
+        self.lock = threading.Lock()
+
+    def record(self, host: str, endpoint: str, latency: float, status: Optional[int], retries: int = 0,
+               rate_limit: Optional[Dict[str, str]] = None):
+        rate_limit = rate_limit or {}
+        with self.lock:
+            self.requests.append({
+                "host": host,
+                "endpoint": endpoint,
+                "latency": latency,
+                "status": status,
+                "retries": retries,
+                "rate_limit": rate_limit
+            })
+            if rate_limit.get("X-RateLimit-Remaining", "").isdigit():
+                self.quota[host] = int(rate_limit["X-RateLimit-Remaining"])
+
+    def set_quota(self, name: str, remaining: int):
+        with self.lock:
+            self.quota[name] = remaining
+
+    def add_phase_time(self, name: str, seconds: float):
+        with self.lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_phase_time(name, time.perf_counter() - start)
+
+    def timed_iter(self, name: str, items: Iterable[T]) -> Iterator[T]:
+        """Yields from `items` and adds the time spent waiting for each item to phase `name`."""
+        iterator = iter(items)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add_phase_time(name, time.perf_counter() - start)
+                return
+            self.add_phase_time(name, time.perf_counter() - start)
+            yield item
+
+    def get_endpoint_stats(self) -> Dict[str, Dict]:
+        with self.lock:
+            requests = list(self.requests)
+
+        latencies: Dict[str, List[float]] = {}
+        retries: Dict[str, int] = {}
+        for request in requests:
+            latencies.setdefault(request["endpoint"], []).append(request["latency"])
+            retries[request["endpoint"]] = retries.get(request["endpoint"], 0) + request["retries"]
+
+        return {
+            endpoint: {
+                "count": len(values),
+                "retries": retries[endpoint],
+                "p50": percentile(values, 50),
+                "p95": percentile(values, 95)
+            }
+            for endpoint, values in latencies.items()
+        }
+
+    def create_summary(self) -> str:
+        summary = "## Timings\n\n"
+        summary += "| Phase | Seconds |\n"
+        summary += "|-------|---------|\n"
+        for name, seconds in self.phases.items():
+            summary += f"| {name} | {seconds:.2f} |\n"
+
+        summary += f"\n## Requests ({len(self.requests)} total)\n\n"
+        summary += "| Endpoint | Count | Retries | p50 (ms) | p95 (ms) |\n"
+        summary += "|----------|-------|---------|----------|----------|\n"
+        for endpoint, stats in sorted(self.get_endpoint_stats().items()):
+            summary += f"| {endpoint} | {stats['count']} | {stats['retries']} | {stats['p50'] * 1000:.0f} | {stats['p95'] * 1000:.0f} |\n"
+
+        if self.quota:
+            summary += "\n## Remaining Rate Limit\n\n"
+            summary += "| API | Remaining |\n"
+            summary += "|-----|-----------|\n"
+            for name, remaining in sorted(self.quota.items()):
+                summary += f"| {name} | {remaining} |\n"
+
+        return summary
+
+    def roll_up(self) -> str:
+        """One-line summary of the requests and phases recorded so far, which are then dropped.
+
+        Long-running modes call this once per cycle, so the trace doesn't grow for as long as they run.
+        """
+        with self.lock:
+            requests, phases = self.requests, self.phases
+            self.requests, self.phases = [], {}
+        retries = sum(request["retries"] for request in requests)
+        timings = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in phases.items())
+        return f"{len(requests)} requests, {retries} retries" + (f", {timings}" if timings else "")
+
+    def to_dict(self) -> Dict:
+        endpoints = self.get_endpoint_stats()
+        with self.lock:
+            return {
+                "phases": dict(self.phases),
+                "endpoints": endpoints,
+                "quota": dict(self.quota),
+                "requests": list(self.requests)
+            }
+
+    def export(self, path: str):
+        with open(path, "w") as trace_file:
+            json.dump(self.to_dict(), trace_file, indent=2)
+
+
+_tracer = Tracer()
+
+
+def get_tracer() -> Tracer:
+    return _tracer
+
+
+def reset_tracer() -> Tracer:
+    """Starts a fresh trace, e.g. at the beginning of a run."""
+    global _tracer
+    _tracer = Tracer()
+    return _tracer
@@ -0,0 +1,42 @@
+from typing import Dict, Optional
+
+from utils.PropertyMapping import parse_mapping
+
+
+def _key(value: str) -> str:
+    """Notion user ids are compared without dashes, emails and names without case."""
+    return value.strip().replace("-", "").casefold() if _is_id(value) else value.strip().casefold()
+
+
+def _is_id(value: str) -> bool:
+    compact = value.strip().replace("-", "")
+    return len(compact) == 32 and all(char in "0123456789abcdefABCDEF" for char in compact)
+
+
+class UserMapping:
+    """Maps Notion users to GitHub logins. Users are looked up by id, email or name, in this order.
+
+    Users without an entry keep their name, so a name that already is the GitHub login needs no entry.
+    """
+
+    def __init__(self, mapping: Optional[Dict[str, str]] = None):
+        self.logins = {_key(user): login.strip().lstrip("@") for user, login in (mapping or {}).items() if login.strip()}
+
+    @classmethod
+    def parse(cls, raw: str) -> "UserMapping":
+        return cls(parse_mapping(raw, "user: github-login"))
+
+    def __bool__(self) -> bool:
+        return bool(self.logins)
+
+    def resolve(self, name: str) -> str:
+        """Login of a free-text name, e.g. from a multi-select."""
+        return self.logins.get(_key(name), name.strip().lstrip("@"))
+
+    def person(self, person: dict) -> str:
+        """Login of a user of a Notion people property."""
+        email = person.get("person", {}).get("email")
+        for user in (person.get("id"), email, person.get("name")):
+            if user and _key(user) in self.logins:
+                return self.logins[_key(user)]
+        return person.get("name") or email or person["id"]
@@ -0,0 +1,119 @@
+import hashlib
+import hmac
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+from utils.PageQueue import PageQueue
+
+# Largest accepted payload, a page object with all its properties fits easily
+MAX_BODY_SIZE = 1024 * 1024
+
+
+def extract_page_ids(payload: Any) -> List[str]:
+    """Page ids of a Notion webhook event, an automation payload, a page object or a list of these."""
+    if isinstance(payload, list):
+        return [page_id for item in payload for page_id in extract_page_ids(item)]
+    if not isinstance(payload, dict):
+        return []
+
+    # Webhook events name the changed page as their entity
+    entity = payload.get("entity")
+    if isinstance(entity, dict):
+        return [entity["id"]] if entity.get("type") == "page" and entity.get("id") else []
+    # Database automations send the page as data
+    if isinstance(payload.get("data"), (dict, list)):
+        return extract_page_ids(payload["data"])
+    if payload.get("object") == "page" and payload.get("id"):
+        return [payload["id"]]
+    return []
+
+
+def verify_signature(secret: str, body: bytes, signature: Optional[str]) -> bool:
+    """Checks the `X-Notion-Signature` header, an HMAC-SHA256 of the body keyed with the verification token."""
+    if not signature:
+        return False
+    expected = "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+class WebhookServer:
+    """HTTP receiver for Notion webhooks and automations. Changed pages are put into the `page_queue`.
+
+    Events are accepted with POST on any path. GET /health reports the number of queued pages.
+    """
+
+    def __init__(self, page_queue: PageQueue, host: str = "0.0.0.0", port: int = 8080, secret: Optional[str] = None):
+        self.page_queue = page_queue
+        self.secret = secret
+        self.server = ThreadingHTTPServer((host, port), self._make_handler())
+        self.server.daemon_threads = True
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "WebhookServer":
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def receive(self, body: bytes, signature: Optional[str]) -> Dict[str, Any]:
+        """Handles one payload and returns the status code and response."""
+        try:
+            payload = json.loads(body or b"{}")
+        except json.JSONDecodeError:
+            return {"status": 400, "body": {"message": "Payload isn't JSON."}}
+
+        if isinstance(payload, dict) and payload.get("verification_token"):
+            # Sent once when the subscription is created, it is the secret of all later events
+            print(f"Notion webhook verification token: {payload['verification_token']}")
+            return {"status": 200, "body": {"message": "Verification token received."}}
+        if self.secret and not verify_signature(self.secret, body, signature):
+            return {"status": 401, "body": {"message": "Invalid signature."}}
+
+        queued = self.page_queue.put(extract_page_ids(payload))
+        if queued:
+            print(f"Queued {queued} Notion pages.")
+        return {"status": 202, "body": {"queued": queued}}
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status: int, payload: Dict[str, Any]):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if self.path.rstrip("/") == "/health":
+                    self._send(200, {"queued": len(server.page_queue)})
+                else:
+                    self._send(404, {"message": "Not Found"})
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                if length > MAX_BODY_SIZE:
+                    self.close_connection = True
+                    self._send(413, {"message": "Payload too large."})
+                    return
+                result = server.receive(self.rfile.read(length), self.headers.get("X-Notion-Signature"))
+                self._send(result["status"], result["body"])
+
+        return Handler
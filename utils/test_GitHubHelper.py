@@ -1,23 +1,33 @@
-from unittest.mock import Mock, mock_open, patch
+import threading
+import time
+from unittest.mock import Mock, PropertyMock, mock_open, patch
 
 import pytest
 from github import GithubException
 from github.Issue import Issue
+from github.Milestone import Milestone
 from github.Repository import Repository
 
-from utils.GitHubHelper import GitHubHelper, GraphQLHelper
+from utils.GitHubHelper import (GitHubHelper, GraphQLHelper, IssueIndex,
+                                IssueRecord, ProjectRef, ProjectResolver,
+                                SyncResult, add_notion_marker,
+                                get_notion_hash, get_notion_page_id)
+from utils.SyncState import SyncState
+from utils.Tracer import Tracer
 
 
 class TestGitHubHelper:
     @pytest.fixture
     def mock_github(self):
         with patch('github.Github') as mock:
+            mock.return_value.rate_limiting = (4999, 5000)
             yield mock
 
     @pytest.fixture
     def mock_repo(self):
         repo = Mock(spec=Repository)
         repo.full_name = "test-org/test-repo"
+        repo.get_assignees.return_value = [Mock(login="assignee1"), Mock(login="Assignee2")]
         return repo
 
     @pytest.fixture
@@ -29,12 +39,35 @@ class TestGitHubHelper:
         assert github_helper.org == "test-org"
         assert github_helper.project == "test-repo"
 
+    def test_init_is_lazy(self, mock_github):
+        helper = GitHubHelper("fake_token", "test-org/test-repo")
+
+        mock_github.assert_not_called()
+        assert helper.get_organization() == "test-org"
+
+    def test_init_pool_size(self, mock_github, mock_repo):
+        mock_github.return_value.get_repo.return_value = mock_repo
+        helper = GitHubHelper("fake_token", "test-org/test-repo", workers=16)
+        assert helper.repo is mock_repo
+        mock_github.return_value.get_repo.assert_called_once_with("test-org/test-repo")
+        mock_github.assert_called_with(
+            "fake_token",
+            base_url="https://api.github.com",
+            pool_size=16,
+            seconds_between_requests=0.25,
+            seconds_between_writes=1.0
+        )
+
     def test_get_issues(self, github_helper, mock_repo):
         mock_issues = [Mock(spec=Issue), Mock(spec=Issue)]
         mock_repo.get_issues.return_value = mock_issues
         issues = github_helper.get_issues()
         assert issues == mock_issues
 
+    def test_get_all_issues(self, github_helper, mock_repo):
+        github_helper.get_issues(state="all")
+        mock_repo.get_issues.assert_called_once_with(state="all")
+
     def test_get_organization(self, github_helper):
         assert github_helper.get_organization() == "test-org"
 
@@ -63,7 +96,7 @@ class TestGitHubHelper:
         issue = github_helper.create_issue("Test Issue", "Test Body", ["assignee1"], ["label1"])
         
         assert issue == mock_issue
-        assert github_helper.summary_data == [("Test Issue", "https://github.com/test-org/test-repo/issues/1", True, False)]
+        assert github_helper.summary_data == [SyncResult("Test Issue", "https://github.com/test-org/test-repo/issues/1", created=True)]
 
     def test_create_issue_failure_with_summary(self, github_helper, mock_repo):
         mock_repo.create_issue.side_effect = GithubException(status=422, data={})
@@ -71,21 +104,123 @@ class TestGitHubHelper:
         issue = github_helper.create_issue("Test Issue", "Test Body")
         
         assert issue is None
-        assert github_helper.summary_data == [("Test Issue", "", False, False)]
+        assert github_helper.summary_data == [SyncResult("Test Issue")]
+
+    @patch('time.sleep')
+    def test_create_issue_retries_rate_limit(self, mock_sleep, github_helper, mock_repo):
+        mock_issue = Mock(spec=Issue)
+        mock_issue.html_url = "https://github.com/test-org/test-repo/issues/1"
+        rate_limit = GithubException(status=403, data={"message": "You have exceeded a secondary rate limit."}, headers={"Retry-After": "2"})
+        mock_repo.create_issue.side_effect = [rate_limit, mock_issue]
+
+        issue = github_helper.create_issue("Test Issue", "Test Body")
+
+        assert issue == mock_issue
+        assert mock_repo.create_issue.call_count == 2
+        assert mock_sleep.call_args[0][0] == pytest.approx(2, abs=0.1)
+        assert github_helper.summary_data == [SyncResult("Test Issue", "https://github.com/test-org/test-repo/issues/1", created=True)]
+
+    @patch('time.sleep')
+    def test_create_issue_rate_limit_exhausted(self, mock_sleep, github_helper, mock_repo):
+        mock_repo.create_issue.side_effect = GithubException(status=429, data={}, headers={})
+
+        issue = github_helper.create_issue("Test Issue", "Test Body", summary=False, retries=2)
+
+        assert issue is None
+        assert mock_repo.create_issue.call_count == 3
+        assert github_helper.summary_data == []
+
+    def test_update_issue(self, github_helper, mock_repo):
+        mock_repo.url = "https://api.github.com/repos/test-org/test-repo"
+        mock_repo._requester = Mock()
+        mock_repo._requester.requestJsonAndCheck.return_value = ({}, {"number": 5})
+
+        assert github_helper.update_issue(5, "Test Issue", "Test Body", ["assignee1"], ["label1"])
+
+        # The issue is patched without fetching it first
+        mock_repo._requester.requestJsonAndCheck.assert_called_once()
+        verb, url = mock_repo._requester.requestJsonAndCheck.call_args[0]
+        assert (verb, url) == ("PATCH", "https://api.github.com/repos/test-org/test-repo/issues/5")
+        assert mock_repo._requester.requestJsonAndCheck.call_args.kwargs["input"] == {
+            "title": "Test Issue",
+            "body": "Test Body",
+            "labels": ["label1"],
+            "assignees": ["assignee1"]
+        }
+
+    def test_create_issue_drops_invalid_assignees_and_labels(self, github_helper, mock_repo):
+        github_helper.create_issue("Test Issue", "Test Body", ["assignee1", "@assignee2", "someone"],
+                                   ["label1", " ", "Label1", "x" * 51, "label2"])
+
+        mock_repo.create_issue.assert_called_once_with(
+            title="Test Issue",
+            body="Test Body",
+            assignees=["assignee1", "Assignee2"],
+            labels=["label1", "label2"]
+        )
+
+    def test_assignees_listed_once(self, github_helper, mock_repo):
+        github_helper.create_issue("Issue 1", "Body", ["assignee1"])
+        github_helper.create_issue("Issue 2", "Body", ["assignee1"])
+        assert mock_repo.get_assignees.call_count == 1
+
+        github_helper.reset()
+        github_helper.create_issue("Issue 3", "Body", ["assignee1"])
+        assert mock_repo.get_assignees.call_count == 2
+
+    def test_assignees_not_checked_when_listing_fails(self, github_helper, mock_repo):
+        mock_repo.get_assignees.side_effect = GithubException(status=403, data={})
+
+        github_helper.create_issue("Test Issue", "Test Body", ["someone"] + [f"user{i}" for i in range(10)])
+
+        assert mock_repo.create_issue.call_args.kwargs["assignees"] == ["someone"] + [f"user{i}" for i in range(9)]
+
+    def test_update_issue_failure(self, github_helper, mock_repo):
+        mock_repo.url = "https://api.github.com/repos/test-org/test-repo"
+        mock_repo._requester = Mock()
+        mock_repo._requester.requestJsonAndCheck.side_effect = GithubException(status=404, data={})
+
+        assert not github_helper.update_issue(5, "Test Issue", "Test Body")
+
+    def test_create_issue_with_milestone(self, github_helper, mock_repo):
+        milestone = Mock(spec=Milestone)
+        milestone.title = "v1.0"
+        mock_repo.get_milestones.return_value = [milestone]
+
+        github_helper.create_issue("Test Issue", "Test Body", milestone="v1.0")
+        github_helper.create_issue("Test Issue 2", "Test Body", milestone="v2.0")
+
+        assert mock_repo.create_issue.call_args_list[0].kwargs["milestone"] is milestone
+        # Unknown milestones are left out, the milestones are only listed once
+        assert "milestone" not in mock_repo.create_issue.call_args_list[1].kwargs
+        mock_repo.get_milestones.assert_called_once_with(state="all")
+
+    def test_set_issue_state(self, github_helper, mock_repo):
+        mock_repo.url = "https://api.github.com/repos/test-org/test-repo"
+        mock_repo._requester = Mock()
+        mock_repo._requester.requestJsonAndCheck.return_value = ({}, {"number": 5, "state": "closed"})
+
+        assert github_helper.set_issue_state(5, "closed")
+        assert mock_repo._requester.requestJsonAndCheck.call_args.kwargs["input"] == {"state": "closed"}
 
     def test_update_project_link_status(self, github_helper):
-        github_helper.summary_data = [("Test Issue", "https://github.com/test-org/test-repo/issues/1", True, False)]
+        # Rows are found by page id, so entries sharing a title keep their own link status
+        github_helper.add_result(SyncResult("Test Issue", "https://github.com/test-org/test-repo/issues/1", created=True, page_id="page-1"))
+        github_helper.add_result(SyncResult("Test Issue", "https://github.com/test-org/test-repo/issues/2", created=True, page_id="page-2"))
         
-        github_helper.update_project_link_status("Test Issue", True)
+        github_helper.update_project_link_status("page-2", True)
+        github_helper.update_project_link_status("unknown", True)
         
-        assert github_helper.summary_data == [("Test Issue", "https://github.com/test-org/test-repo/issues/1", True, True)]
+        assert [result.linked for result in github_helper.summary_data] == [False, True]
 
     def test_create_job_summary(self, github_helper):
-        github_helper.summary_data = [
-            ("Test Issue 1", "https://github.com/test-org/test-repo/issues/1", True, True),
-            ("Test Issue 2", "https://github.com/test-org/test-repo/issues/2", True, False),
-            ("Test Issue 3", "", False, False)
-        ]
+        for result in [
+            SyncResult("Test Issue 1", "https://github.com/test-org/test-repo/issues/1", created=True, linked=True),
+            SyncResult("Test Issue 2", "https://github.com/test-org/test-repo/issues/2", created=True),
+            SyncResult("Test Issue 3"),
+            SyncResult("Test Issue 4", "https://github.com/test-org/test-repo/issues/4", updated=True)
+        ]:
+            github_helper.add_result(result)
         
         summary = github_helper.create_job_summary()
         
@@ -95,13 +230,63 @@ class TestGitHubHelper:
             "|--------------------|---------|----------------|",
             "| [Test Issue 1](https://github.com/test-org/test-repo/issues/1) | ✅ | ✅ |",
             "| [Test Issue 2](https://github.com/test-org/test-repo/issues/2) | ✅ | ❌ |",
-            "| Test Issue 3 | ❌ | ❌ |"
+            "| Test Issue 3 | ❌ | ❌ |",
+            "| [Test Issue 4](https://github.com/test-org/test-repo/issues/4) | 🔄 | ❌ |"
         ]
         
         for line in expected_lines:
             assert line in summary, f"Expected line not found in summary: {line}"
 
 
+    def test_create_job_summary_with_trace(self, github_helper):
+        tracer = Tracer()
+        tracer.record("api.github.com", "POST /graphql", 0.1, 200)
+
+        summary = github_helper.create_job_summary(tracer)
+
+        assert "# Notion to GitHub Sync Summary" in summary
+        assert "| POST /graphql | 1 | 0 | 100 | 100 |" in summary
+
+    def test_create_issue_traced(self, github_helper, mock_repo):
+        mock_repo.create_issue.return_value = Mock(spec=Issue, _headers={"x-ratelimit-remaining": "4999"})
+        with patch('utils.GitHubHelper.get_tracer') as mock_get_tracer:
+            github_helper.create_issue("Test Issue", "Test Body")
+
+        args = mock_get_tracer.return_value.record.call_args[0]
+        assert args[0] == "api.github.com (REST)"
+        assert args[1] == "POST /repos/{owner}/{repo}/issues"
+        assert args[3] == 201
+        assert args[5] == {"X-RateLimit-Remaining": "4999"}
+
+    def test_trace_uses_api_host(self, mock_github, mock_repo):
+        mock_github.return_value.get_repo.return_value = mock_repo
+        github_helper = GitHubHelper("fake_token", "test-org/test-repo", base_url="https://github.example.com/api/v3")
+
+        with patch('utils.GitHubHelper.get_tracer') as mock_get_tracer:
+            github_helper.create_issue("Test Issue", "Test Body")
+
+        assert mock_get_tracer.return_value.record.call_args[0][0] == "github.example.com (REST)"
+
+    def test_trace_without_rate_limit_headers(self, mock_github, mock_repo):
+        # Without rate limit headers, e.g. on GHES, PyGithub would ask GET /rate_limit for the quota
+        type(mock_github.return_value).rate_limiting = PropertyMock(side_effect=GithubException(status=404, data={}))
+        mock_github.return_value.get_repo.return_value = mock_repo
+        mock_repo.create_issue.return_value = Mock(spec=Issue, _headers={})
+        github_helper = GitHubHelper("fake_token", "test-org/test-repo")
+
+        with patch('utils.GitHubHelper.get_tracer') as mock_get_tracer:
+            assert github_helper.create_issue("Test Issue", "Test Body") is mock_repo.create_issue.return_value
+
+        assert mock_get_tracer.return_value.record.call_args[0][5] == {}
+
+    def test_trace_failure_reads_exception_headers(self, github_helper, mock_repo):
+        mock_repo.create_issue.side_effect = GithubException(status=422, data={}, headers={"X-RateLimit-Remaining": "12"})
+        with patch('utils.GitHubHelper.get_tracer') as mock_get_tracer:
+            github_helper.create_issue("Test Issue", "Test Body")
+
+        args = mock_get_tracer.return_value.record.call_args[0]
+        assert (args[3], args[5]) == (422, {"X-RateLimit-Remaining": "12"})
+
     def test_create_issue_failure(self, github_helper, mock_repo):
         mock_repo.create_issue.side_effect = GithubException(status=422, data={})
         
@@ -115,6 +300,122 @@ class TestGitHubHelper:
             labels=[]
         )
 
+class TestIssueIndex:
+    @pytest.fixture
+    def issue(self):
+        return IssueRecord(1, "  Existing   Issue ", "node_1", "CLOSED", "1a2b-3c4d")
+
+    def test_notion_marker(self):
+        body = add_notion_marker("Body", "1a2b-3c4d")
+        assert body == "Body\n\n<!-- notion-page-id: 1a2b-3c4d -->"
+        assert get_notion_page_id(body) == "1a2b-3c4d"
+        assert add_notion_marker("Body", None) == "Body"
+        assert get_notion_page_id("Body") is None
+        assert get_notion_page_id(None) is None
+
+    def test_notion_marker_with_hash(self):
+        body = add_notion_marker("Body", "1a2b-3c4d", "0123abcd")
+        assert body == "Body\n\n<!-- notion-page-id: 1a2b-3c4d hash: 0123abcd -->"
+        assert get_notion_page_id(body) == "1a2b-3c4d"
+        assert get_notion_hash(body) == "0123abcd"
+        assert get_notion_hash(add_notion_marker("Body", "1a2b-3c4d")) is None
+
+    def test_find_by_normalized_title(self, issue):
+        index = IssueIndex([issue])
+        assert index.find("existing issue") is issue
+        assert index.find("Other Issue") is None
+
+    def test_find_by_page_id(self, issue):
+        index = IssueIndex([issue])
+        assert index.find("Renamed Issue", "1a2b-3c4d") is issue
+        assert index.find("Renamed Issue", "unknown") is None
+
+    def test_add(self):
+        index = IssueIndex()
+        new_issue = IssueRecord(2, "New Issue", "node_2", "OPEN", "0815")
+        index.add(new_issue)
+        assert len(index) == 1
+        assert index.find("NEW ISSUE") is new_issue
+        assert index.find("Anything", "0815") is new_issue
+
+
+    def test_lazy_loader(self, issue):
+        loader = Mock(return_value=[issue])
+        index = IssueIndex(loader=loader)
+
+        assert not index.loaded
+        loader.assert_not_called()
+        assert index.find("Existing Issue") is issue
+        assert index.loaded
+        index.find("Other")
+        loader.assert_called_once()
+
+    def test_prefetch(self, issue):
+        started = threading.Event()
+        release = threading.Event()
+
+        def loader():
+            started.set()
+            release.wait(5)
+            return [issue]
+
+        index = IssueIndex(loader=loader)
+        index.prefetch()
+        assert started.wait(5)
+        release.set()
+        assert index.find("Existing Issue") is issue
+
+    def test_prefetch_raises_loader_errors(self):
+        index = IssueIndex(loader=Mock(side_effect=RuntimeError("snapshot failed")))
+        index.prefetch()
+
+        with pytest.raises(RuntimeError, match="snapshot failed"):
+            index.find("Anything")
+
+    def test_replace_and_discard(self):
+        reserved = IssueRecord(0, "New Issue", "", "OPEN", "0815")
+        index = IssueIndex([reserved])
+        created = IssueRecord(2, "New Issue", "node_2", "OPEN", "0815")
+
+        index.replace(reserved, created)
+        assert index.find("New Issue") is created
+        assert index.find("Other", "0815") is created
+
+        index.discard(created)
+        assert index.find("New Issue", "0815") is None
+
+    def test_refresh_replaces_changed_issues(self, issue):
+        index = IssueIndex(loader=Mock(return_value=[issue]))
+        renamed = IssueRecord(1, "Renamed Issue", "node_1", "OPEN", "1a2b-3c4d")
+        new_issue = IssueRecord(2, "New Issue", "node_2", "OPEN")
+
+        index.refresh([renamed, new_issue], "2024-01-01T00:00:00Z")
+
+        assert index.find("Existing Issue") is None
+        assert index.find("Renamed Issue") is renamed
+        assert index.find("Other", "1a2b-3c4d") is renamed
+        assert index.find("New Issue") is new_issue
+        assert len(index) == 2
+        assert index.synced_at == "2024-01-01T00:00:00Z"
+
+    def test_load_records_snapshot_time(self, issue):
+        index = IssueIndex(loader=Mock(return_value=[issue]))
+        assert index.synced_at is None
+        index.find("Anything")
+        assert index.synced_at.endswith("Z")
+
+    def test_evict(self):
+        issues = [IssueRecord(n, f"Issue {n}", f"node_{n}", "OPEN", f"page_{n}") for n in range(1, 6)]
+        index = IssueIndex(issues)
+
+        assert index.evict(2, lambda issue: issue.number != 1) == 2
+        assert [issue.number for issue in index.by_number.values()] == [1, 4, 5]
+        assert index.find("Issue 2") is None
+        assert index.find("Anything", "page_3") is None
+        assert index.evict(10, lambda issue: False) == 0
+        assert len(index) == 3
+
+
 class TestGraphQLHelper:
     @pytest.fixture
     def graphql_helper(self):
@@ -135,16 +436,16 @@ class TestGraphQLHelper:
         }
         return mock
 
-    @patch('requests.post')
+    @patch('requests.Session.post')
     def test_query_prj_success(self, mock_post, graphql_helper, mock_response):
         mock_post.return_value = mock_response
         
         result = graphql_helper.query_prj(1)
         
-        assert result == {"id": "proj_123", "title": "Test Project"}
+        assert result == ProjectRef("proj_123", "Test Project")
         mock_post.assert_called_once()
 
-    @patch('requests.post')
+    @patch('requests.Session.post')
     def test_query_prj_failure(self, mock_post, graphql_helper):
         mock_post.return_value.json.return_value = {"data": {"organization": None}}
         
@@ -152,7 +453,7 @@ class TestGraphQLHelper:
         
         assert result is None
 
-    @patch('requests.post')
+    @patch('requests.Session.post')
     def test_add_item_to_prj_success(self, mock_post, graphql_helper):
         mock_post.return_value.json.return_value = {
             "data": {
@@ -169,11 +470,185 @@ class TestGraphQLHelper:
         assert result == "item_456"
         mock_post.assert_called_once()
 
-    @patch('requests.post')
+    @patch('requests.Session.post')
     def test_add_item_to_prj_failure(self, mock_post, graphql_helper):
         mock_post.return_value.json.return_value = {"data": {"addProjectV2ItemById": None}}
         
         result = graphql_helper.add_item_to_prj("proj_123", "issue_789")
         
         assert result is None
-        
\ No newline at end of file
+
+    @patch('requests.Session.post')
+    def test_iter_issues(self, mock_post, graphql_helper):
+        first_page = Mock()
+        first_page.json.return_value = {"data": {"repository": {"issues": {
+            "pageInfo": {"hasNextPage": True, "endCursor": "cursor_1"},
+            "nodes": [{"number": 1, "title": "Issue 1", "id": "node_1", "state": "OPEN", "body": "<!-- notion-page-id: 0815 -->"}]
+        }}}}
+        second_page = Mock()
+        second_page.json.return_value = {"data": {"repository": {"issues": {
+            "pageInfo": {"hasNextPage": False, "endCursor": None},
+            "nodes": [{"number": 2, "title": "Issue 2", "id": "node_2", "state": "CLOSED", "body": ""}]
+        }}}}
+        mock_post.side_effect = [first_page, second_page]
+
+        issues = list(graphql_helper.iter_issues())
+
+        assert issues == [
+            IssueRecord(1, "Issue 1", "node_1", "OPEN", "0815"),
+            IssueRecord(2, "Issue 2", "node_2", "CLOSED", None)
+        ]
+        assert mock_post.call_count == 2
+        variables = mock_post.call_args_list[1].kwargs["json"]["variables"]
+        assert variables == {"owner": "test-org", "name": "test-repo", "first": 100, "after": "cursor_1", "since": None}
+
+    @patch('requests.Session.post')
+    def test_iter_issues_since(self, mock_post, graphql_helper):
+        mock_post.return_value.json.return_value = {"data": {"repository": {"issues": {
+            "pageInfo": {"hasNextPage": False, "endCursor": None},
+            "nodes": []
+        }}}}
+
+        assert list(graphql_helper.iter_issues(since="2024-01-01T00:00:00Z")) == []
+        assert mock_post.call_args.kwargs["json"]["variables"]["since"] == "2024-01-01T00:00:00Z"
+        assert "filterBy: {since: $since}" in mock_post.call_args.kwargs["json"]["query"]
+
+    @patch('requests.Session.post')
+    def test_iter_issues_failure(self, mock_post, graphql_helper):
+        mock_post.return_value.json.return_value = {"errors": [{"message": "Bad credentials"}]}
+
+        with pytest.raises(RuntimeError):
+            list(graphql_helper.iter_issues())
+
+    @patch('requests.Session.post')
+    def test_query_prjs(self, mock_post, graphql_helper):
+        mock_post.return_value.json.return_value = {
+            "data": {
+                "organization": None,
+                "user": {"p1": {"id": "proj_1", "title": "Project 1"}, "p2": None}
+            },
+            "errors": [
+                {"type": "NOT_FOUND", "path": ["organization"], "message": "Could not resolve to an Organization with the login of 'test-org'."},
+                {"type": "NOT_FOUND", "path": ["user", "p2"], "message": "Could not resolve to a ProjectV2 with the number 2."}
+            ]
+        }
+
+        result = graphql_helper.query_prjs([2, 1, 1])
+
+        assert result == {
+            ("organization", 1): None,
+            ("organization", 2): None,
+            ("user", 1): ProjectRef("proj_1", "Project 1"),
+            ("user", 2): None
+        }
+        query = mock_post.call_args.kwargs["json"]["query"]
+        assert "p1: projectV2(number: 1)" in query and "p2: projectV2(number: 2)" in query
+        mock_post.assert_called_once()
+
+    @patch('requests.Session.post')
+    def test_query_prjs_errors_are_not_misses(self, mock_post, graphql_helper):
+        mock_post.return_value.json.return_value = {
+            "data": {"organization": {"p1": None}, "user": None},
+            "errors": [
+                {"type": "INSUFFICIENT_SCOPES", "path": ["organization", "p1"], "message": "Your token has not been granted the required scopes."},
+                {"type": "NOT_FOUND", "path": ["user"], "message": "Could not resolve to a User with the login of 'test-org'."}
+            ]
+        }
+        assert graphql_helper.query_prjs([1]) == {("user", 1): None}
+
+        mock_post.return_value.json.return_value = {"errors": [{"type": "RATE_LIMITED", "message": "API rate limit exceeded"}]}
+        assert graphql_helper.query_prjs([1]) == {}
+
+    @patch('requests.Session.post')
+    def test_add_items_to_prj(self, mock_post, graphql_helper):
+        mock_post.return_value.json.return_value = {
+            "data": {
+                "i0": {"item": {"id": "item_1"}},
+                "i1": None
+            },
+            "errors": [{"path": ["i1"], "message": "Content already exists"}]
+        }
+
+        result = graphql_helper.add_items_to_prj([("proj_1", "issue_1"), ("proj_1", "issue_2")])
+
+        assert result == [("item_1", None), (None, "Content already exists")]
+        mutation = mock_post.call_args.kwargs["json"]["query"]
+        assert 'i0: addProjectV2ItemById(input: {projectId: "proj_1", contentId: "issue_1"})' in mutation
+        assert 'i1: addProjectV2ItemById(input: {projectId: "proj_1", contentId: "issue_2"})' in mutation
+
+    @patch('requests.Session.post')
+    def test_add_items_to_prj_chunks(self, mock_post, graphql_helper):
+        mock_post.return_value.json.return_value = {"data": {"i0": {"item": {"id": "item"}}, "i1": {"item": {"id": "item"}}}}
+
+        result = graphql_helper.add_items_to_prj([("proj_1", f"issue_{i}") for i in range(5)], chunk_size=2)
+
+        assert len(result) == 5
+        assert mock_post.call_count == 3
+        assert result[4] == ("item", None)
+
+
+class TestProjectResolver:
+    @pytest.fixture
+    def graphql_helper(self):
+        helper = Mock(spec=GraphQLHelper)
+        helper.repo = "test-org/test-repo"
+        helper.query_prjs.return_value = {
+            ("organization", 1): None,
+            ("user", 1): ProjectRef("proj_1", "Project 1"),
+            ("organization", 2): None,
+            ("user", 2): None
+        }
+        return helper
+
+    def test_resolve_is_cached(self, graphql_helper):
+        resolver = ProjectResolver(graphql_helper)
+
+        assert resolver.resolve(1.0) == ProjectRef("proj_1", "Project 1")
+        assert resolver.resolve(1) == ProjectRef("proj_1", "Project 1")
+        graphql_helper.query_prjs.assert_called_once_with([1], ("organization", "user"))
+
+    def test_prefetch_batches_and_caches_misses(self, graphql_helper):
+        resolver = ProjectResolver(graphql_helper)
+        resolver.prefetch([1, 2, None, "None"])
+
+        assert resolver.resolve(2) is None
+        assert resolver.resolve(1) == ProjectRef("proj_1", "Project 1")
+        graphql_helper.query_prjs.assert_called_once_with([1, 2], ("organization", "user"))
+
+    def test_unresolved_projects_are_not_cached(self, graphql_helper, tmp_path):
+        state = SyncState(str(tmp_path / "state.json"))
+        graphql_helper.query_prjs.return_value = {}
+        resolver = ProjectResolver(graphql_helper, state)
+
+        assert resolver.resolve(1) is None
+        assert resolver.resolve(1) is None
+        assert graphql_helper.query_prjs.call_count == 2
+        assert state.get_project("test-org", 1, "organization") is None
+
+    def test_resolve_invalid_number(self, graphql_helper):
+        assert ProjectResolver(graphql_helper).resolve(None) is None
+        graphql_helper.query_prjs.assert_not_called()
+
+    def test_persistent_cache(self, graphql_helper, tmp_path):
+        state = SyncState(str(tmp_path / "state.json"))
+        ProjectResolver(graphql_helper, state).resolve(1)
+
+        resolver = ProjectResolver(graphql_helper, state)
+        assert resolver.resolve(1) == ProjectRef("proj_1", "Project 1")
+        graphql_helper.query_prjs.assert_called_once()
+
+    def test_shared_cache_expires(self, graphql_helper):
+        cache = {}
+        ProjectResolver(graphql_helper, cache=cache).resolve(2)
+
+        # A long-running process keeps the cache, a miss is asked for again once it expired
+        with patch('time.time', return_value=time.time() + 24 * 60 * 60 + 1):
+            ProjectResolver(graphql_helper, cache=cache).resolve(2)
+        assert graphql_helper.query_prjs.call_count == 2
+
+    def test_persistent_cache_expires(self, graphql_helper, tmp_path):
+        state = SyncState(str(tmp_path / "state.json"))
+        ProjectResolver(graphql_helper, state, ttl=-1).resolve(1)
+
+        ProjectResolver(graphql_helper, state).resolve(1)
+        assert graphql_helper.query_prjs.call_count == 2
@@ -0,0 +1,35 @@
+import pytest
+
+from utils import HttpSession
+from utils.HttpSession import (configure_session, create_session,
+                               get_pool_size, get_session)
+
+
+class TestHttpSession:
+    @pytest.fixture(autouse=True)
+    def reset_session(self):
+        configure_session(HttpSession.DEFAULT_POOL_SIZE)
+        yield
+        configure_session(HttpSession.DEFAULT_POOL_SIZE)
+
+    def test_create_session(self):
+        session = create_session(pool_size=4)
+        adapter = session.get_adapter("https://api.notion.com")
+
+        assert adapter._pool_maxsize == 4
+        assert session.get_adapter("https://api.github.com") is adapter
+        assert "gzip" in session.headers["Accept-Encoding"]
+        assert session.headers["Connection"] == "keep-alive"
+
+    def test_get_session_is_shared(self):
+        assert get_session() is get_session()
+
+    def test_configure_session(self):
+        session = get_session()
+        configure_session(HttpSession.DEFAULT_POOL_SIZE)
+        assert get_session() is session
+
+        configure_session(20)
+        assert get_pool_size() == 20
+        assert get_session() is not session
+        assert get_session().get_adapter("https://api.github.com")._pool_maxsize == 20
@@ -0,0 +1,55 @@
+import os
+from dataclasses import replace
+
+import pytest
+
+from utils.MappingStore import MappingStore, content_hash
+from utils.PropertyMapping import NotionIssue
+
+
+class TestMappingStore:
+    @pytest.fixture
+    def path(self, tmp_path):
+        return os.path.join(tmp_path, "state", "mapping.jsonl")
+
+    def test_content_hash(self):
+        issue = NotionIssue("Title", "Body", ["a"], ["bug"], project_number=1, id="page-1")
+
+        assert content_hash(issue) == content_hash(replace(issue, id="page-2"))
+        assert content_hash(issue) != content_hash(replace(issue, description="Changed"))
+        # The hash is stored in issue markers, so it must not change with the record type
+        assert content_hash(issue) == "5f09d06f5a53ac8e"
+
+    def test_put_and_reload(self, path):
+        store = MappingStore(path)
+        store.put("page-1", number=1, node_id="node_1", hash="abc")
+        store.put("page-1", project_item_id="item_1")
+        store.put(None, number=2)
+
+        reloaded = MappingStore(path)
+        assert len(reloaded) == 1
+        assert reloaded.get("page-1") == {"number": 1, "node_id": "node_1", "hash": "abc", "project_item_id": "item_1"}
+        assert reloaded.get("unknown") is None
+
+    def test_unknown_field(self, path):
+        with pytest.raises(ValueError):
+            MappingStore(path).put("page-1", title="Title")
+
+    def test_truncated_line_is_ignored(self, path):
+        store = MappingStore(path)
+        store.put("page-1", number=1)
+        with open(path, "a") as mapping_file:
+            mapping_file.write('{"page_id": "page-2", "num')
+
+        assert list(MappingStore(path)) == ["page-1"]
+
+    def test_compact(self, path):
+        store = MappingStore(path)
+        store.put("page-1", number=1)
+        store.put("page-1", hash="abc")
+        store.put("page-2", number=2)
+        store.compact()
+
+        with open(path) as mapping_file:
+            assert len(mapping_file.readlines()) == 2
+        assert MappingStore(path).get("page-1") == {"number": 1, "hash": "abc"}
@@ -0,0 +1,437 @@
+import io
+import json
+import os
+import socket
+import sys
+import threading
+import time
+import unittest
+
+import requests
+
+from benchmarks.fake_api import FakeApiServer, make_notion_pages, utc_now
+from script import run_daemon, serve_notion_webhooks, sync_notion_to_github
+from utils.HttpSession import configure_session
+from utils.RateLimiter import configure_rate_limiter
+from utils.Tracer import get_tracer
+
+
+class TestNotionToGitHubSyncE2E(unittest.TestCase):
+    ENVIRONMENT = ['INPUT_NOTIONTOKEN', 'INPUT_GITHUBTOKEN', 'INPUT_NOTIONDATABASE', 'INPUT_WRITEDELAY', 'GITHUB_REPOSITORY',
+                   'GITHUB_OUTPUT', 'GITHUB_STEP_SUMMARY', 'GITHUB_API_URL', 'GITHUB_GRAPHQL_URL', 'NOTION_API_URL', 'INPUT_TRACEFILE',
+                   'INPUT_MODE', 'INPUT_PLANFILE', 'INPUT_MAPPINGFILE', 'INPUT_UPDATEEXISTING',
+                   'INPUT_NOTIONSTATUSPROPERTY', 'INPUT_NOTIONURLPROPERTY', 'INPUT_NOTIONCLOSEDSTATUS', 'INPUT_NOTIONOPENSTATUS',
+                   'INPUT_PAGEBODY', 'INPUT_STATEFILE', 'INPUT_QUEUEFILE', 'INPUT_WEBHOOKHOST', 'INPUT_WEBHOOKPORT',
+                   'INPUT_WEBHOOKSETTLE', 'INPUT_POLLINTERVAL', 'INPUT_USERMAPPING', 'INPUT_ROUTES']
+
+    def setUp(self):
+        # Small Notion pages and an injected 429 on every 7th request exercise paging and retries
+        self.server = FakeApiServer(make_notion_pages(20), page_size=5, throttle_every=7).start()
+        os.environ['INPUT_NOTIONTOKEN'] = 'fake_notion_token'
+        os.environ['INPUT_GITHUBTOKEN'] = 'fake_github_token'
+        os.environ['INPUT_NOTIONDATABASE'] = 'fake_database_id'
+        os.environ['INPUT_WRITEDELAY'] = '0'
+        os.environ['GITHUB_REPOSITORY'] = 'fake-owner/fake-repo'
+        os.environ['GITHUB_OUTPUT'] = 'github_output.txt'
+        os.environ['GITHUB_STEP_SUMMARY'] = 'github_step_summary.md'
+        os.environ['GITHUB_API_URL'] = self.server.github_url
+        os.environ['GITHUB_GRAPHQL_URL'] = self.server.graphql_url
+        os.environ['NOTION_API_URL'] = self.server.notion_url
+        configure_session()
+        configure_rate_limiter(rates={})
+
+    def tearDown(self):
+        self.server.stop()
+        configure_rate_limiter()
+        for key in self.ENVIRONMENT:
+            os.environ.pop(key, None)
+        for file in ['github_output.txt', 'github_step_summary.md', 'trace.json', 'plan.json', 'mapping.jsonl', 'state.json', 'queue.jsonl']:
+            if os.path.exists(file):
+                os.remove(file)
+
+    def run_sync(self) -> str:
+        sys.stdout = io.StringIO()
+        try:
+            sync_notion_to_github()
+            return sys.stdout.getvalue()
+        finally:
+            sys.stdout = sys.__stdout__
+
+    def test_sync_against_stand_in_api(self):
+        self.run_sync()
+
+        stats = self.server.stats()
+        self.assertEqual(stats["issues"], 20)
+        self.assertEqual(stats["project_items"], 10)
+        self.assertCountEqual([issue["title"] for issue in self.server.issues], [f"Benchmark Issue {i}" for i in range(20)])
+        # Four Notion pages of five rows, plus any injected 429 retries
+        self.assertGreaterEqual(stats["calls"]["POST /databases/{id}/query"], 4)
+
+        numbers = {issue["title"]: issue["number"] for issue in self.server.issues}
+        with open('github_output.txt', 'r') as f:
+            self.assertEqual(f.read(), f"issueNumbers={[numbers[f'Benchmark Issue {i}'] for i in range(20)]}\n")
+
+    def test_sync_without_rate_limit_headers(self):
+        self.server.rate_limit_headers = False
+        self.run_sync()
+
+        # The quota isn't asked for with GET /rate_limit, which GHES without rate limiting doesn't serve
+        self.assertEqual(self.server.stats()["issues"], 20)
+        self.assertNotIn("GET /rate_limit", self.server.stats()["calls"])
+
+    def test_rerun_creates_no_duplicates(self):
+        self.run_sync()
+        os.remove('github_output.txt')
+
+        output = self.run_sync()
+
+        self.assertEqual(self.server.stats()["issues"], 20)
+        self.assertIn("Issue with the same title 'Benchmark Issue 0' already exists on GitHub.", output)
+        self.assertFalse(os.path.exists('github_output.txt'))
+
+    def test_trace_export(self):
+        os.environ['INPUT_TRACEFILE'] = 'trace.json'
+
+        self.run_sync()
+
+        with open('trace.json', 'r') as f:
+            trace = json.load(f)
+        self.assertEqual(trace["endpoints"]["POST /repos/{owner}/{repo}/issues"]["count"], 20)
+        self.assertGreaterEqual(trace["endpoints"]["POST /databases/{id}/query"]["count"], 4)
+        with open('github_output.txt', 'r') as f:
+            self.assertIn("trace=trace.json\n", f.read())
+        with open('github_step_summary.md', 'r') as f:
+            summary = f.read()
+        self.assertIn("| GitHub issue snapshot |", summary)
+        self.assertIn("| POST /graphql |", summary)
+
+    def test_plan_and_apply(self):
+        os.environ['INPUT_MODE'] = 'plan'
+        os.environ['INPUT_PLANFILE'] = 'plan.json'
+
+        output = self.run_sync()
+
+        stats = self.server.stats()
+        self.assertEqual(stats["issues"], 0)
+        self.assertEqual(stats["project_items"], 0)
+        self.assertNotIn("POST /repos/{owner}/{repo}/issues", stats["calls"])
+        self.assertIn("20 issues to create, 0 to update, 0 to skip, 10 project links.", output)
+        with open('github_output.txt', 'r') as f:
+            self.assertEqual(f.read(), "plan=plan.json\n")
+        os.remove('github_output.txt')
+
+        notion_calls = stats["calls"]["POST /databases/{id}/query"]
+        os.environ['INPUT_MODE'] = 'apply'
+        self.run_sync()
+
+        stats = self.server.stats()
+        self.assertEqual(stats["issues"], 20)
+        self.assertEqual(stats["project_items"], 10)
+        self.assertEqual(stats["calls"]["POST /databases/{id}/query"], notion_calls)
+
+        # Running the apply job again finds the created issues by their markers
+        output = self.run_sync()
+
+        self.assertIn("Skipping 20 planned issues that were already created.", output)
+        self.assertEqual(self.server.stats()["issues"], 20)
+        self.assertEqual(self.server.stats()["project_items"], 10)
+
+    def test_apply_checks_the_rate_limit(self):
+        os.environ['INPUT_MODE'] = 'plan'
+        os.environ['INPUT_PLANFILE'] = 'plan.json'
+        self.run_sync()
+
+        self.server.rate_limit_remaining = 5
+        os.environ['INPUT_MODE'] = 'apply'
+        output = self.run_sync()
+
+        # The plan is still applied, its writes back off once the quota is used up
+        self.assertIn("Applying the plan needs 20 GitHub REST calls, only 5 remain.", output)
+        self.assertEqual(self.server.stats()["issues"], 20)
+
+    def test_mapping_store_skips_snapshot(self):
+        os.environ['INPUT_MAPPINGFILE'] = 'mapping.jsonl'
+        self.run_sync()
+
+        with open('mapping.jsonl', 'r') as f:
+            self.assertEqual(len(f.readlines()), 20)
+        graphql_calls = self.server.stats()["calls"]["POST /graphql"]
+
+        self.run_sync()
+
+        # Every page is mapped, so the rerun neither lists the issues nor writes anything
+        stats = self.server.stats()
+        self.assertEqual(stats["issues"], 20)
+        self.assertEqual(stats["calls"]["POST /graphql"], graphql_calls)
+
+    def test_failed_pages_are_read_again(self):
+        self.server.throttle_every = 0
+        os.environ['INPUT_STATEFILE'] = 'state.json'
+        self.server.rejected_titles = {"Benchmark Issue 15"}
+        self.run_sync()
+
+        # The watermark stays at the failed page, the newest edit is later
+        with open('state.json', 'r') as f:
+            self.assertEqual(json.load(f)["databases"]["fake_database_id"]["last_edited_time"], "2022-05-10T17:10:15.000Z")
+        self.assertEqual(len(self.server.issues), 19)
+
+        self.server.rejected_titles = set()
+        self.run_sync()
+
+        self.assertCountEqual([issue["title"] for issue in self.server.issues], [f"Benchmark Issue {i}" for i in range(20)])
+        with open('state.json', 'r') as f:
+            self.assertEqual(json.load(f)["databases"]["fake_database_id"]["last_edited_time"], "2022-05-10T17:10:19.000Z")
+
+    def test_failed_route_keeps_the_shared_watermark(self):
+        self.server.throttle_every = 0
+        os.environ['INPUT_STATEFILE'] = 'state.json'
+        os.environ['INPUT_ROUTES'] = json.dumps([
+            {"database": "fake_database_id", "repository": "fake-repo"},
+            {"database": "fake_database_id", "repository": "other-repo"}
+        ])
+
+        with self.assertRaisesRegex(RuntimeError, "Sync failed for fake-owner/other-repo."):
+            self.run_sync()
+
+        # Both routes read the same database, so its watermark waits for other-repo
+        self.assertEqual(len(self.server.issues), 20)
+        with open('state.json', 'r') as f:
+            self.assertNotIn("last_edited_time", json.load(f)["databases"].get("fake_database_id", {}))
+
+    def test_title_match_is_not_recorded(self):
+        self.server.throttle_every = 0
+        os.environ['INPUT_MAPPINGFILE'] = 'mapping.jsonl'
+        os.environ['INPUT_UPDATEEXISTING'] = 'true'
+        self.server.create_issue({"title": "Benchmark Issue 0", "body": "Written by hand"})
+        self.run_sync()
+        self.run_sync()
+
+        # An issue that only has the same title belongs to no page, so it is neither recorded nor overwritten
+        with open('mapping.jsonl', 'r') as f:
+            self.assertNotIn("page-000000", f.read())
+        self.assertEqual(self.server.issues[0]["body"], "Written by hand")
+        self.assertNotIn("PATCH /repos/{owner}/{repo}/issues/{number}", self.server.stats()["calls"])
+
+    def test_resume_after_interrupted_run(self):
+        self.server.throttle_every = 0
+        os.environ['INPUT_STATEFILE'] = 'state.json'
+        os.environ['INPUT_MAPPINGFILE'] = 'mapping.jsonl'
+        self.run_sync()
+
+        # A run that stopped midway saved no watermark, recorded the first 10 pages without links and the rest not at all
+        with open('state.json', 'r') as f:
+            state = json.load(f)
+        state["databases"] = {}
+        with open('state.json', 'w') as f:
+            json.dump(state, f)
+        with open('mapping.jsonl', 'r') as f:
+            entries = [json.loads(line) for line in f]
+        with open('mapping.jsonl', 'w') as f:
+            for entry in entries[:10]:
+                entry.pop("project_item_id", None)
+                f.write(json.dumps(entry) + "\n")
+        self.server.project_items.clear()
+        listings = len(self.server.issue_listings)
+
+        self.run_sync()
+
+        # Only the missing links are made, and the checkpointed snapshot is refreshed instead of listed again
+        self.assertEqual(len(self.server.issues), 20)
+        self.assertEqual(len(self.server.project_items), 10)
+        self.assertEqual(self.server.issue_listings[listings:], [state["snapshots"]["fake-owner/fake-repo"]["synced_at"]])
+
+    def test_update_existing_patches_changed_pages(self):
+        # Exact request counts, without injected 429s
+        self.server.throttle_every = 0
+        os.environ['INPUT_UPDATEEXISTING'] = 'true'
+        self.run_sync()
+        os.remove('github_output.txt')
+
+        self.server.notion_pages[3]["properties"]["Discription"]["rich_text"][0]["plain_text"] = "Edited body"
+        self.run_sync()
+
+        # Only the edited page is written, unchanged pages cost no write calls
+        stats = self.server.stats()
+        self.assertEqual(stats["issues"], 20)
+        self.assertEqual(stats["calls"]["PATCH /repos/{owner}/{repo}/issues/{number}"], 1)
+        issue = next(i for i in self.server.issues if i["title"] == "Benchmark Issue 3")
+        self.assertTrue(issue["body"].startswith("Edited body\n\n<!-- notion-page-id: page-000003 hash: "))
+        with open('github_output.txt', 'r') as f:
+            self.assertEqual(f.read(), f"updatedIssueNumbers=[{issue['number']}]\n")
+
+    def test_status_sync(self):
+        # Exact request counts, without injected 429s
+        self.server.throttle_every = 0
+        os.environ['INPUT_MAPPINGFILE'] = 'mapping.jsonl'
+        os.environ['INPUT_NOTIONSTATUSPROPERTY'] = 'Status'
+        os.environ['INPUT_NOTIONURLPROPERTY'] = 'GitHub Issue'
+        os.environ['INPUT_NOTIONCLOSEDSTATUS'] = 'Done, Cancelled'
+        os.environ['INPUT_NOTIONOPENSTATUS'] = 'In progress'
+        self.run_sync()
+
+        # The issue URLs are written back with one request per page
+        pages = {page["id"]: page for page in self.server.notion_pages}
+        numbers = {issue["title"]: issue["number"] for issue in self.server.issues}
+        self.assertEqual(self.server.stats()["calls"]["PATCH /pages/{id}"], 20)
+        self.assertEqual(pages["page-000002"]["properties"]["GitHub Issue"]["url"],
+                         f"https://github.com/fake-owner/fake-repo/issues/{numbers['Benchmark Issue 2']}")
+
+        # Closed in Notion and on GitHub
+        pages["page-000002"]["properties"]["Status"]["status"] = {"name": "Cancelled"}
+        self.server.issues[numbers["Benchmark Issue 5"] - 1]["state"] = "closed"
+        self.run_sync()
+
+        self.assertEqual(self.server.issues[numbers["Benchmark Issue 2"] - 1]["state"], "closed")
+        self.assertEqual(pages["page-000005"]["properties"]["Status"], {"id": "Status", "type": "status", "status": {"name": "Done"}})
+        self.assertEqual(self.server.stats()["calls"]["PATCH /pages/{id}"], 21)
+        self.assertEqual(self.server.stats()["calls"]["PATCH /repos/{owner}/{repo}/issues/{number}"], 1)
+
+        # Reopened on GitHub
+        self.server.issues[numbers["Benchmark Issue 5"] - 1]["state"] = "open"
+        self.run_sync()
+
+        self.assertEqual(pages["page-000005"]["properties"]["Status"]["status"], {"name": "In progress"})
+        self.assertEqual(self.server.issues[numbers["Benchmark Issue 2"] - 1]["state"], "closed")
+        self.assertEqual(self.server.stats()["calls"]["PATCH /pages/{id}"], 22)
+
+    def test_status_sync_of_unedited_pages(self):
+        self.server.throttle_every = 0
+        os.environ['INPUT_STATEFILE'] = 'state.json'
+        os.environ['INPUT_MAPPINGFILE'] = 'mapping.jsonl'
+        os.environ['INPUT_NOTIONSTATUSPROPERTY'] = 'Status'
+        os.environ['INPUT_NOTIONCLOSEDSTATUS'] = 'Done'
+        self.run_sync()
+
+        # Closed on GitHub only, the Notion page isn't edited and so not part of the next incremental read
+        issue = next(i for i in self.server.issues if i["title"] == "Benchmark Issue 4")
+        issue["state"], issue["updated_at"] = "closed", utc_now()
+        self.run_sync()
+
+        page = next(p for p in self.server.notion_pages if p["id"] == "page-000004")
+        self.assertEqual(page["properties"]["Status"]["status"], {"name": "Done"})
+        self.assertEqual(self.server.stats()["calls"]["GET /pages/{id}"], 1)
+
+    def test_page_body(self):
+        self.server.throttle_every = 0
+        os.environ['INPUT_PAGEBODY'] = 'true'
+        os.environ['INPUT_STATEFILE'] = 'state.json'
+        self.run_sync()
+
+        issue = next(i for i in self.server.issues if i["title"] == "Benchmark Issue 0")
+        self.assertTrue(issue["body"].startswith(
+            "Benchmark body 0\n\n## Details\n\n**Important**\n\n- List item\n  - Nested item\n\n<!-- notion-page-id: page-000000"
+        ))
+        # One request per page and one for the nested list
+        self.assertEqual(self.server.stats()["calls"]["GET /blocks/{id}/children"], 40)
+
+        self.run_sync()
+
+        # Unchanged pages are read from the state file
+        self.assertEqual(self.server.stats()["calls"]["GET /blocks/{id}/children"], 40)
+
+    def test_assignees_mapped_and_checked(self):
+        self.server.throttle_every = 0
+        os.environ['INPUT_USERMAPPING'] = 'Ada Lovelace: fake-owner'
+        for page in self.server.notion_pages[:3]:
+            page["properties"]["Assignees"]["multi_select"] = [{"name": "Ada Lovelace"}, {"name": "Nobody"}]
+        self.run_sync()
+
+        issue = next(i for i in self.server.issues if i["title"] == "Benchmark Issue 0")
+        # Unknown users are left out instead of failing the issue
+        self.assertEqual(issue["assignees"], ["fake-owner"])
+        self.assertEqual(self.server.stats()["issues"], 20)
+        self.assertEqual(self.server.stats()["calls"]["GET /repos/{owner}/{repo}/assignees"], 1)
+
+    def test_webhook_syncs_only_changed_pages(self):
+        self.server.throttle_every = 0
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        os.environ['INPUT_WEBHOOKHOST'] = '127.0.0.1'
+        os.environ['INPUT_WEBHOOKPORT'] = str(port)
+        os.environ['INPUT_WEBHOOKSETTLE'] = '0'
+        os.environ['INPUT_QUEUEFILE'] = 'queue.jsonl'
+        os.environ['INPUT_MAPPINGFILE'] = 'mapping.jsonl'
+        os.environ['INPUT_UPDATEEXISTING'] = 'true'
+        stop = threading.Event()
+        sys.stdout = io.StringIO()
+        worker = threading.Thread(target=serve_notion_webhooks, args=(stop,))
+        worker.start()
+
+        def wait_for(condition):
+            deadline = time.monotonic() + 10
+            while not condition() and time.monotonic() < deadline:
+                time.sleep(0.05)
+            self.assertTrue(condition())
+
+        def post(payload):
+            for _ in range(100):
+                try:
+                    return requests.post(f"http://127.0.0.1:{port}", json=payload)
+                except requests.ConnectionError:
+                    time.sleep(0.05)
+
+        try:
+            # A webhook event and an automation payload
+            self.assertEqual(post({"type": "page.created", "entity": {"id": "page-000003", "type": "page"}}).status_code, 202)
+            post({"source": {"type": "automation"}, "data": self.server.notion_pages[7]})
+            wait_for(lambda: len(self.server.issues) == 2)
+
+            self.server.notion_pages[3]["properties"]["Discription"]["rich_text"][0]["plain_text"] = "Edited body"
+            post({"type": "page.content_updated", "entity": {"id": "page-000003", "type": "page"}})
+            wait_for(lambda: self.server.issues[0]["body"].startswith("Edited body"))
+        finally:
+            stop.set()
+            worker.join(10)
+            sys.stdout = sys.__stdout__
+
+        # Only the changed pages were read, the database was never queried
+        calls = self.server.stats()["calls"]
+        self.assertEqual([issue["title"] for issue in self.server.issues], ["Benchmark Issue 3", "Benchmark Issue 7"])
+        self.assertEqual(calls["GET /pages/{id}"], 3)
+        self.assertNotIn("POST /databases/{id}/query", calls)
+        self.assertEqual(calls["PATCH /repos/{owner}/{repo}/issues/{number}"], 1)
+        self.assertFalse(worker.is_alive())
+
+    def test_daemon_polls_changes_with_warm_clients(self):
+        self.server.throttle_every = 0
+        os.environ['INPUT_POLLINTERVAL'] = '0.1'
+        os.environ['INPUT_UPDATEEXISTING'] = 'true'
+        stop = threading.Event()
+        sys.stdout = io.StringIO()
+        worker = threading.Thread(target=run_daemon, args=(stop,))
+        worker.start()
+
+        def wait_for(condition):
+            deadline = time.monotonic() + 10
+            while not condition() and time.monotonic() < deadline:
+                time.sleep(0.05)
+            self.assertTrue(condition())
+
+        try:
+            wait_for(lambda: len(self.server.issues) == 20)
+            page = self.server.notion_pages[3]
+            page["properties"]["Discription"]["rich_text"][0]["plain_text"] = "Edited body"
+            page["last_edited_time"] = "2022-05-10T17:11:00.000Z"
+            issue = next(i for i in self.server.issues if i["title"] == "Benchmark Issue 3")
+            wait_for(lambda: issue["body"].startswith("Edited body"))
+            cycles = len(self.server.issue_listings)
+            wait_for(lambda: len(self.server.issue_listings) > cycles + 1)
+        finally:
+            stop.set()
+            worker.join(10)
+            output = sys.stdout.getvalue()
+            sys.stdout = sys.__stdout__
+
+        # The repository is looked up once, later cycles only read what changed
+        calls = self.server.stats()["calls"]
+        # Every cycle drops its trace, so the trace doesn't keep the requests of earlier cycles
+        self.assertIn("Cycle trace: ", output)
+        self.assertLess(len(get_tracer().requests), sum(calls.values()))
+        self.assertEqual(len(self.server.issues), 20)
+        self.assertEqual(calls["GET /repos/{owner}/{repo}"], 1)
+        self.assertEqual(calls["GET /databases/{id}"], 1)
+        self.assertEqual(calls["PATCH /repos/{owner}/{repo}/issues/{number}"], 1)
+        self.assertIsNone(self.server.issue_listings[0])
+        self.assertTrue(all(self.server.issue_listings[1:]))
+        self.assertFalse(worker.is_alive())
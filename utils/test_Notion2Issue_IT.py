@@ -1,10 +1,16 @@
 import io
+import json
 import os
 import sys
+import time
 import unittest
+from dataclasses import replace
 from unittest.mock import MagicMock, patch
 
 from script import sync_notion_to_github
+from utils.GitHubHelper import IssueRecord, ProjectRef
+from utils.MappingStore import content_hash
+from utils.PropertyMapping import NotionIssue
 
 
 class TestNotionToGitHubSync(unittest.TestCase):
@@ -17,11 +23,12 @@ class TestNotionToGitHubSync(unittest.TestCase):
         os.environ['GITHUB_STEP_SUMMARY'] = 'github_step_summary.md'
 
     def tearDown(self):
-        for key in ['INPUT_NOTIONTOKEN', 'INPUT_GITHUBTOKEN', 'INPUT_NOTIONDATABASE', 'GITHUB_REPOSITORY', 'GITHUB_OUTPUT', 'GITHUB_STEP_SUMMARY']:
+        for key in ['INPUT_NOTIONTOKEN', 'INPUT_GITHUBTOKEN', 'INPUT_NOTIONDATABASE', 'GITHUB_REPOSITORY', 'GITHUB_OUTPUT', 'GITHUB_STEP_SUMMARY',
+                    'INPUT_STATEFILE', 'INPUT_FULLSYNC', 'INPUT_NOTIONFILTER', 'INPUT_WORKERS', 'INPUT_ROUTES']:
             if key in os.environ:
                 del os.environ[key]
         
-        for file in ['github_output.txt', 'github_step_summary.md']:
+        for file in ['github_output.txt', 'github_step_summary.md', 'sync_state.json']:
             if os.path.exists(file):
                 os.remove(file)
 
@@ -38,26 +45,14 @@ class TestNotionToGitHubSync(unittest.TestCase):
     @patch('script.GraphQLHelper')
     def test_sync_successfully(self, MockGraphQLHelper, MockGitHubHelper, MockNotionHelper):
         mock_notion_helper = MockNotionHelper.return_value
-        mock_notion_helper.get_notion_issues.return_value = [
-            {
-                "title": "Test Issue 1",
-                "description": "Test Description 1",
-                "assignees": ["TestUser1"],
-                "labels": ["bug"],
-                "project_number": 1
-            },
-            {
-                "title": "Test Issue 2",
-                "description": "Test Description 2",
-                "assignees": ["TestUser2"],
-                "labels": ["enhancement"],
-                "project_number": 1
-            }
+        mock_notion_helper.iter_notion_issues.return_value = [
+            NotionIssue("Test Issue 1", "Test Description 1", ["TestUser1"], ["bug"], project_number=1),
+            NotionIssue("Test Issue 2", "Test Description 2", ["TestUser2"], ["enhancement"], project_number=1)
         ]
 
         mock_github_helper = MockGitHubHelper.return_value
-        mock_github_helper.get_issues.return_value = []
-        mock_github_helper.create_job_summary.return_value = "Fake summary"
+        MockGraphQLHelper.return_value.iter_issues.return_value = []
+        mock_github_helper.write_job_summary.side_effect = lambda summary_file, *args, **kwargs: summary_file.write("Fake summary")
         mock_repo = MagicMock()
         mock_github_helper.repo = mock_repo
         mock_repo.has_projects = True
@@ -72,11 +67,16 @@ class TestNotionToGitHubSync(unittest.TestCase):
         mock_issue2.number = 2
         mock_issue2.raw_data = {"node_id": "fake_node_id_2"}
         
-        mock_github_helper.create_issue.side_effect = [mock_issue1, mock_issue2]
+        created_issues = {"Test Issue 1": mock_issue1, "Test Issue 2": mock_issue2}
+        mock_github_helper.create_issue.side_effect = lambda title, *args, **kwargs: created_issues[title]
 
         mock_graphql_helper = MockGraphQLHelper.return_value
-        mock_graphql_helper.query_prj.return_value = {"id": "fake_project_id", "title": "Test Project"}
-        mock_graphql_helper.add_item_to_prj.return_value = True
+        mock_graphql_helper.repo = "fake_owner/fake_repo"
+        mock_graphql_helper.query_prjs.return_value = {
+            ("organization", 1): ProjectRef("fake_project_id", "Test Project"),
+            ("user", 1): None
+        }
+        mock_graphql_helper.add_items_to_prj.return_value = [("item_1", None), ("item_2", None)]
 
         self.capture_output()
         sync_notion_to_github()
@@ -85,32 +85,39 @@ class TestNotionToGitHubSync(unittest.TestCase):
         self.assertIn("Issue 'Test Issue 1' added to project 'Test Project' successfully.", output)
         self.assertIn("Issue 'Test Issue 2' added to project 'Test Project' successfully.", output)
         
-        mock_github_helper.get_issues.assert_called_once()
-        mock_github_helper.create_job_summary.assert_called_once()
+        MockGraphQLHelper.return_value.iter_issues.assert_called_once()
+        mock_github_helper.write_job_summary.assert_called_once()
         self.assertEqual(mock_github_helper.create_issue.call_count, 2)
         mock_github_helper.create_issue.assert_any_call(
             "Test Issue 1",
             "Test Description 1",
             ["TestUser1"],
-            ["bug"]
+            ["bug"],
+            summary=False,
+            milestone=None
         )
         mock_github_helper.create_issue.assert_any_call(
             "Test Issue 2",
             "Test Description 2",
             ["TestUser2"],
-            ["enhancement"]
+            ["enhancement"],
+            summary=False,
+            milestone=None
         )
-        self.assertEqual(mock_graphql_helper.query_prj.call_count, 2)
-        self.assertEqual(mock_graphql_helper.add_item_to_prj.call_count, 2)
+        mock_graphql_helper.query_prjs.assert_called_once_with([1], ("organization", "user"))
+        mock_graphql_helper.add_items_to_prj.assert_called_once_with(
+            [("fake_project_id", "fake_node_id_1"), ("fake_project_id", "fake_node_id_2")], 25
+        )
+        self.assertEqual(mock_github_helper.update_project_link_status.call_count, 2)
 
         self.assertTrue(os.path.exists('github_output.txt'), "github_output.txt file was not created")
         self.assertTrue(os.path.exists('github_step_summary.md'), "github_step_summary.md file was not created")
         
         with open('github_output.txt', 'r') as f:
             github_output = f.read()
-        self.assertEqual(github_output, "issueNumbers=[1, 2]")
+        self.assertEqual(github_output, "issueNumbers=[1, 2]\n")
 
-        mock_github_helper.create_job_summary.assert_called_once()
+        mock_github_helper.write_job_summary.assert_called_once()
         with open('github_step_summary.md', 'r') as f:
             summary_output = f.read()
         self.assertEqual(summary_output, "Fake summary")
@@ -118,23 +125,17 @@ class TestNotionToGitHubSync(unittest.TestCase):
 
     @patch('script.NotionHelper')
     @patch('script.GitHubHelper')
-    def test_existing_issue(self, MockGitHubHelper, MockNotionHelper):
+    @patch('script.GraphQLHelper')
+    def test_existing_issue(self, MockGraphQLHelper, MockGitHubHelper, MockNotionHelper):
         mock_notion_helper = MockNotionHelper.return_value
-        mock_notion_helper.get_notion_issues.return_value = [
-            {
-                "title": "Existing Issue",
-                "description": "Test Description",
-                "assignees": ["TestUser"],
-                "labels": ["bug"],
-                "project_number": 1
-            }
+        mock_notion_helper.iter_notion_issues.return_value = [
+            NotionIssue("Existing Issue", "Test Description", ["TestUser"], ["bug"], project_number=1)
         ]
 
         mock_github_helper = MockGitHubHelper.return_value
-        existing_issue = MagicMock()
-        existing_issue.title = "Existing Issue"
-        mock_github_helper.get_issues.return_value = [existing_issue]
-        mock_github_helper.create_job_summary.return_value = "Fake summary"
+        existing_issue = IssueRecord(5, "Existing Issue", "fake_node_id_5", "CLOSED")
+        MockGraphQLHelper.return_value.iter_issues.return_value = [existing_issue]
+        mock_github_helper.write_job_summary.side_effect = lambda summary_file, *args, **kwargs: summary_file.write("Fake summary")
 
         self.capture_output()
         sync_notion_to_github()
@@ -142,7 +143,7 @@ class TestNotionToGitHubSync(unittest.TestCase):
 
         self.assertIn("Issue with the same title 'Existing Issue' already exists on GitHub.", output)
         mock_github_helper.create_issue.assert_not_called()
-        mock_github_helper.create_job_summary.assert_called_once()
+        mock_github_helper.write_job_summary.assert_called_once()
         self.assertFalse(os.path.exists('github_output.txt'), "github_output.txt file was created")
         self.assertTrue(os.path.exists('github_step_summary.md'), "github_step_summary.md file was not created")
 
@@ -152,18 +153,12 @@ class TestNotionToGitHubSync(unittest.TestCase):
     @patch('script.GraphQLHelper')
     def test_no_project_linked(self, MockGraphQLHelper, MockGitHubHelper, MockNotionHelper):
         mock_notion_helper = MockNotionHelper.return_value
-        mock_notion_helper.get_notion_issues.return_value = [
-            {
-                "title": "Test Issue",
-                "description": "Test Description",
-                "assignees": ["TestUser"],
-                "labels": ["bug"],
-                "project_number": 1
-            }
+        mock_notion_helper.iter_notion_issues.return_value = [
+            NotionIssue("Test Issue", "Test Description", ["TestUser"], ["bug"], project_number=1)
         ]
 
         mock_github_helper = MockGitHubHelper.return_value
-        mock_github_helper.get_issues.return_value = []
+        MockGraphQLHelper.return_value.iter_issues.return_value = []
         mock_repo = MagicMock()
         mock_github_helper.repo = mock_repo
         mock_repo.has_projects = False
@@ -171,7 +166,7 @@ class TestNotionToGitHubSync(unittest.TestCase):
         mock_issue.title = "Test Issue"
         mock_issue.number = 1
         mock_github_helper.create_issue.return_value = mock_issue
-        mock_github_helper.create_job_summary.return_value = "Fake summary"
+        mock_github_helper.write_job_summary.side_effect = lambda summary_file, *args, **kwargs: summary_file.write("Fake summary")
 
         self.capture_output()
         sync_notion_to_github()
@@ -179,32 +174,26 @@ class TestNotionToGitHubSync(unittest.TestCase):
 
         self.assertIn("Current repository isn't linked to a project.", output)
         mock_github_helper.create_issue.assert_called_once()
-        mock_github_helper.create_job_summary.assert_called_once()
+        mock_github_helper.write_job_summary.assert_called_once()
         
         self.assertTrue(os.path.exists('github_output.txt'), "github_output.txt file was not created")
         self.assertTrue(os.path.exists('github_step_summary.md'), "github_step_summary.md file was not created")
 
         with open('github_output.txt', 'r') as f:
             github_output = f.read()
-        self.assertEqual(github_output, "issueNumbers=[1]")
+        self.assertEqual(github_output, "issueNumbers=[1]\n")
 
     @patch('script.NotionHelper')
     @patch('script.GitHubHelper')
     @patch('script.GraphQLHelper')
     def test_project_not_found(self, MockGraphQLHelper, MockGitHubHelper, MockNotionHelper):
         mock_notion_helper = MockNotionHelper.return_value
-        mock_notion_helper.get_notion_issues.return_value = [
-            {
-                "title": "Test Issue",
-                "description": "Test Description",
-                "assignees": ["TestUser"],
-                "labels": ["bug"],
-                "project_number": 999
-            }
+        mock_notion_helper.iter_notion_issues.return_value = [
+            NotionIssue("Test Issue", "Test Description", ["TestUser"], ["bug"], project_number=999)
         ]
 
         mock_github_helper = MockGitHubHelper.return_value
-        mock_github_helper.get_issues.return_value = []
+        MockGraphQLHelper.return_value.iter_issues.return_value = []
         mock_repo = MagicMock()
         mock_github_helper.repo = mock_repo
         mock_repo.has_projects = True
@@ -212,10 +201,11 @@ class TestNotionToGitHubSync(unittest.TestCase):
         mock_issue.title = "Test Issue"
         mock_issue.number = 1
         mock_github_helper.create_issue.return_value = mock_issue
-        mock_github_helper.create_job_summary.return_value = "Fake summary"
+        mock_github_helper.write_job_summary.side_effect = lambda summary_file, *args, **kwargs: summary_file.write("Fake summary")
 
         mock_graphql_helper = MockGraphQLHelper.return_value
-        mock_graphql_helper.query_prj.return_value = None
+        mock_graphql_helper.repo = "fake_owner/fake_repo"
+        mock_graphql_helper.query_prjs.return_value = {("organization", 999): None, ("user", 999): None}
 
         self.capture_output()
         sync_notion_to_github()
@@ -223,7 +213,7 @@ class TestNotionToGitHubSync(unittest.TestCase):
 
         self.assertIn("Cannot find a linked project with number 999. Please link the correct project manually.", output)
         mock_github_helper.create_issue.assert_called_once()
-        mock_github_helper.create_job_summary.assert_called_once()
+        mock_github_helper.write_job_summary.assert_called_once()
 
         self.assertTrue(os.path.exists('github_output.txt'), "github_output.txt file was not created")
         self.assertTrue(os.path.exists('github_step_summary.md'), "github_step_summary.md file was not created")
@@ -231,4 +221,163 @@ class TestNotionToGitHubSync(unittest.TestCase):
         
         with open('github_output.txt', 'r') as f:
             github_output = f.read()
-        self.assertEqual(github_output, "issueNumbers=[1]")
+        self.assertEqual(github_output, "issueNumbers=[1]\n")
+
+    @patch('script.NotionHelper')
+    @patch('script.GitHubHelper')
+    @patch('script.GraphQLHelper')
+    def test_incremental_sync(self, MockGraphQLHelper, MockGitHubHelper, MockNotionHelper):
+        os.environ['INPUT_STATEFILE'] = 'sync_state.json'
+        os.environ['INPUT_NOTIONFILTER'] = '{"property": "Sync", "checkbox": {"equals": true}}'
+        with open('sync_state.json', 'w') as f:
+            f.write('{"databases": {"fake_database_id": {"last_edited_time": "2022-05-01T00:00:00.000Z"}}}')
+
+        mock_notion_helper = MockNotionHelper.return_value
+        mock_notion_helper.iter_notion_issues.return_value = []
+        mock_notion_helper.watermark = "2022-05-10T17:10:00.000Z"
+        mock_github_helper = MockGitHubHelper.return_value
+        MockGraphQLHelper.return_value.repo = "fake_owner/fake_repo"
+        MockGraphQLHelper.return_value.iter_issues.return_value = []
+        mock_github_helper.write_job_summary.side_effect = lambda summary_file, *args, **kwargs: summary_file.write("Fake summary")
+
+        self.capture_output()
+        sync_notion_to_github()
+        self.release_output()
+
+        mock_notion_helper.iter_notion_issues.assert_called_once_with(
+            since="2022-05-01T00:00:00.000Z",
+            filters=[{"property": "Sync", "checkbox": {"equals": True}}]
+        )
+        with open('sync_state.json', 'r') as f:
+            self.assertIn("2022-05-10T17:10:00.000Z", f.read())
+
+        os.environ['INPUT_FULLSYNC'] = 'true'
+        self.capture_output()
+        sync_notion_to_github()
+        self.release_output()
+
+        self.assertIsNone(mock_notion_helper.iter_notion_issues.call_args.kwargs["since"])
+
+    @patch('script.NotionHelper')
+    @patch('script.GitHubHelper')
+    @patch('script.GraphQLHelper')
+    def test_duplicate_in_same_run(self, MockGraphQLHelper, MockGitHubHelper, MockNotionHelper):
+        mock_notion_helper = MockNotionHelper.return_value
+        new_issue = NotionIssue("Duplicate Issue", "Test Description", [], [], id="page-1")
+        mock_notion_helper.iter_notion_issues.return_value = [new_issue, replace(new_issue, id="page-2")]
+
+        mock_github_helper = MockGitHubHelper.return_value
+        MockGraphQLHelper.return_value.iter_issues.return_value = []
+        mock_github_helper.write_job_summary.side_effect = lambda summary_file, *args, **kwargs: summary_file.write("Fake summary")
+        mock_issue = MagicMock()
+        mock_issue.number = 1
+        mock_github_helper.create_issue.return_value = mock_issue
+
+        self.capture_output()
+        sync_notion_to_github()
+        output = self.release_output()
+
+        self.assertIn("Issue with the same title 'Duplicate Issue' already exists on GitHub.", output)
+        MockGraphQLHelper.return_value.iter_issues.assert_called_once()
+        mock_github_helper.create_issue.assert_called_once_with(
+            "Duplicate Issue",
+            f"Test Description\n\n<!-- notion-page-id: page-1 hash: {content_hash(new_issue)} -->",
+            [],
+            [],
+            summary=False,
+            milestone=None
+        )
+
+    @patch('script.NotionHelper')
+    @patch('script.GitHubHelper')
+    @patch('script.GraphQLHelper')
+    def test_concurrent_creation_keeps_notion_order(self, MockGraphQLHelper, MockGitHubHelper, MockNotionHelper):
+        os.environ['INPUT_WORKERS'] = '4'
+        titles = [f"Issue {i}" for i in range(10)]
+        mock_notion_helper = MockNotionHelper.return_value
+        mock_notion_helper.iter_notion_issues.return_value = [
+            NotionIssue(title, id=f"page-{i}")
+            for i, title in enumerate(titles)
+        ]
+
+        mock_github_helper = MockGitHubHelper.return_value
+        mock_github_helper.summary_data = []
+        mock_github_helper.write_job_summary.side_effect = lambda summary_file, *args, **kwargs: summary_file.write("Fake summary")
+        MockGraphQLHelper.return_value.iter_issues.return_value = []
+
+        def create_issue(title, *args, **kwargs):
+            # Later issues finish first
+            number = titles.index(title)
+            time.sleep((10 - number) * 0.005)
+            issue = MagicMock()
+            issue.number = number + 1
+            issue.html_url = f"https://github.com/fake_owner/fake_repo/issues/{number + 1}"
+            return issue
+        mock_github_helper.create_issue.side_effect = create_issue
+
+        self.capture_output()
+        sync_notion_to_github()
+        self.release_output()
+
+        with open('github_output.txt', 'r') as f:
+            self.assertEqual(f.read(), f"issueNumbers={list(range(1, 11))}\n")
+        self.assertEqual([call.args[0].title for call in mock_github_helper.add_result.call_args_list], titles)
+
+    @patch('script.NotionHelper')
+    @patch('script.GitHubHelper')
+    @patch('script.GraphQLHelper')
+    def test_routes_fan_out_to_repositories(self, MockGraphQLHelper, MockGitHubHelper, MockNotionHelper):
+        del os.environ['INPUT_NOTIONDATABASE']
+        os.environ['INPUT_ROUTES'] = json.dumps([
+            {"database": "db-1", "repository": "fake_owner/repo-1"},
+            {"database": "db-2", "repository": "repo-2"}
+        ])
+        notion_helpers = {}
+        for database_id in ["db-1", "db-2"]:
+            notion_helper = MagicMock()
+            notion_helper.iter_notion_issues.return_value = [
+                NotionIssue(f"Issue from {database_id}", id=f"{database_id}-page")
+            ]
+            notion_helpers[database_id] = notion_helper
+        MockNotionHelper.side_effect = lambda token, database_id, **kwargs: notion_helpers[database_id]
+
+        gh_helpers = {}
+
+        def make_gh_helper(token, repository, *args, **kwargs):
+            gh_helper = MagicMock()
+            gh_helper.summary_data = []
+            gh_helper.write_job_summary.side_effect = lambda summary_file, *args, **kwargs: summary_file.write(f"Summary of {repository}\n")
+            issue = MagicMock()
+            issue.number = len(gh_helpers) + 1
+            gh_helper.create_issue.return_value = issue
+            gh_helpers[repository] = gh_helper
+            return gh_helper
+        MockGitHubHelper.side_effect = make_gh_helper
+        MockGraphQLHelper.return_value.iter_issues.return_value = []
+
+        self.capture_output()
+        sync_notion_to_github()
+        self.release_output()
+
+        self.assertCountEqual(gh_helpers, ["fake_owner/repo-1", "fake_owner/repo-2"])
+        gh_helpers["fake_owner/repo-1"].create_issue.assert_called_once()
+        self.assertEqual(gh_helpers["fake_owner/repo-1"].create_issue.call_args[0][0], "Issue from db-1")
+        gh_helpers["fake_owner/repo-2"].create_issue.assert_called_once()
+        self.assertEqual(gh_helpers["fake_owner/repo-2"].create_issue.call_args[0][0], "Issue from db-2")
+        numbers = {repository: [gh_helper.create_issue.return_value.number] for repository, gh_helper in gh_helpers.items()}
+        with open('github_output.txt', 'r') as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines[1], f"issueNumbersByRepository={json.dumps(numbers)}")
+        with open('github_step_summary.md', 'r') as f:
+            summary = f.read()
+        self.assertIn("Summary of fake_owner/repo-1", summary)
+        self.assertIn("Summary of fake_owner/repo-2", summary)
+
+    def test_routes_require_sync_mode(self):
+        os.environ['INPUT_ROUTES'] = '[{"database": "db-1", "repository": "repo-1"}]'
+        os.environ['INPUT_MODE'] = 'plan'
+        try:
+            with self.assertRaises(ValueError):
+                sync_notion_to_github()
+        finally:
+            del os.environ['INPUT_MODE']
@@ -1,11 +1,15 @@
 import json
 import os
+from datetime import datetime, timezone
 from typing import List
 from unittest.mock import MagicMock, patch
 
 import pytest
+import requests
 
 from utils.NotionHelper import NotionHelper
+from utils.PropertyMapping import PropertyMapping
+from utils.SyncState import SyncState
 
 
 class TestNotionHelper():
@@ -68,22 +72,252 @@ class TestNotionHelper():
         properties = resource_data[0].get("properties")
         assert notion_helper.get_number(properties, "NonexistentNumber") is None
 
-    @patch('requests.post')
+    @patch('requests.Session.post')
     def test_get_notion_issues(self, mock_post, notion_helper, resource_data):
         mock_response = MagicMock()
-        mock_response.json.return_value = {"results": resource_data}
+        mock_response.json.return_value = {"results": list(reversed(resource_data)), "has_more": False}
         mock_post.return_value = mock_response
 
         issues = notion_helper.get_notion_issues()
 
+        mock_post.assert_called_once()
+        assert mock_post.call_args.kwargs["json"]["sorts"] == [{"timestamp": "created_time", "direction": "ascending"}]
+
+        assert len(issues) == 2
+        assert issues[0].id == "0815"
+        assert issues[0].title == "Sample One"
+        assert issues[1].title == "Sample Two"
+        assert issues[0].description == "My Sample Body 1"
+        assert issues[1].description == "My Sample Body 2"
+        assert issues[0].assignees == ["martingrosche"]
+        assert issues[1].assignees == []
+        assert issues[0].labels == ["feature request"]
+        assert issues[1].labels == ["bug"]
+        assert issues[0].project_number == 1
+        assert issues[1].project_number == 'None'
+
+    @patch('requests.Session.post')
+    def test_iter_notion_issues_follows_cursor(self, mock_post, notion_helper, resource_data):
+        first_page = MagicMock()
+        first_page.json.return_value = {"results": [resource_data[1]], "has_more": True, "next_cursor": "cursor_1"}
+        second_page = MagicMock()
+        second_page.json.return_value = {"results": [resource_data[0]], "has_more": False, "next_cursor": None}
+        mock_post.side_effect = [first_page, second_page]
+
+        issues = notion_helper.iter_notion_issues()
+
+        assert next(issues).title == "Sample One"
+        assert mock_post.call_count == 1
+        assert next(issues).title == "Sample Two"
+        assert mock_post.call_count == 2
+        assert "start_cursor" not in mock_post.call_args_list[0].kwargs["json"]
+        assert mock_post.call_args_list[1].kwargs["json"]["start_cursor"] == "cursor_1"
+        assert list(issues) == []
+
+    def test_build_filter(self, notion_helper):
+        sync_filter = {"property": "Sync", "checkbox": {"equals": True}}
+
+        assert notion_helper.build_filter() is None
+        assert notion_helper.build_filter(filters=[sync_filter]) == sync_filter
+        assert notion_helper.build_filter("2022-05-01T00:00:00.000Z", [sync_filter]) == {
+            "and": [
+                sync_filter,
+                {"timestamp": "last_edited_time", "last_edited_time": {"on_or_after": "2022-05-01T00:00:00.000Z"}}
+            ]
+        }
+
+    @patch('requests.Session.post')
+    def test_iter_notion_issues_incremental(self, mock_post, notion_helper, resource_data):
+        resource_data[1]["last_edited_time"] = "2022-05-11T10:00:00.000Z"
+        mock_post.return_value.json.return_value = {"results": list(reversed(resource_data)), "has_more": False}
+
+        issues = notion_helper.get_notion_issues(since="2022-05-01T00:00:00.000Z")
+
+        assert len(issues) == 2
+        assert mock_post.call_args.kwargs["json"]["filter"] == {
+            "timestamp": "last_edited_time", "last_edited_time": {"on_or_after": "2022-05-01T00:00:00.000Z"}
+        }
+        assert notion_helper.last_edited_time == "2022-05-11T10:00:00.000Z"
+
+    @patch('requests.Session.post')
+    def test_watermark_stays_before_the_query(self, mock_post, notion_helper, resource_data):
+        # The query starts at 10:00:20, the first page is edited after it was read, the second one before it is read
+        resource_data[0]["last_edited_time"] = "2022-05-11T10:00:30.000Z"
+        resource_data[1]["last_edited_time"] = "2022-05-11T10:00:40.000Z"
+        mock_post.return_value.json.return_value = {"results": resource_data, "has_more": False}
+
+        with patch('time.time', return_value=datetime(2022, 5, 11, 10, 0, 20, tzinfo=timezone.utc).timestamp()):
+            notion_helper.get_notion_issues(since="2022-05-01T00:00:00.000Z")
+
+        # The next query starts a skew before this query started, so it reads both pages again
+        assert notion_helper.last_edited_time == "2022-05-11T09:59:20.000Z"
+
+    @patch('time.sleep')
+    @patch('requests.Session.post')
+    def test_iter_notion_issues_retries_rate_limit(self, mock_post, mock_sleep, notion_helper, resource_data):
+        throttled = MagicMock()
+        throttled.status_code = 429
+        throttled.headers = {"Retry-After": "1"}
+        page = MagicMock()
+        page.json.return_value = {"results": resource_data, "has_more": False}
+        mock_post.side_effect = [throttled, page]
+
+        issues = notion_helper.get_notion_issues()
+
         assert len(issues) == 2
-        assert issues[0]["title"] == "Sample One"
-        assert issues[1]["title"] == "Sample Two"
-        assert issues[0]["description"] == "My Sample Body 1"
-        assert issues[1]["description"] == "My Sample Body 2"
-        assert issues[0]["assignees"] == ["martingrosche"]
-        assert issues[1]["assignees"] == []
-        assert issues[0]["labels"] == ["feature request"]
-        assert issues[1]["labels"] == ["bug"]
-        assert issues[0]["project_number"] == 1
-        assert issues[1]["project_number"] == 'None'
+        assert mock_post.call_count == 2
+        mock_sleep.assert_any_call(1.0)
+
+    @patch('requests.Session.patch')
+    def test_flush_page_updates_coalesces(self, mock_patch, notion_helper):
+        notion_helper.queue_page_update("page-1", {"GitHub Issue": notion_helper.url_value("https://github.com/o/r/issues/1")})
+        notion_helper.queue_page_update("page-1", {"Status": notion_helper.select_value("Status", "Done")})
+        notion_helper.queue_page_update("page-2", {"Status": notion_helper.select_value("Status", "Done")})
+
+        updated = notion_helper.flush_page_updates()
+
+        assert sorted(updated) == ["page-1", "page-2"]
+        assert mock_patch.call_count == 2
+        calls = {call.args[0]: call.kwargs["json"] for call in mock_patch.call_args_list}
+        assert calls["https://api.notion.com/v1/pages/page-1"] == {"properties": {
+            "GitHub Issue": {"url": "https://github.com/o/r/issues/1"},
+            "Status": {"select": {"name": "Done"}}
+        }}
+        assert notion_helper.pending_updates == {}
+
+    @patch('requests.Session.patch')
+    def test_flush_page_updates_failure(self, mock_patch, notion_helper):
+        mock_patch.return_value.raise_for_status.side_effect = requests.HTTPError("400 Client Error")
+        notion_helper.queue_page_update("page-1", {"Status": notion_helper.select_value("Status", "Done")})
+
+        assert notion_helper.flush_page_updates() == []
+
+    def test_get_rich_text_all_segments(self, notion_helper):
+        properties = {"Discription": {"type": "rich_text", "rich_text": [
+            {"type": "text", "text": {"content": "Fix ", "link": None}, "annotations": {"bold": False}, "plain_text": "Fix "},
+            {"type": "text", "text": {"content": "this", "link": None}, "annotations": {"bold": True}, "plain_text": "this"}
+        ]}, "Title": {"type": "title", "title": [
+            {"type": "text", "plain_text": "Two "}, {"type": "text", "plain_text": "Parts", "annotations": {"bold": True}}
+        ]}}
+
+        assert notion_helper.get_rich_text(properties, "Discription") == "Fix **this**"
+        assert notion_helper.get_title(properties, "Title") == "Two Parts"
+
+    @patch('requests.Session.get')
+    def test_get_page_markdown_cached(self, mock_get, notion_helper, tmp_path):
+        first_page = MagicMock()
+        first_page.json.return_value = {"results": [
+            {"id": "b1", "type": "heading_1", "has_children": False, "heading_1": {"rich_text": [{"plain_text": "Title"}]}}
+        ], "has_more": True, "next_cursor": "cursor_1"}
+        second_page = MagicMock()
+        second_page.json.return_value = {"results": [
+            {"id": "b2", "type": "paragraph", "has_children": False, "paragraph": {"rich_text": [{"plain_text": "Text"}]}}
+        ], "has_more": False, "next_cursor": None}
+        mock_get.side_effect = [first_page, second_page]
+        notion_helper.cache = SyncState(os.path.join(tmp_path, "state.json"))
+
+        assert notion_helper.get_page_markdown("0815", "2022-05-10T17:10:00.000Z") == "# Title\n\nText"
+        assert mock_get.call_args_list[1].kwargs["params"] == {"page_size": 100, "start_cursor": "cursor_1"}
+
+        # Unchanged pages aren't read again, also not in a later run
+        assert notion_helper.get_page_markdown("0815", "2022-05-10T17:10:00.000Z") == "# Title\n\nText"
+        other_run = NotionHelper("fake_token", "fake_database_id", cache=notion_helper.cache)
+        assert other_run.get_page_markdown("0815", "2022-05-10T17:10:00.000Z") == "# Title\n\nText"
+        assert mock_get.call_count == 2
+
+    @patch('requests.Session.post')
+    def test_iter_notion_issues_page_body(self, mock_post, resource_data):
+        resource_data[0]["id"] = "4711"
+        notion_helper = NotionHelper("fake_token", "fake_database_id", page_body=True, workers=2)
+        notion_helper.get_page_markdown = MagicMock(side_effect=lambda page_id, _: f"Body of {page_id}" if page_id == "0815" else "")
+        mock_post.return_value.json.return_value = {"results": list(reversed(resource_data)), "has_more": False}
+
+        issues = notion_helper.get_notion_issues()
+
+        assert [issue.description for issue in issues] == ["My Sample Body 1\n\nBody of 0815", "My Sample Body 2"]
+
+    @patch('requests.Session.post')
+    @patch('requests.Session.get')
+    def test_load_schema(self, mock_get, mock_post, resource_data):
+        mock_get.return_value.json.return_value = {"properties": {
+            "Title": {"type": "title"}, "Discription": {"type": "rich_text"}, "Team": {"type": "select"}, "State": {"type": "status"}
+        }}
+        resource_data[1]["properties"]["Team"] = {"type": "select", "select": {"name": "backend"}}
+        mock_post.return_value.json.return_value = {"results": [resource_data[1]], "has_more": False}
+        notion_helper = NotionHelper("fake_token", "fake_database_id", status_property="State",
+                                     property_mapping=PropertyMapping({"labels": "Team"}))
+
+        notion_helper.load_schema()
+        issues = notion_helper.get_notion_issues()
+
+        assert mock_get.call_args.args[0] == "https://api.notion.com/v1/databases/fake_database_id"
+        assert issues[0].labels == ["backend"]
+        # Properties missing from the database are left empty
+        assert issues[0].assignees == []
+        # The property type is kept for writing the value back
+        assert notion_helper.select_value("State", "Done") == {"status": {"name": "Done"}}
+        assert notion_helper.select_value("Unknown", "Done") == {"select": {"name": "Done"}}
+
+    @patch('requests.Session.get')
+    def test_load_schema_invalid_mapping(self, mock_get):
+        mock_get.return_value.json.return_value = {"properties": {"Title": {"type": "title"}}}
+        notion_helper = NotionHelper("fake_token", "fake_database_id", property_mapping=PropertyMapping({"labels": "Team"}))
+
+        with pytest.raises(ValueError, match="'Team' mapped to 'labels' doesn't exist"):
+            notion_helper.load_schema()
+
+    @patch('requests.Session.get')
+    def test_iter_notion_issues_by_id(self, mock_get, resource_data):
+        resource_data[0]["id"] = "4711"
+        other_database = dict(resource_data[1], id="other", parent={"type": "database_id", "database_id": "other_database"})
+        archived = dict(resource_data[1], id="archived", archived=True)
+        pages = {page["id"]: page for page in [resource_data[0], resource_data[1], other_database, archived]}
+
+        def get(url, **kwargs):
+            response = MagicMock()
+            page = pages.get(url.rsplit("/", 1)[-1])
+            response.status_code = 200 if page else 404
+            response.json.return_value = page
+            return response
+        mock_get.side_effect = get
+        notion_helper = NotionHelper("fake_token", "08-15", workers=2)
+
+        issues = list(notion_helper.iter_notion_issues_by_id(["0815", "missing", "other", "archived", "4711"]))
+
+        # Pages of other databases, archived and unknown pages are left out, the order is kept
+        assert [issue.id for issue in issues] == ["0815", "4711"]
+        assert notion_helper.last_edited_time == resource_data[1]["last_edited_time"]
+
+    @patch('requests.Session.post')
+    @patch('requests.Session.get')
+    def test_relation_titles_prefetched(self, mock_get, mock_post, resource_data):
+        pages = []
+        for i in range(3):
+            page = json.loads(json.dumps(resource_data[1]))
+            page["id"] = f"row-{i}"
+            page["properties"]["Epic"] = {"type": "relation", "relation": [{"id": "epic-1"}, {"id": f"epic-{i + 2}"}]}
+            pages.append(page)
+        epics = {f"epic-{i}": {"id": f"epic-{i}", "properties": {"Name": {"type": "title", "title": [{"plain_text": f"Epic {i}"}]}}}
+                 for i in range(1, 4)}
+
+        def get(url, **kwargs):
+            response = MagicMock()
+            if url.endswith("/databases/fake_database_id"):
+                response.json.return_value = {"properties": {"Title": {"type": "title"}, "Epic": {"type": "relation"}}}
+                return response
+            page = epics.get(url.rsplit("/", 1)[-1])
+            response.status_code = 200 if page else 404
+            response.json.return_value = page
+            return response
+        mock_get.side_effect = get
+        mock_post.return_value.json.return_value = {"results": pages, "has_more": False}
+        notion_helper = NotionHelper("fake_token", "fake_database_id", workers=2, property_mapping=PropertyMapping({"labels": "Epic"}))
+        notion_helper.load_schema()
+
+        issues = notion_helper.get_notion_issues()
+
+        assert [issue.labels for issue in issues] == [["Epic 1", "Epic 2"], ["Epic 1", "Epic 3"], ["Epic 1"]]
+        # Every related page is read once, the schema once
+        assert mock_get.call_count == 5
+        # Reading the related pages doesn't move the watermark
+        assert notion_helper.last_edited_time == resource_data[1]["last_edited_time"]
@@ -0,0 +1,57 @@
+from utils.NotionMarkdown import (block_to_markdown, blocks_to_markdown,
+                                  rich_text_to_markdown,
+                                  rich_text_to_plain_text)
+
+
+def segment(text, link=None, **annotations):
+    return {
+        "type": "text",
+        "text": {"content": text, "link": {"url": link} if link else None},
+        "annotations": {"bold": False, "italic": False, "strikethrough": False, "underline": False, "code": False,
+                        "color": "default", **annotations},
+        "plain_text": text
+    }
+
+
+def block(block_id, block_type, text, has_children=False, **value):
+    return {"id": block_id, "type": block_type, "has_children": has_children,
+            block_type: {"rich_text": [segment(text)], **value}}
+
+
+class TestNotionMarkdown:
+    def test_rich_text_segments(self):
+        segments = [segment("Use "), segment("pip install ", code=True), segment("and read "),
+                    segment("the docs", link="https://example.com"), segment(" now", bold=True, italic=True)]
+
+        assert rich_text_to_markdown(segments) == "Use `pip install` and read [the docs](https://example.com) ***now***"
+        assert rich_text_to_plain_text(segments) == "Use pip install and read the docs now"
+
+    def test_rich_text_ignores_unset_annotations(self):
+        # Annotations that aren't booleans, as in exported pages, are not applied
+        text = segment("Plain")
+        text["annotations"]["bold"] = "False"
+        assert rich_text_to_markdown([text]) == "Plain"
+        assert rich_text_to_markdown(None) == ""
+
+    def test_block_to_markdown(self):
+        assert block_to_markdown(block("1", "heading_1", "Title")) == "# Title"
+        assert block_to_markdown(block("1", "numbered_list_item", "Step"), 3) == "3. Step"
+        assert block_to_markdown(block("1", "to_do", "Task", checked=True)) == "- [x] Task"
+        assert block_to_markdown(block("1", "quote", "Line 1\nLine 2")) == "> Line 1\n> Line 2"
+        assert block_to_markdown(block("1", "code", "print(1)", language="python")) == "```python\nprint(1)\n```"
+        assert block_to_markdown({"id": "1", "type": "divider", "divider": {}}) == "---"
+        image = {"id": "1", "type": "image", "image": {"type": "external", "external": {"url": "https://example.com/a.png"}, "caption": []}}
+        assert block_to_markdown(image) == "![image](https://example.com/a.png)"
+
+    def test_blocks_to_markdown(self):
+        blocks = [
+            block("1", "heading_2", "Steps"),
+            block("2", "numbered_list_item", "First", has_children=True),
+            block("3", "numbered_list_item", "Second"),
+            block("4", "paragraph", "Done")
+        ]
+        children = {"2": [block("5", "bulleted_list_item", "Detail")]}
+
+        markdown = blocks_to_markdown(blocks, lambda block_id: children[block_id])
+
+        assert markdown == "## Steps\n\n1. First\n  - Detail\n2. Second\n\nDone"
@@ -0,0 +1,80 @@
+import os
+import threading
+import time
+
+import pytest
+
+from utils.PageQueue import PageQueue
+
+
+class TestPageQueue:
+    @pytest.fixture
+    def path(self, tmp_path):
+        return os.path.join(tmp_path, "queue", "queue.jsonl")
+
+    def test_put_and_take(self, path):
+        queue = PageQueue(path)
+        assert queue.put(["page-1", "page-2", "page-1", ""]) == 2
+
+        assert [page_id for page_id, _ in queue.take(10)] == ["page-1", "page-2"]
+        assert [page_id for page_id, _ in queue.take(1)] == ["page-1"]
+        assert len(queue) == 2
+
+    def test_done(self, path):
+        queue = PageQueue(path)
+        queue.put(["page-1", "page-2"])
+
+        queue.done(queue.take(1))
+
+        assert [page_id for page_id, _ in queue.take(10)] == ["page-2"]
+
+    def test_enqueued_again_while_synced(self, path):
+        queue = PageQueue(path)
+        queue.put(["page-1"])
+        taken = queue.take(10)
+
+        queue.put(["page-1"])
+        queue.done(taken)
+
+        # The newer edit is synced once more
+        assert [page_id for page_id, _ in queue.take(10)] == ["page-1"]
+
+    def test_survives_restart(self, path):
+        queue = PageQueue(path)
+        queue.put(["page-1", "page-2", "page-3"])
+        queue.done(queue.take(1))
+        with open(path, "a") as queue_file:
+            queue_file.write('{"page_id": "page-4", "se')
+
+        reloaded = PageQueue(path)
+        assert [page_id for page_id, _ in reloaded.take(10)] == ["page-2", "page-3"]
+        reloaded.put(["page-5"])
+        assert reloaded.take(10)[-1][1] > reloaded.take(10)[0][1]
+
+    def test_compact(self, path):
+        queue = PageQueue(path)
+        queue.put(["page-1", "page-2"])
+        queue.done(queue.take(1))
+        queue.compact()
+
+        with open(path) as queue_file:
+            assert len(queue_file.readlines()) == 1
+        assert [page_id for page_id, _ in PageQueue(path).take(10)] == ["page-2"]
+
+    def test_take_timeout(self, path):
+        assert PageQueue(path).take(10, timeout=0.05) == []
+
+    def test_take_waits_for_settled_pages(self, path):
+        queue = PageQueue(path)
+        queue.put(["page-1"])
+
+        assert queue.take(10, settle=10, timeout=0.05) == []
+        start = time.monotonic()
+        assert [page_id for page_id, _ in queue.take(10, settle=0.2)] == ["page-1"]
+        assert time.monotonic() - start >= 0.1
+
+    def test_take_wakes_up_on_put(self, path):
+        queue = PageQueue(path)
+        threading.Timer(0.05, queue.put, [["page-1"]]).start()
+
+        assert [page_id for page_id, _ in queue.take(10, timeout=5)] == ["page-1"]
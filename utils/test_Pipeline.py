@@ -0,0 +1,74 @@
+import threading
+import time
+
+import pytest
+
+from utils.Pipeline import BatchStage, prefetch
+
+
+class TestPipeline:
+    def test_prefetch_keeps_order(self):
+        assert list(prefetch(range(10), 3)) == list(range(10))
+
+    def test_prefetch_reads_ahead_up_to_maxsize(self):
+        read = []
+
+        def items():
+            for i in range(10):
+                read.append(i)
+                yield i
+
+        iterator = prefetch(items(), 3)
+        assert next(iterator) == 0
+        time.sleep(0.1)
+        # One item taken, three waiting in the queue and one held by the blocked reader
+        assert len(read) == 5
+        assert list(iterator) == list(range(1, 10))
+
+    def test_prefetch_raises_reader_errors(self):
+        def items():
+            yield 1
+            raise ValueError("Notion failed")
+
+        iterator = prefetch(items(), 3)
+        assert next(iterator) == 1
+        with pytest.raises(ValueError, match="Notion failed"):
+            next(iterator)
+
+    def test_prefetch_stops_reader_when_consumer_is_gone(self):
+        finished = threading.Event()
+
+        def items():
+            try:
+                yield from range(100)
+            finally:
+                finished.set()
+
+        iterator = prefetch(items(), 1)
+        next(iterator)
+        iterator.close()
+        assert finished.wait(1)
+
+    def test_batch_stage(self):
+        batches = []
+        with BatchStage(lambda batch: batches.append(list(batch)), 3) as stage:
+            for i in range(7):
+                stage.put(i)
+
+        assert batches == [[0, 1, 2], [3, 4, 5], [6]]
+
+    def test_batch_stage_runs_on_own_thread(self):
+        threads = set()
+        with BatchStage(lambda batch: threads.add(threading.get_ident()), 1) as stage:
+            stage.put(1)
+
+        assert threads and threading.get_ident() not in threads
+
+    def test_batch_stage_raises_handler_errors(self):
+        def handle(batch):
+            raise RuntimeError("link failed")
+
+        stage = BatchStage(handle, 1)
+        stage.put(1)
+        with pytest.raises(RuntimeError, match="link failed"):
+            stage.close()
@@ -0,0 +1,111 @@
+import pytest
+
+from utils.PropertyMapping import PropertyMapping, parse_mapping
+from utils.UserMapping import UserMapping
+
+SCHEMA = {
+    "Name": {"type": "title"},
+    "Body": {"type": "rich_text"},
+    "Owner": {"type": "people"},
+    "Area": {"type": "select"},
+    "Urgent": {"type": "checkbox"},
+    "Release": {"type": "status"},
+    "Project": {"type": "rich_text"},
+    "Due": {"type": "date"},
+    "Epic": {"type": "relation"}
+}
+
+ROW = {
+    "Name": {"type": "title", "title": [{"plain_text": "Fix "}, {"plain_text": "login"}]},
+    "Body": {"type": "rich_text", "rich_text": [{"plain_text": "Steps", "annotations": {"bold": True}}]},
+    "Owner": {"type": "people", "people": [{"id": "u1", "name": "Ada"}]},
+    "Area": {"type": "select", "select": {"name": "backend"}},
+    "Urgent": {"type": "checkbox", "checkbox": True},
+    "Release": {"type": "status", "status": {"name": "v1.2"}},
+    "Project": {"type": "rich_text", "rich_text": [{"plain_text": "#3"}]},
+    "Due": {"type": "date", "date": {"start": "2024-05-01", "end": None}},
+    "Epic": {"type": "relation", "relation": [{"id": "e1"}, {"id": "e2"}, {"id": "private"}]}
+}
+
+
+class TestPropertyMapping:
+    def test_parse_json_and_yaml(self):
+        assert parse_mapping('{"title": "Name", "labels": "Area"}') == {"title": "Name", "labels": "Area"}
+        assert parse_mapping("title: Name\n# comment\nlabels: 'Area'  # inline\n") == {"title": "Name", "labels": "Area"}
+        assert parse_mapping("project: Project #\ntitle: Issue # title") == {"project": "Project #", "title": "Issue # title"}
+        assert parse_mapping("") == {}
+        with pytest.raises(ValueError):
+            parse_mapping("title Name")
+
+    def test_unknown_field(self):
+        with pytest.raises(ValueError, match="Unknown issue field 'priority'"):
+            PropertyMapping({"priority": "Area"})
+
+    def test_compile_with_schema(self):
+        mapping = PropertyMapping({"title": "Name", "body": "Body", "assignees": "Owner", "labels": "Area",
+                                   "milestone": "Release", "project": "Project", "status": "Due"})
+
+        extractors = mapping.compile(SCHEMA)
+
+        assert {field: extract(ROW) for field, extract in extractors.items()} == {
+            "title": "Fix login",
+            "description": "**Steps**",
+            "assignees": ["Ada"],
+            "labels": ["backend"],
+            "milestone": "v1.2",
+            "project_number": 3,
+            "status": "2024-05-01",
+            "issue_url": "",
+            "repository": ""
+        }
+
+    def test_missing_values(self):
+        extractors = PropertyMapping({"title": "Name", "labels": "Area"}).compile(SCHEMA)
+
+        row = {"Name": ROW["Name"], "Area": {"type": "select", "select": None}}
+        assert extractors["labels"](row) == []
+        assert extractors["description"](row) == ""
+        # Empty lists aren't shared between rows
+        assert extractors["labels"](row) is not extractors["labels"](row)
+
+    def test_checkbox_label(self):
+        extractors = PropertyMapping({"title": "Name", "labels": "Urgent"}).compile(SCHEMA)
+        assert extractors["labels"](ROW) == ["Urgent"]
+        assert extractors["labels"]({"Urgent": {"type": "checkbox", "checkbox": False}}) == []
+
+    def test_validation(self):
+        with pytest.raises(ValueError, match="'Missing' mapped to 'labels' doesn't exist"):
+            PropertyMapping({"title": "Name", "labels": "Missing"}).compile(SCHEMA)
+        with pytest.raises(ValueError, match="of type date can't be mapped to 'labels'"):
+            PropertyMapping({"title": "Name", "labels": "Due"}).compile(SCHEMA)
+        # Default properties the database lacks are left empty
+        extractors = PropertyMapping({"title": "Name"}).compile(SCHEMA)
+        assert extractors["assignees"](ROW) == []
+
+    def test_compile_without_schema(self):
+        extractors = PropertyMapping({"title": "Name", "labels": "Area"}).compile()
+
+        assert extractors["title"](ROW) == "Fix login"
+        assert extractors["labels"](ROW) == ["backend"]
+        assert extractors["project_number"](ROW) is None
+
+    def test_relation_titles(self):
+        titles = {"e1": "Login", "e2": "Billing"}
+        extractors = PropertyMapping({"title": "Name", "labels": "Epic", "milestone": "Epic"}).compile(SCHEMA, page_title=titles.get)
+
+        # Pages that can't be read are left out
+        assert extractors["labels"](ROW) == ["Login", "Billing"]
+        assert extractors["milestone"](ROW) == "Login, Billing"
+        # Without titles, the page ids are used
+        assert PropertyMapping({"title": "Name", "labels": "Epic"}).compile(SCHEMA)["labels"](ROW) == ["e1", "e2", "private"]
+
+    def test_assignees_mapped_to_logins(self):
+        users = UserMapping({"u1": "ada-gh", "Backend": "backend-lead"})
+        people = PropertyMapping({"title": "Name", "assignees": "Owner"})
+        names = PropertyMapping({"title": "Name", "assignees": "Area"})
+
+        assert people.compile(SCHEMA, users)["assignees"](ROW) == ["ada-gh"]
+        assert names.compile(SCHEMA, users)["assignees"](ROW) == ["backend-lead"]
+        assert names.compile(users=users)["assignees"](ROW) == ["backend-lead"]
+        # Other fields keep the names
+        assert PropertyMapping({"title": "Name", "labels": "Owner"}).compile(SCHEMA, users)["labels"](ROW) == ["Ada"]
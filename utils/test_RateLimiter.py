@@ -0,0 +1,113 @@
+import time
+from unittest.mock import Mock, patch
+
+import pytest
+import requests
+
+from utils.RateLimiter import RateLimiter, TokenBucket
+
+
+def make_response(status_code=200, headers=None, text=""):
+    response = Mock()
+    response.status_code = status_code
+    response.headers = headers or {}
+    response.text = text
+    return response
+
+
+class TestTokenBucket:
+    @patch('time.sleep')
+    def test_acquire_paces_after_burst(self, mock_sleep):
+        bucket = TokenBucket(rate=2)
+
+        bucket.acquire()
+        bucket.acquire()
+        mock_sleep.assert_not_called()
+
+        bucket.acquire()
+        assert mock_sleep.call_args[0][0] == pytest.approx(0.5, abs=0.05)
+
+
+class TestRateLimiter:
+    URL = "https://api.notion.com/v1/databases/db/query"
+
+    @pytest.fixture
+    def rate_limiter(self):
+        return RateLimiter(rates={})
+
+    @patch('time.sleep')
+    def test_call_success(self, mock_sleep, rate_limiter):
+        send = Mock(return_value=make_response())
+
+        assert rate_limiter.call(self.URL, send).status_code == 200
+        send.assert_called_once()
+        mock_sleep.assert_not_called()
+
+    @patch('time.sleep')
+    def test_call_honors_retry_after(self, mock_sleep, rate_limiter):
+        send = Mock(side_effect=[make_response(429, {"Retry-After": "3"}), make_response()])
+
+        assert rate_limiter.call(self.URL, send).status_code == 200
+        assert send.call_count == 2
+        mock_sleep.assert_called_once_with(3.0)
+
+    @patch('time.sleep')
+    def test_call_backs_off_on_server_error(self, mock_sleep, rate_limiter):
+        send = Mock(side_effect=[make_response(502), make_response(503), make_response()])
+
+        assert rate_limiter.call(self.URL, send).status_code == 200
+        assert mock_sleep.call_count == 2
+        assert 0 <= mock_sleep.call_args_list[1][0][0] <= 2
+
+    @patch('time.sleep')
+    def test_call_secondary_rate_limit(self, mock_sleep, rate_limiter):
+        send = Mock(side_effect=[make_response(403, text="You have exceeded a secondary rate limit"), make_response()])
+
+        assert rate_limiter.call("https://api.github.com/graphql", send).status_code == 200
+        assert send.call_count == 2
+
+    @patch('time.sleep')
+    def test_call_gives_up(self, mock_sleep):
+        rate_limiter = RateLimiter(rates={}, retries=2)
+        send = Mock(return_value=make_response(500))
+
+        assert rate_limiter.call(self.URL, send).status_code == 500
+        assert send.call_count == 3
+
+    @patch('time.sleep')
+    def test_call_retries_connection_errors(self, mock_sleep, rate_limiter):
+        send = Mock(side_effect=[requests.ConnectionError("Connection reset"), requests.Timeout("Read timed out"), make_response()])
+
+        assert rate_limiter.call(self.URL, send).status_code == 200
+        assert send.call_count == 3
+
+    @patch('time.sleep')
+    def test_call_raises_connection_error_after_retries(self, mock_sleep):
+        rate_limiter = RateLimiter(rates={}, retries=2)
+        send = Mock(side_effect=requests.ConnectionError("Connection refused"))
+
+        with pytest.raises(requests.ConnectionError):
+            rate_limiter.call(self.URL, send)
+        assert send.call_count == 3
+
+    @patch('time.sleep')
+    def test_call_does_not_retry_client_errors(self, mock_sleep, rate_limiter):
+        send = Mock(return_value=make_response(404))
+
+        assert rate_limiter.call(self.URL, send).status_code == 404
+        send.assert_called_once()
+
+    @patch('time.sleep')
+    def test_quota_budget(self, mock_sleep, rate_limiter):
+        url = "https://api.github.com/graphql"
+        reset = time.time() + 30
+        send = Mock(return_value=make_response(headers={"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": str(reset)}))
+
+        assert rate_limiter.fits_budget("api.github.com", 100)
+        rate_limiter.call(url, send)
+        assert rate_limiter.get_remaining("api.github.com") == 0
+        assert not rate_limiter.fits_budget("api.github.com", 1)
+
+        # The next request waits for the quota reset instead of failing
+        rate_limiter.call(url, send)
+        assert mock_sleep.call_args[0][0] == pytest.approx(30, abs=1)
@@ -0,0 +1,58 @@
+import pytest
+
+from utils.PropertyMapping import NotionIssue
+from utils.Routing import Route, parse_routes, partition, resolve_repository
+
+
+class TestRouting:
+    def test_parse_routes_without_config(self):
+        assert parse_routes("", "db", "owner/repo") == [Route("db", "owner/repo")]
+        assert parse_routes("  ", None, "owner/repo") == []
+
+    def test_parse_routes(self):
+        routes = parse_routes("""[
+            {"database": "db-1", "repository": "owner/repo-1"},
+            {"database": "db-2", "repositoryProperty": "Repository", "filter": {"property": "Done", "checkbox": {"equals": false}}}
+        ]""", "ignored", "owner/repo")
+
+        assert routes == [
+            Route("db-1", "owner/repo-1"),
+            Route("db-2", None, "Repository", ({"property": "Done", "checkbox": {"equals": False}},))
+        ]
+
+    @pytest.mark.parametrize("raw", [
+        '{"database": "db", "repository": "owner/repo"}',
+        '[{"repository": "owner/repo"}]',
+        '[{"database": "db"}]'
+    ])
+    def test_parse_invalid_routes(self, raw):
+        with pytest.raises(ValueError):
+            parse_routes(raw)
+
+    def test_resolve_repository(self):
+        assert resolve_repository("other/repo", "owner") == "other/repo"
+        assert resolve_repository(" repo ", "owner") == "owner/repo"
+        assert resolve_repository("", "owner") is None
+        assert resolve_repository(None, "owner") is None
+
+    def test_partition(self, capsys):
+        issues = [
+            NotionIssue("A", repository="repo-1"),
+            NotionIssue("B", repository="other/repo-2"),
+            NotionIssue("C", repository=""),
+            NotionIssue("D", repository="repo-1")
+        ]
+
+        assert partition(issues, Route("db", None, "Repository"), "owner") == {
+            "owner/repo-1": [issues[0], issues[3]],
+            "other/repo-2": [issues[1]]
+        }
+        assert "Notion entry 'C' has no repository. Skipping it." in capsys.readouterr().out
+
+    def test_partition_falls_back_to_route_repository(self):
+        issues = [NotionIssue("A", repository=""), NotionIssue("B", repository="repo-2")]
+
+        assert partition(issues, Route("db", "owner/repo-1", "Repository"), "owner") == {
+            "owner/repo-1": [issues[0]],
+            "owner/repo-2": [issues[1]]
+        }
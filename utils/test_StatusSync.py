@@ -0,0 +1,75 @@
+import os
+from unittest.mock import Mock
+
+import pytest
+
+from utils.GitHubHelper import GitHubHelper, IssueRecord
+from utils.MappingStore import MappingStore
+from utils.NotionHelper import NotionHelper
+from utils.PropertyMapping import NotionIssue
+from utils.StatusSync import StatusSync
+
+
+class TestStatusSync:
+    @pytest.fixture
+    def notion_helper(self):
+        return NotionHelper("fake_token", "fake_database_id", status_property="Status", url_property="GitHub Issue")
+
+    @pytest.fixture
+    def gh_helper(self):
+        helper = Mock(spec=GitHubHelper)
+        helper.get_issue_url.side_effect = lambda number: f"https://github.com/o/r/issues/{number}"
+        helper.set_issue_state.return_value = True
+        return helper
+
+    @pytest.fixture
+    def mapping_store(self, tmp_path):
+        return MappingStore(os.path.join(tmp_path, "mapping.jsonl"))
+
+    def issue(self, status, issue_url="https://github.com/o/r/issues/1"):
+        return NotionIssue("Test Issue", status=status, issue_url=issue_url, id="page-1")
+
+    def test_writes_missing_url(self, notion_helper, gh_helper):
+        status_sync = StatusSync(notion_helper, gh_helper, ["Done"])
+
+        status_sync.reconcile(self.issue("Not started", ""), IssueRecord(1, "Test Issue", "node_1", "OPEN", "page-1"))
+
+        assert notion_helper.pending_updates == {"page-1": {"GitHub Issue": {"url": "https://github.com/o/r/issues/1"}}}
+        assert status_sync.state_changes == []
+
+    def test_closed_in_notion(self, notion_helper, gh_helper, mapping_store):
+        mapping_store.put("page-1", number=1, state="open")
+        status_sync = StatusSync(notion_helper, gh_helper, ["Done"], "In progress", mapping_store)
+
+        status_sync.reconcile(self.issue("Done"), IssueRecord(1, "Test Issue", "node_1", "OPEN", "page-1"))
+        changed, updated = status_sync.apply(2)
+
+        gh_helper.set_issue_state.assert_called_once_with(1, "closed")
+        assert (changed, updated) == ([1], 0)
+        assert mapping_store.get("page-1")["state"] == "closed"
+
+    def test_reopened_on_github(self, notion_helper, gh_helper, mapping_store):
+        mapping_store.put("page-1", number=1, state="closed")
+        status_sync = StatusSync(notion_helper, gh_helper, ["Done"], "In progress", mapping_store)
+
+        status_sync.reconcile(self.issue("Done"), IssueRecord(1, "Test Issue", "node_1", "OPEN", "page-1"))
+
+        assert status_sync.state_changes == []
+        assert notion_helper.pending_updates == {"page-1": {"Status": {"select": {"name": "In progress"}}}}
+
+    def test_closing_wins_without_history(self, notion_helper, gh_helper):
+        status_sync = StatusSync(notion_helper, gh_helper, ["Done"], "In progress")
+
+        status_sync.reconcile(self.issue("In progress"), IssueRecord(1, "Test Issue", "node_1", "CLOSED", "page-1"))
+
+        assert status_sync.state_changes == []
+        assert notion_helper.pending_updates == {"page-1": {"Status": {"select": {"name": "Done"}}}}
+
+    def test_in_step(self, notion_helper, gh_helper, mapping_store):
+        status_sync = StatusSync(notion_helper, gh_helper, ["Done"], "In progress", mapping_store)
+
+        status_sync.reconcile(self.issue("Done"), IssueRecord(1, "Test Issue", "node_1", "CLOSED", "page-1"))
+
+        assert status_sync.state_changes == []
+        assert notion_helper.pending_updates == {}
+        assert mapping_store.get("page-1")["state"] == "closed"
@@ -0,0 +1,210 @@
+import os
+from dataclasses import replace
+from unittest.mock import Mock
+
+import pytest
+
+from utils.GitHubHelper import (IssueIndex, IssueRecord, ProjectRef,
+                                ProjectResolver)
+from utils.MappingStore import MappingStore, content_hash
+from utils.PropertyMapping import NotionIssue
+from utils.SyncPlan import SyncPlan, plan_issue
+
+
+class TestSyncPlan:
+    @pytest.fixture
+    def new_issue(self):
+        return NotionIssue("Test Issue", "Test Description", ["TestUser"], ["bug"], project_number=1, id="page-1")
+
+    @pytest.fixture
+    def project_resolver(self):
+        resolver = Mock(spec=ProjectResolver)
+        resolver.resolve.return_value = ProjectRef("proj_1", "Project 1")
+        return resolver
+
+    def test_plan_issue_create(self, new_issue, project_resolver):
+        issue_index = IssueIndex()
+
+        action = plan_issue(new_issue, issue_index, project_resolver, True)
+
+        assert action == {
+            "action": "create",
+            "title": "Test Issue",
+            "page_id": "page-1",
+            "body": f"Test Description\n\n<!-- notion-page-id: page-1 hash: {content_hash(new_issue)} -->",
+            "assignees": ["TestUser"],
+            "labels": ["bug"],
+            "milestone": None,
+            "project": ProjectRef("proj_1", "Project 1"),
+            "hash": content_hash(new_issue)
+        }
+        # The planned issue is reserved, so a duplicate row is skipped
+        assert plan_issue(replace(new_issue, id="page-2"), issue_index, project_resolver, True)["action"] == "skip"
+
+    def test_plan_issue_skip(self, new_issue, project_resolver):
+        issue_index = IssueIndex([IssueRecord(7, "Test Issue", "node_7", "CLOSED")])
+
+        action = plan_issue(new_issue, issue_index, project_resolver, True)
+
+        assert action == {
+            "action": "skip",
+            "title": "Test Issue",
+            "page_id": "page-1",
+            "reason": "exists",
+            "existing_number": 7,
+            "existing_node_id": "node_7",
+            "existing_hash": None,
+            "existing_page_id": None,
+            "hash": content_hash(new_issue)
+        }
+        project_resolver.resolve.assert_not_called()
+
+    def test_plan_issue_mapped(self, new_issue, project_resolver, tmp_path):
+        mapping_store = MappingStore(os.path.join(tmp_path, "mapping.jsonl"))
+        mapping_store.put("page-1", number=3, node_id="node_3", project_item_id="item_3")
+        issue_index = IssueIndex(loader=Mock(return_value=[]))
+
+        action = plan_issue(new_issue, issue_index, project_resolver, True, mapping_store)
+
+        assert action["action"] == "skip"
+        assert action["reason"] == "mapped"
+        assert action["existing_number"] == 3
+        # Mapped pages don't need the GitHub snapshot
+        assert not issue_index.loaded
+
+    def test_plan_issue_mapped_to_other_repository(self, new_issue, project_resolver, tmp_path):
+        mapping_store = MappingStore(os.path.join(tmp_path, "mapping.jsonl"))
+        mapping_store.put("page-1", number=3, node_id="node_3", project_item_id="item_3", hash="stale", repository="owner/old")
+
+        # The page moved to another repository, where its issue doesn't exist yet
+        action = plan_issue(new_issue, IssueIndex(), project_resolver, True, mapping_store, update=True, repository="owner/new")
+        assert action["action"] == "create"
+
+        action = plan_issue(new_issue, IssueIndex(), project_resolver, True, mapping_store, repository="owner/old")
+        assert (action["action"], action["existing_number"]) == ("skip", 3)
+
+    def test_plan_issue_update_mapped(self, new_issue, project_resolver, tmp_path):
+        mapping_store = MappingStore(os.path.join(tmp_path, "mapping.jsonl"))
+        mapping_store.put("page-1", number=3, node_id="node_3", hash="stale")
+
+        action = plan_issue(new_issue, IssueIndex(), project_resolver, True, mapping_store, update=True)
+
+        assert action == {
+            "action": "update",
+            "title": "Test Issue",
+            "page_id": "page-1",
+            "number": 3,
+            "node_id": "node_3",
+            "body": f"Test Description\n\n<!-- notion-page-id: page-1 hash: {content_hash(new_issue)} -->",
+            "assignees": ["TestUser"],
+            "labels": ["bug"],
+            "milestone": None,
+            "hash": content_hash(new_issue)
+        }
+
+    def test_plan_issue_update_unchanged(self, new_issue, project_resolver, tmp_path):
+        mapping_store = MappingStore(os.path.join(tmp_path, "mapping.jsonl"))
+        mapping_store.put("page-1", number=3, node_id="node_3", hash=content_hash(new_issue), project_item_id="item_3")
+
+        action = plan_issue(new_issue, IssueIndex(), project_resolver, True, mapping_store, update=True)
+
+        assert action["action"] == "skip"
+
+    def test_plan_issue_pending_link(self, new_issue, project_resolver, tmp_path):
+        mapping_store = MappingStore(os.path.join(tmp_path, "mapping.jsonl"))
+        mapping_store.put("page-1", number=3, node_id="node_3", hash="hash_3")
+        issue_index = IssueIndex(loader=Mock(return_value=[]))
+
+        action = plan_issue(new_issue, issue_index, project_resolver, True, mapping_store)
+
+        assert action == {
+            "action": "link",
+            "title": "Test Issue",
+            "page_id": "page-1",
+            "number": 3,
+            "node_id": "node_3",
+            "project": ProjectRef("proj_1", "Project 1"),
+            "existing_hash": "hash_3"
+        }
+        assert not issue_index.loaded
+        # Without projects on the repository, there is nothing to retry
+        assert plan_issue(new_issue, issue_index, project_resolver, False, mapping_store)["action"] == "skip"
+
+    def test_plan_issue_links_unrecorded_issue(self, new_issue, project_resolver, tmp_path):
+        mapping_store = MappingStore(os.path.join(tmp_path, "mapping.jsonl"))
+        issue_index = IssueIndex([IssueRecord(7, "Test Issue", "node_7", "OPEN", "page-1", "hash_7")])
+
+        action = plan_issue(new_issue, issue_index, project_resolver, True, mapping_store)
+
+        assert action["action"] == "link"
+        assert (action["number"], action["node_id"], action["existing_hash"]) == (7, "node_7", "hash_7")
+        # Without a mapping store, the link can't be told apart from one made in an earlier run
+        assert plan_issue(new_issue, issue_index, project_resolver, True)["action"] == "skip"
+
+    def test_plan_issue_update_by_marker(self, new_issue, project_resolver):
+        issue_index = IssueIndex([IssueRecord(7, "Old Title", "node_7", "OPEN", "page-1", "stale")])
+
+        action = plan_issue(new_issue, issue_index, project_resolver, True, update=True)
+
+        assert action["action"] == "update"
+        assert action["number"] == 7
+
+    def test_plan_issue_update_ignores_title_match(self, new_issue, project_resolver):
+        issue_index = IssueIndex([IssueRecord(7, "Test Issue", "node_7", "OPEN")])
+
+        action = plan_issue(new_issue, issue_index, project_resolver, True, update=True)
+
+        assert action["action"] == "skip"
+
+    def test_plan_issue_without_projects(self, new_issue, project_resolver, capsys):
+        action = plan_issue(new_issue, IssueIndex(), project_resolver, False)
+
+        assert action["project"] is None
+        assert "Current repository isn't linked to a project." in capsys.readouterr().out
+
+    def test_estimate(self, new_issue, project_resolver):
+        issue_index = IssueIndex()
+        actions = [plan_issue(replace(new_issue, id=f"page-{i}", title=f"Issue {i}"), issue_index, project_resolver, True) for i in range(30)]
+        plan = SyncPlan("owner/repo", "db", actions)
+
+        assert plan.estimate() == {
+            "rest_calls": 30,
+            "graphql_calls": 2,
+            "total_calls": 32,
+            "rest_remaining": None,
+            "graphql_remaining": None,
+            "fits_rate_limit": True
+        }
+        assert not plan.estimate(rest_remaining=10)["fits_rate_limit"]
+        assert "doesn't fit into the remaining rate limit" in plan.create_summary(plan.estimate(rest_remaining=10))
+
+    def test_save_and_load(self, new_issue, project_resolver, tmp_path):
+        path = os.path.join(tmp_path, "plan.json")
+        plan = SyncPlan("owner/repo", "db", [plan_issue(new_issue, IssueIndex(), project_resolver, True)], "2022-05-10T17:10:00.000Z")
+        plan.save(path)
+
+        loaded = SyncPlan.load(path)
+
+        assert loaded.to_dict() == plan.to_dict()
+        assert loaded.to_dict()["actions"][0]["project"] == {"id": "proj_1", "title": "Project 1"}
+        assert loaded.creates[0]["project"] == ProjectRef("proj_1", "Project 1")
+        assert len(loaded.links) == 1
+
+    def test_load_unsupported_version(self):
+        with pytest.raises(ValueError):
+            SyncPlan.from_dict({"version": 0})
+
+    def test_skip_applied(self, new_issue, project_resolver):
+        first = plan_issue(new_issue, IssueIndex(), project_resolver, True)
+        second = plan_issue(replace(new_issue, id="page-2", title="Other Issue", project_number=None), IssueIndex(), project_resolver, True)
+        third = plan_issue(replace(new_issue, id="page-3", title="New Issue"), IssueIndex(), project_resolver, True)
+        plan = SyncPlan("owner/repo", "db", [first, second, third])
+
+        applied = IssueIndex([IssueRecord(7, "Test Issue", "node_7", "OPEN", "page-1", "hash_7"),
+                              IssueRecord(8, "Other Issue", "node_8", "OPEN", "page-2")])
+
+        assert plan.skip_applied(applied) == 2
+        # The project link of a created issue is made again, it may be missing
+        assert [action["action"] for action in plan.actions] == ["link", "skip", "create"]
+        assert (plan.actions[0]["number"], plan.actions[0]["project"]) == (7, first["project"])
+        assert (plan.actions[1]["existing_number"], plan.actions[1]["existing_page_id"]) == (8, "page-2")
@@ -0,0 +1,60 @@
+import json
+import os
+
+import pytest
+
+from utils.SyncState import SyncState
+
+
+class TestSyncState:
+    @pytest.fixture
+    def state_path(self, tmp_path):
+        return os.path.join(tmp_path, "state", "state.json")
+
+    def test_missing_file(self, state_path):
+        state = SyncState(state_path)
+        assert state.get_watermark("db") is None
+
+    def test_save_and_load_watermark(self, state_path):
+        state = SyncState(state_path)
+        state.set_watermark("db", "2022-05-10T17:10:00.000Z")
+        state.save()
+
+        with open(state_path) as state_file:
+            assert json.load(state_file)["databases"]["db"]["last_edited_time"] == "2022-05-10T17:10:00.000Z"
+        assert SyncState(state_path).get_watermark("db") == "2022-05-10T17:10:00.000Z"
+
+    def test_watermark_never_moves_backwards(self, state_path):
+        state = SyncState(state_path)
+        state.set_watermark("db", "2022-05-10T17:10:00.000Z")
+        state.set_watermark("db", "2022-05-01T00:00:00.000Z")
+        state.set_watermark("db", None)
+
+        assert state.get_watermark("db") == "2022-05-10T17:10:00.000Z"
+
+    def test_page_body(self, state_path):
+        state = SyncState(state_path)
+        state.set_page_body("page-1", "2022-05-10T17:10:00.000Z", "# Body")
+        state.save()
+
+        state = SyncState(state_path)
+        assert state.get_page_body("page-1", "2022-05-10T17:10:00.000Z") == "# Body"
+        assert state.get_page_body("page-1", "2022-05-11T08:00:00.000Z") is None
+        assert state.get_page_body("page-2", "2022-05-10T17:10:00.000Z") is None
+
+    def test_snapshot(self, state_path):
+        state = SyncState(state_path)
+        state.set_snapshot("owner/repo", "2022-05-10T17:10:00Z", [[1, "Issue 1", "node_1", "OPEN", "page-1", "hash_1"]], 100.0)
+        state.save()
+
+        snapshot = SyncState(state_path).get_snapshot("owner/repo")
+        assert snapshot == {"synced_at": "2022-05-10T17:10:00Z", "expires": 100.0, "issues": [[1, "Issue 1", "node_1", "OPEN", "page-1", "hash_1"]]}
+        assert SyncState(state_path).get_snapshot("owner/other") is None
+
+    def test_state_watermark(self, state_path):
+        state = SyncState(state_path)
+        assert state.get_state_watermark("owner/repo") is None
+        state.set_state_watermark("owner/repo", "2022-05-10T17:10:00Z")
+        state.save()
+
+        assert SyncState(state_path).get_state_watermark("owner/repo") == "2022-05-10T17:10:00Z"
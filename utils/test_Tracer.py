@@ -0,0 +1,70 @@
+import json
+import os
+
+import pytest
+
+from utils.Tracer import Tracer, get_rate_limit_headers, percentile
+
+
+class TestTracer:
+    @pytest.fixture
+    def tracer(self):
+        tracer = Tracer()
+        for latency in [0.1, 0.2, 0.3, 0.4]:
+            tracer.record("api.notion.com", "POST /databases/{id}/query", latency, 200)
+        tracer.record("api.github.com", "POST /graphql", 0.05, 200, retries=2,
+                      rate_limit={"X-RateLimit-Remaining": "4321", "X-RateLimit-Reset": "1700000000"})
+        return tracer
+
+    def test_percentile(self):
+        assert percentile([], 50) == 0.0
+        assert percentile([3, 1, 2], 50) == 2
+        assert percentile(list(range(1, 101)), 95) == 95
+
+    def test_get_rate_limit_headers(self):
+        headers = {"X-RateLimit-Remaining": "10", "Content-Type": "application/json"}
+        assert get_rate_limit_headers(headers) == {"X-RateLimit-Remaining": "10"}
+        assert get_rate_limit_headers(None) == {}
+
+    def test_endpoint_stats(self, tracer):
+        stats = tracer.get_endpoint_stats()
+
+        assert stats["POST /databases/{id}/query"] == {"count": 4, "retries": 0, "p50": 0.2, "p95": 0.4}
+        assert stats["POST /graphql"]["retries"] == 2
+        assert tracer.quota == {"api.github.com": 4321}
+
+    def test_phases(self, tracer):
+        with tracer.phase("Issue creation"):
+            pass
+        assert list(tracer.timed_iter("Notion read", [1, 2, 3])) == [1, 2, 3]
+
+        assert set(tracer.phases) == {"Issue creation", "Notion read"}
+
+    def test_create_summary(self, tracer):
+        with tracer.phase("Notion read"):
+            pass
+
+        summary = tracer.create_summary()
+
+        assert "| Notion read |" in summary
+        assert "## Requests (5 total)" in summary
+        assert "| POST /databases/{id}/query | 4 | 0 | 200 | 400 |" in summary
+        assert "| api.github.com | 4321 |" in summary
+
+    def test_export(self, tracer, tmp_path):
+        path = os.path.join(tmp_path, "trace.json")
+        tracer.export(path)
+
+        with open(path) as trace_file:
+            trace = json.load(trace_file)
+        assert len(trace["requests"]) == 5
+        assert trace["endpoints"]["POST /graphql"]["count"] == 1
+
+    def test_roll_up(self, tracer):
+        with tracer.phase("Notion read"):
+            pass
+
+        assert tracer.roll_up().startswith("5 requests, 2 retries, Notion read ")
+        assert tracer.requests == [] and tracer.phases == {}
+        assert tracer.quota == {"api.github.com": 4321}
+        assert tracer.roll_up() == "0 requests, 0 retries"
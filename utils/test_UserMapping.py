@@ -0,0 +1,31 @@
+import pytest
+
+from utils.UserMapping import UserMapping
+
+USER_ID = "8a2f3c1e-4b5d-4e6f-9a0b-1c2d3e4f5a6b"
+
+
+class TestUserMapping:
+    def test_parse(self):
+        mapping = UserMapping.parse(f"{USER_ID}: '@ada-gh'\nbob@example.com: bob-gh\n# comment\nCarol Smith: carol\n")
+
+        assert mapping.logins == {USER_ID.replace("-", ""): "ada-gh", "bob@example.com": "bob-gh", "carol smith": "carol"}
+        assert UserMapping.parse('{"Dave": "dave-gh"}').logins == {"dave": "dave-gh"}
+        assert not UserMapping.parse("")
+        with pytest.raises(ValueError, match="Use 'user: github-login'"):
+            UserMapping.parse("Dave")
+
+    def test_person(self):
+        mapping = UserMapping({USER_ID.replace("-", ""): "ada-gh", "Bob@Example.com": "bob-gh"})
+
+        assert mapping.person({"id": USER_ID, "name": "Ada"}) == "ada-gh"
+        assert mapping.person({"id": "u2", "name": "Bob", "person": {"email": "bob@example.com"}}) == "bob-gh"
+        # Unmapped users keep their name
+        assert mapping.person({"id": "u3", "name": "carol-gh"}) == "carol-gh"
+        assert mapping.person({"id": "u4", "person": {"email": "dave@example.com"}}) == "dave@example.com"
+
+    def test_resolve(self):
+        mapping = UserMapping({"Ada Lovelace": "ada-gh"})
+
+        assert mapping.resolve("ada lovelace ") == "ada-gh"
+        assert mapping.resolve("@octocat") == "octocat"
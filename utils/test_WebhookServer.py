@@ -0,0 +1,71 @@
+import hashlib
+import hmac
+import json
+import os
+
+import pytest
+import requests
+
+from utils.PageQueue import PageQueue
+from utils.WebhookServer import WebhookServer, extract_page_ids, verify_signature
+
+
+class TestWebhookServer:
+    @pytest.fixture
+    def resource_data(self):
+        results = os.path.join(os.path.dirname(__file__), "..", "resources", "results.json")
+        with open(results) as json_file:
+            return json.load(json_file)
+
+    @pytest.fixture
+    def page_queue(self, tmp_path):
+        return PageQueue(os.path.join(tmp_path, "queue.jsonl"))
+
+    @pytest.fixture
+    def server(self, page_queue):
+        server = WebhookServer(page_queue, "127.0.0.1", 0).start()
+        yield server
+        server.stop()
+
+    def test_extract_page_ids(self, resource_data):
+        event = {"type": "page.properties_updated", "entity": {"id": "page-1", "type": "page"}, "data": {"parent": {"id": "db"}}}
+        automation = {"source": {"type": "automation"}, "data": resource_data[0]}
+
+        assert extract_page_ids(event) == ["page-1"]
+        assert extract_page_ids({"type": "comment.created", "entity": {"id": "c-1", "type": "comment"}}) == []
+        assert extract_page_ids(automation) == [resource_data[0]["id"]]
+        assert extract_page_ids(resource_data) == [page["id"] for page in resource_data]
+        assert extract_page_ids("page-1") == []
+
+    def test_verify_signature(self):
+        body = b'{"entity": {}}'
+        signature = "sha256=" + hmac.new(b"secret", body, hashlib.sha256).hexdigest()
+
+        assert verify_signature("secret", body, signature)
+        assert not verify_signature("other", body, signature)
+        assert not verify_signature("secret", body, None)
+
+    def test_receive_pages(self, server, page_queue, resource_data):
+        response = requests.post(server.url, json=resource_data)
+
+        assert response.status_code == 202
+        assert response.json() == {"queued": 1}
+        assert requests.get(f"{server.url}/health").json() == {"queued": 1}
+        assert [page_id for page_id, _ in page_queue.take(10)] == ["0815"]
+
+    def test_verification_token(self, server, page_queue, capsys):
+        response = requests.post(server.url, json={"verification_token": "secret_token"})
+
+        assert response.status_code == 200
+        assert "Notion webhook verification token: secret_token" in capsys.readouterr().out
+        assert len(page_queue) == 0
+
+    def test_invalid_payloads(self, server, page_queue):
+        server.secret = "secret"
+        body = json.dumps({"entity": {"id": "page-1", "type": "page"}}).encode()
+
+        assert requests.post(server.url, data=b"not json").status_code == 400
+        assert requests.post(server.url, data=body, headers={"X-Notion-Signature": "sha256=wrong"}).status_code == 401
+        signature = "sha256=" + hmac.new(b"secret", body, hashlib.sha256).hexdigest()
+        assert requests.post(server.url, data=body, headers={"X-Notion-Signature": signature}).status_code == 202
+        assert len(page_queue) == 1